@@ -0,0 +1,210 @@
+"""
+Artist inverted index
+Maps interned artist ids to the catalog rows they appear on (CSR layout)
+"""
+
+from __future__ import annotations
+
+from itertools import chain
+from operator import methodcaller
+from typing import Iterable
+
+from lazy_import import lazy_import
+from string_table import StringTable
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+
+class ArtistIndex:
+    def __init__(self, artist_lists: Iterable[Iterable[str]]) -> None:
+        """
+        Build the index from one list of artist names per catalog row
+
+        Args:
+            artist_lists: Iterable where item i holds the artist names of row i
+
+        Layout:
+            artist_to_id: StringTable, artist name <-> int id
+            offsets:      (n_artists + 1,) array, postings of artist a are
+                          rows[offsets[a]:offsets[a + 1]]
+            rows:         (n_postings,) array of row ids, sorted per artist
+        """
+        artist_lists = artist_lists.tolist() if hasattr(artist_lists, "tolist") else list(artist_lists)
+        try:
+            counts = np.fromiter(map(len, artist_lists), dtype=np.int64, count=len(artist_lists))
+        except TypeError:
+            artist_lists = [list(artists) for artists in artist_lists]
+            counts = np.fromiter(map(len, artist_lists), dtype=np.int64, count=len(artist_lists))
+        names = np.fromiter(chain.from_iterable(artist_lists), dtype=object, count=int(counts.sum()))
+        self._intern_all(names, counts)
+
+    @classmethod
+    def from_joined(cls, values: Iterable[str], sep: str = ";", strip: bool = False) -> "ArtistIndex":
+        """
+        Build the index from one sep-joined string of artist names per row,
+        splitting every row at once instead of row by row
+
+        Args:
+            values: Item i holds the artist names of row i, e.g. "A;B"
+            sep: Separator between names
+            strip: Strip whitespace around every name
+        """
+        values = values.tolist() if hasattr(values, "tolist") else list(values)
+        index = cls.__new__(cls)
+        if not values:
+            index._intern_all(np.empty(0, dtype=object), np.empty(0, dtype=np.int64))
+            return index
+
+        counts = np.fromiter(map(methodcaller("count", sep), values), dtype=np.int64, count=len(values)) + 1
+        names = np.array(sep.join(values).split(sep), dtype=object)
+        index._intern_all(names, counts, strip)
+        return index
+
+    @classmethod
+    def from_postings(
+        cls, names: list[str] | StringTable, offsets: np.ndarray, rows: np.ndarray, n_rows: int
+    ) -> "ArtistIndex":
+        """Rebuild an index from arrays previously taken from names/offsets/rows"""
+        index = cls.__new__(cls)
+        index.artist_to_id = names if isinstance(names, StringTable) else StringTable(names)
+        index.offsets = offsets
+        index.rows = rows
+        index.n_rows = n_rows
+        return index
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], n_rows: int) -> "ArtistIndex":
+        """Rebuild an index from the arrays of to_arrays()"""
+        return cls.from_postings(
+            StringTable.from_arrays(arrays["artist_name_data"], arrays["artist_name_order"]),
+            arrays["artist_offsets"],
+            arrays["artist_rows"],
+            n_rows,
+        )
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Flat arrays for persisting the index (e.g. as catalog snapshot extras)"""
+        return {
+            "artist_name_data": self.artist_to_id.data,
+            "artist_name_order": self.artist_to_id.order,
+            "artist_offsets": self.offsets,
+            "artist_rows": self.rows,
+        }
+
+    @property
+    def names(self) -> list[str]:
+        """Artist names ordered by id"""
+        return list(self.artist_to_id)
+
+    def _intern_all(self, names: np.ndarray, counts: np.ndarray, strip: bool = False) -> None:
+        # names: every row's names in row order, counts: names per row.
+        # Ids in order of first appearance, as interning row by row would give
+        codes, uniques = pd.factorize(names)
+        if strip:
+            # Strip the distinct names only, then merge those that became equal
+            stripped = np.array([name.strip() for name in uniques.tolist()], dtype=object)
+            merged, uniques = pd.factorize(stripped)
+            codes = merged[codes]
+        self.artist_to_id = StringTable(uniques)
+        self.n_rows = len(counts)
+        self._set_postings(
+            codes.astype(np.int64, copy=False),
+            np.repeat(np.arange(len(counts), dtype=np.int64), counts),
+        )
+
+    def _set_postings(self, posting_artists: np.ndarray, posting_rows: np.ndarray) -> None:
+        # Group postings by artist; a stable sort keeps rows ascending within an artist
+        order = np.argsort(posting_artists, kind="stable")
+        counts = np.bincount(posting_artists, minlength=len(self.artist_to_id))
+
+        self.offsets = np.zeros(len(self.artist_to_id) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.rows = posting_rows[order]
+
+    def add_rows(self, artist_lists: Iterable[Iterable[str]]) -> None:
+        """Append rows n_rows, n_rows + 1, ... with the given artist names"""
+        posting_artists, posting_rows = self._postings()
+        artist_lists = list(artist_lists)
+        new_artists, new_rows = self._intern(
+            range(self.n_rows, self.n_rows + len(artist_lists)), artist_lists
+        )
+
+        self.n_rows += len(artist_lists)
+        self._set_postings(
+            np.concatenate([posting_artists, np.asarray(new_artists, dtype=np.int64)]),
+            np.concatenate([posting_rows, np.asarray(new_rows, dtype=np.int64)]),
+        )
+
+    def set_rows(self, rows: Iterable[int], artist_lists: Iterable[Iterable[str]]) -> None:
+        """Replace the artist names of existing rows"""
+        rows = np.asarray(list(rows), dtype=np.int64)
+        posting_artists, posting_rows = self._postings()
+        keep = ~np.isin(posting_rows, rows)
+
+        new_artists, new_rows = self._intern(rows.tolist(), artist_lists)
+
+        posting_artists = np.concatenate([posting_artists[keep], np.asarray(new_artists, dtype=np.int64)])
+        posting_rows = np.concatenate([posting_rows[keep], np.asarray(new_rows, dtype=np.int64)])
+        # Restore ascending rows within every artist
+        order = np.lexsort((posting_rows, posting_artists))
+        self._set_postings(posting_artists[order], posting_rows[order])
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        """Drop rows and renumber the remaining ones to stay contiguous"""
+        removed = np.zeros(self.n_rows, dtype=bool)
+        removed[np.asarray(list(rows), dtype=np.int64)] = True
+        # Old row -> new row for the rows that stay
+        new_row = np.cumsum(~removed) - 1
+
+        posting_artists, posting_rows = self._postings()
+        keep = ~removed[posting_rows]
+        self.n_rows = int((~removed).sum())
+        self._set_postings(posting_artists[keep], new_row[posting_rows[keep]])
+
+    def _intern(self, rows, artist_lists):
+        # (artist id, row) postings for new rows; unseen names get the next ids
+        new_names: dict[str, int] = {}
+        posting_artists = []
+        posting_rows = []
+        for row, artists in zip(rows, artist_lists):
+            for artist in artists:
+                artist_id = self.artist_to_id.get(artist)
+                if artist_id is None:
+                    artist_id = new_names.setdefault(artist, len(self.artist_to_id) + len(new_names))
+                posting_artists.append(artist_id)
+                posting_rows.append(row)
+
+        self.artist_to_id.append(new_names)
+        return posting_artists, posting_rows
+
+    def _postings(self) -> tuple[np.ndarray, np.ndarray]:
+        # (artist id, row) pairs, grouped by artist
+        counts = np.diff(self.offsets)
+        return np.repeat(np.arange(len(counts), dtype=np.int64), counts), np.asarray(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.artist_to_id)
+
+    def postings(self, artist: str) -> np.ndarray:
+        """Rows on which the given artist appears (empty if unknown)"""
+        artist_id = self.artist_to_id.get(artist)
+        if artist_id is None:
+            return self.rows[:0]
+        return self.rows[self.offsets[artist_id]:self.offsets[artist_id + 1]]
+
+    def rows_for(self, artists: Iterable[str]) -> np.ndarray:
+        """
+        Union of the posting lists of several artists
+
+        Args:
+            artists: Artist names, unknown names are ignored
+
+        Returns:
+            Sorted array of unique row ids
+        """
+        lists = [self.postings(artist) for artist in artists]
+
+        if not lists:
+            return self.rows[:0]
+        return np.unique(np.concatenate(lists))
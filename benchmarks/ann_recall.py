@@ -0,0 +1,101 @@
+"""
+Recall and NDCG of recommender_claude's IVF candidate index against brute force
+
+For every nprobe, the IVF candidates of each test playlist profile are
+compared with the exact cosine neighbours (recall@k), and the testset is
+scored with evaluation.recommender_metrics (NDCG@5) using the IVF index.
+
+    python -m benchmarks.ann_recall --dataset dataset.csv --testset testset.json
+    python -m benchmarks.ann_recall --n-lists 600 --nprobe 32 64 128 256
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from catalog_cache import DEFAULT_CACHE_DIR
+
+
+def playlist_profiles(recommender, testset):
+    profiles = []
+    for input_tracks, _ in testset.values():
+        rows = recommender.track_ids.find([track_id for track_id, _ in input_tracks])
+        rows = rows[rows >= 0]
+        if len(rows):
+            profiles.append(recommender.playlist_profile(rows))
+    return profiles
+
+
+def timed_candidates(recommender, profiles, k):
+    start = perf_counter()
+    candidates = [recommender.nearest_candidates(profile, k)[0] for profile in profiles]
+    return candidates, (perf_counter() - start) / len(profiles) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--testset", default="testset.json")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--n-lists", type=int, help="default sqrt(number of tracks)")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32, 64, 128])
+    parser.add_argument("--k", type=int, default=1000, help="candidates per query (recall@k)")
+    parser.add_argument("--no-ndcg", action="store_true", help="only measure recall")
+    args = parser.parse_args()
+
+    from evaluation import recommender_metrics
+    from recommender_claude import Recommender
+
+    with open(args.testset) as f:
+        testset = json.load(f)
+
+    # Recommenders and the evaluation print progress; keep stdout for the JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        recommender = Recommender(
+            args.dataset, cache_dir=args.cache_dir, candidate_index="ivf", n_lists=args.n_lists
+        )
+        index = recommender.ivf_index
+        profiles = playlist_profiles(recommender, testset)
+        k = min(args.k, len(recommender.df))
+
+        # Exact neighbours from the brute-force model
+        recommender.ivf_index = None
+        exact, exact_ms = timed_candidates(recommender, profiles, k)
+        report = {
+            "n_tracks": len(recommender.df),
+            "n_lists": index.n_lists,
+            "k": k,
+            "n_profiles": len(profiles),
+            "brute": {"latency_ms": exact_ms},
+        }
+        if not args.no_ndcg:
+            report["brute"]["NDCG@5"] = recommender_metrics(recommender, testset)["NDCG@5"]
+
+        recommender.ivf_index = index
+        report["ivf"] = []
+        for nprobe in args.nprobe:
+            recommender.nprobe = nprobe
+            approximate, latency_ms = timed_candidates(recommender, profiles, k)
+            recalls = [
+                len(np.intersect1d(found, truth)) / len(truth)
+                for found, truth in zip(approximate, exact)
+            ]
+            result = {
+                "nprobe": nprobe,
+                "recall_mean": float(np.mean(recalls)),
+                "recall_min": float(np.min(recalls)),
+                "latency_ms": latency_ms,
+            }
+            if not args.no_ndcg:
+                result["NDCG@5"] = recommender_metrics(recommender, testset)["NDCG@5"]
+            report["ivf"].append(result)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Chunked weighted distance kernels vs. the whole-matrix expressions they replace
+
+For 1k, 100k and 10M candidates, float64 and float32 features, and per-candidate
+or shared weights: time per call, peak temporary memory (tracemalloc) and a
+the largest difference between the results. 10M candidates are only run with shared
+weights, as a per-candidate weight matrix plus the whole-matrix temporaries
+would not fit in memory on small machines.
+
+Run from the repository root:
+    python -m benchmarks.bench_weighted_kernels
+    python -m benchmarks.bench_weighted_kernels --sizes 1000 100000
+"""
+
+import argparse
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+from weighted_knn import weighted_cosine_similarity, weighted_euclidean_distance
+
+N_FEATURES = 9
+
+
+def whole_matrix_euclidean(feature_matrix, target_features, weight_matrix):
+    """weighted_euclidean_distance before chunking: three (N, F) temporaries"""
+    differences = feature_matrix - target_features
+    squared_differences = differences ** 2
+    weighted_squared_differences = weight_matrix * squared_differences
+    return np.sqrt(np.sum(weighted_squared_differences, axis=1))
+
+
+def whole_matrix_cosine(feature_matrix, target_features, weight_matrix):
+    """weighted_cosine_similarity before chunking: per-candidate weighted targets"""
+    weighted_features = weight_matrix * feature_matrix
+    weighted_target = weight_matrix * target_features
+    dot_products = np.sum(weighted_features * weighted_target, axis=1)
+    feature_norms = np.linalg.norm(weighted_features, axis=1)
+    target_norms = np.linalg.norm(weighted_target, axis=1)
+    norms_product = feature_norms * target_norms
+    norms_product = np.where(norms_product == 0, 1e-10, norms_product)
+    return dot_products / norms_product
+
+
+def measure(kernel, args, repeat):
+    """(result, best ms per call, peak temporary MB of one call)"""
+    result = kernel(*args)
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        kernel(*args)
+        best = min(best, perf_counter() - start)
+
+    tracemalloc.start()
+    kernel(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best * 1e3, peak / (1 << 20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 10_000_000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'kernel':>9} {'candidates':>10} {'dtype':>7} {'weights':>9} "
+          f"{'before ms':>10} {'after ms':>9} {'before MB':>10} {'after MB':>9} {'max diff':>9}")
+    for n_candidates in args.sizes:
+        repeat = max(3, min(200, 10_000_000 // n_candidates))
+        for dtype in (np.float64, np.float32):
+            feature_matrix = rng.random((n_candidates, N_FEATURES)).astype(dtype)
+            target = rng.random(N_FEATURES).astype(dtype)
+            weights = (rng.random(N_FEATURES) * 2).astype(dtype)
+
+            cases = [("shared", weights.reshape(1, -1), weights)]
+            if n_candidates <= 1_000_000:
+                weight_matrix = np.tile(weights, (n_candidates, 1))
+                cases.insert(0, ("per-row", weight_matrix, weight_matrix))
+
+            for label, before_weights, after_weights in cases:
+                for name, before, after in [
+                    ("euclidean", whole_matrix_euclidean, weighted_euclidean_distance),
+                    ("cosine", whole_matrix_cosine, weighted_cosine_similarity),
+                ]:
+                    expected, before_ms, before_mb = measure(
+                        before, (feature_matrix, target, before_weights), repeat
+                    )
+                    actual, after_ms, after_mb = measure(
+                        after, (feature_matrix, target, after_weights), repeat
+                    )
+                    print(
+                        f"{name:>9} {n_candidates:>10} {np.dtype(dtype).name:>7} {label:>9} "
+                        f"{before_ms:>10.3f} {after_ms:>9.3f} {before_mb:>10.1f} {after_mb:>9.1f} "
+                        f"{np.max(np.abs(expected - actual), initial=0):>9.1e}"
+                    )
+                    del expected, actual
+
+
+if __name__ == "__main__":
+    main()
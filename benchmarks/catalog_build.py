@@ -0,0 +1,120 @@
+"""
+Catalog build time: per-row interning and encoding vs. the vectorized steps
+
+For every catalog size:
+    - artist interning, as the recommenders did it row by row (a dict of
+      names and a Python list of postings) vs. ArtistIndex on the split lists
+      (recommender.py) and ArtistIndex.from_joined on the raw column
+      (recommender_claude.py, names stripped)
+    - track id encoding for StringTable, value by value vs. one cast
+    - the full build of both recommenders from the CSV (no snapshot), step by
+      step, with the independent steps run in order (1 worker) and on a
+      thread pool
+Times are the best of --repeat runs, in milliseconds.
+
+    python -m benchmarks.catalog_build
+    python -m benchmarks.catalog_build --sizes 100000 1000000 --workers 4
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+import recommender
+import recommender_claude
+from artist_index import ArtistIndex
+from benchmarks.memory_report import prepare_catalog
+from string_table import _encode
+
+TARGETS = {"recommender": recommender, "recommender_claude": recommender_claude}
+
+
+def old_intern(artist_lists):
+    artist_to_id = {}
+    posting_artists = []
+    posting_rows = []
+    for row, artists in enumerate(artist_lists):
+        for artist in artists:
+            posting_artists.append(artist_to_id.setdefault(artist, len(artist_to_id)))
+            posting_rows.append(row)
+    return artist_to_id, np.asarray(posting_artists, dtype=np.int64), np.asarray(posting_rows, dtype=np.int64)
+
+
+def old_encode(values):
+    return np.array([value.encode() for value in values], dtype=bytes)
+
+
+def best_ms(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best * 1e3
+
+
+def measure_steps(dataset_path, repeat):
+    tracks = pd.read_csv(dataset_path)
+    lists = recommender.Recommender._clean_tracks(tracks)["artists"]
+    joined = recommender_claude.Recommender._clean_tracks(tracks)["artists"].astype(str)
+    track_ids = tracks["track_id"]
+    return {
+        "intern_lists_old_ms": best_ms(lambda: old_intern(lists), repeat),
+        "intern_lists_ms": best_ms(lambda: ArtistIndex(lists), repeat),
+        "intern_joined_old_ms": best_ms(
+            lambda: old_intern(recommender_claude.Recommender._artist_lists(joined)), repeat
+        ),
+        "intern_joined_ms": best_ms(lambda: ArtistIndex.from_joined(joined, strip=True), repeat),
+        "encode_old_ms": best_ms(lambda: old_encode(track_ids), repeat),
+        "encode_ms": best_ms(lambda: _encode(track_ids), repeat),
+    }
+
+
+def measure_build(module, dataset_path, n_workers, repeat):
+    """Step timings of the fastest of repeat builds"""
+    best = None
+    for _ in range(repeat):
+        # The recommenders report progress on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            timings = module.Recommender(dataset_path, cache_dir=None, build_workers=n_workers).build_timings
+        gc.collect()
+        if best is None or timings["total"] < best["total"]:
+            best = timings
+    return {name: seconds * 1e3 for name, seconds in best.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--workers", type=int, default=4, help="threads of the pooled builds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    report = []
+    for n_tracks in args.sizes:
+        dataset_path = os.path.join(prepare_catalog(args.data_dir, n_tracks, 1), "dataset.csv")
+        builds = {
+            f"{target}_{n_workers}_workers_ms": measure_build(module, dataset_path, n_workers, args.repeat)
+            for target, module in TARGETS.items()
+            for n_workers in sorted({1, args.workers})
+        }
+        report.append({
+            "n_tracks": n_tracks,
+            "cpu_count": os.cpu_count(),
+            **measure_steps(dataset_path, args.repeat),
+            **builds,
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Fallback and cold-start latency: DataFrame scans vs. precomputed FallbackTiers
+
+For every catalog size, requests whose target artist has no tracks are answered
+the old ways and from the fallback tables:
+    - sample: recommender.py's former fallback, an isin over the artists column
+      and df.sample over the whole frame
+    - nlargest: recommender_claude.py's former cold start, df.nlargest by popularity
+    - tiers: FallbackTiers.recommend by popularity (artist, genres of the
+      input tracks, catalog), and seeded sampling of the same tiers
+Reported: mean time per request, time to build the tables and their size.
+
+    python -m benchmarks.fallback_tiers
+    python -m benchmarks.fallback_tiers --sizes 100000 1000000 --requests 2000
+"""
+
+import argparse
+import json
+import os
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.memory_report import prepare_catalog
+from recommender import Recommender
+
+
+def old_sample(df, n, target_artist):
+    artist_songs = df[df["artists"].isin(target_artist)]
+    if len(artist_songs) >= n:
+        return artist_songs.sample(n)["track_id"].tolist()
+    return df.sample(n)["track_id"].tolist()
+
+
+def old_nlargest(df, n, target_artist):
+    return df.nlargest(n, "popularity")["track_id"].tolist()
+
+
+def mean_us(request, inputs):
+    start = perf_counter()
+    for args in inputs:
+        request(*args)
+    return (perf_counter() - start) / len(inputs) * 1e6
+
+
+def measure(recommender, n_requests, n_inputs, n_recommendations):
+    rng = np.random.default_rng(0)
+    df = recommender.df
+    tiers = recommender.fallback_tiers
+    lookup = recommender.track_ids.lookup
+    # Playlists of random known tracks, target artists without tracks
+    playlists = [np.sort(rng.choice(len(df), n_inputs, replace=False)) for _ in range(n_requests)]
+    artists = {"No Such Artist"}
+
+    def tiers_request(rows, seed):
+        return lookup(tiers.recommend(
+            n_recommendations, artists=artists, genres=tiers.genre_codes[rows], exclude=rows, seed=seed
+        ))
+
+    start = perf_counter()
+    recommender._fallback_tiers(df, recommender.artist_index)
+    build_s = perf_counter() - start
+
+    return {
+        # The DataFrame paths are slow: a tenth of the requests
+        "sample_us": mean_us(lambda: old_sample(df, n_recommendations, artists), [()] * max(1, n_requests // 10)),
+        "nlargest_us": mean_us(lambda: old_nlargest(df, n_recommendations, artists), [()] * max(1, n_requests // 10)),
+        "tiers_us": mean_us(tiers_request, [(rows, None) for rows in playlists]),
+        "tiers_seeded_us": mean_us(tiers_request, [(rows, i) for i, rows in enumerate(playlists)]),
+        "tiers_cold_start_us": mean_us(tiers_request, [(playlists[0][:0], None)] * n_requests),
+        "build_s": build_s,
+        "tables_mb": sum(array.nbytes for array in tiers.to_arrays().values()) / (1 << 20),
+        "same_as_nlargest": old_nlargest(df, n_recommendations, artists)
+        == lookup(tiers.recommend(n_recommendations)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--inputs", type=int, default=10, help="input tracks per request")
+    parser.add_argument("--n-recommendations", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    report = []
+    for n_tracks in args.sizes:
+        catalog_dir = prepare_catalog(args.data_dir, n_tracks, 1)
+        recommender = Recommender(
+            os.path.join(catalog_dir, "dataset.csv"), cache_dir=os.path.join(catalog_dir, ".catalog_cache")
+        )
+        report.append({
+            "n_tracks": n_tracks,
+            **measure(recommender, args.requests, args.inputs, args.n_recommendations),
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Speed and memory of BaselineRecommender's hybrid similarity against the dense path
+
+For every catalog the full-catalog cosine scores of each test playlist profile
+are computed both ways: sklearn over every column of X_scaled ('dense') and
+hybrid_features ('hybrid'). Reported per path: bytes of the representation,
+time and peak temporary allocation per profile, the largest score difference,
+and the end-to-end get_recommendations latency with a check that both paths
+recommend the same tracks.
+
+    python -m benchmarks.hybrid_similarity
+    python -m benchmarks.hybrid_similarity --dataset dataset.csv --testset testset.json --sizes 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from benchmarks.memory_report import prepare_catalog
+from evaluation import SCORE_BLOCK_ROWS, BaselineRecommender, load_data
+
+
+def dense_scores(X, profile):
+    return np.concatenate([
+        cosine_similarity(profile[None], X[start:start + SCORE_BLOCK_ROWS])[0]
+        for start in range(0, len(X), SCORE_BLOCK_ROWS)
+    ])
+
+
+def hybrid_scores(hybrid, profile):
+    return np.concatenate([
+        hybrid.cosine_similarity(profile, start, start + SCORE_BLOCK_ROWS)
+        for start in range(0, len(hybrid), SCORE_BLOCK_ROWS)
+    ])
+
+
+def timed_scores(score, profiles):
+    """Scores of every profile, ms per profile and the peak temporary MB of one call"""
+    start = perf_counter()
+    scores = [score(profile) for profile in profiles]
+    elapsed_ms = (perf_counter() - start) / len(profiles) * 1e3
+
+    tracemalloc.start()
+    score(profiles[0])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return scores, elapsed_ms, peak / (1 << 20)
+
+
+def timed_recommendations(recommender, testset, n_recommendations):
+    recommendations = []
+    start = perf_counter()
+    for input_tracks, target_tracks in testset.values():
+        np.random.seed(0)
+        recommendations.append(recommender.get_recommendations(
+            [track_id for track_id, _ in input_tracks], n_recommendations,
+            {artist for _, artist in target_tracks},
+        ))
+    return recommendations, (perf_counter() - start) / len(testset) * 1e3
+
+
+def measure(dataset_path, testset_path, cache_dir, n_recommendations):
+    df_clean, X_scaled, testset = load_data(dataset_path, testset_path, cache_dir)
+    X_scaled = np.ascontiguousarray(X_scaled)
+
+    dense = BaselineRecommender(df_clean, X_scaled, similarity='dense')
+    start = perf_counter()
+    hybrid = BaselineRecommender(df_clean, X_scaled, similarity='hybrid')
+    build_s = perf_counter() - start
+
+    profiles = []
+    for input_tracks, _ in testset.values():
+        rows = [dense.track_id_to_idx[track_id] for track_id, _ in input_tracks
+                if track_id in dense.track_id_to_idx]
+        if rows:
+            profiles.append(X_scaled[rows].mean(axis=0))
+
+    dense_result = timed_scores(lambda profile: dense_scores(X_scaled, profile), profiles)
+    hybrid_result = timed_scores(lambda profile: hybrid_scores(hybrid.hybrid, profile), profiles)
+    max_difference = max(np.abs(d - h).max() for d, h in zip(dense_result[0], hybrid_result[0]))
+
+    dense_recommendations, dense_ms = timed_recommendations(dense, testset, n_recommendations)
+    hybrid_recommendations, hybrid_ms = timed_recommendations(hybrid, testset, n_recommendations)
+
+    layout = hybrid.hybrid
+    return {
+        "dataset": dataset_path,
+        "shape": list(X_scaled.shape),
+        "dense_columns": len(layout.dense_columns),
+        "binary_columns": len(layout.binary_columns),
+        "active_per_row": layout.columns.size / max(len(layout), 1),
+        "hybrid_build_s": build_s,
+        "dense": {
+            "representation_mb": X_scaled.nbytes / (1 << 20),
+            "scores_ms": dense_result[1],
+            "scores_peak_temp_mb": dense_result[2],
+            "recommend_ms": dense_ms,
+        },
+        "hybrid": {
+            "representation_mb": layout.nbytes / (1 << 20),
+            "scores_ms": hybrid_result[1],
+            "scores_peak_temp_mb": hybrid_result[2],
+            "recommend_ms": hybrid_ms,
+        },
+        "max_score_difference": float(max_difference),
+        "same_recommendations": dense_recommendations == hybrid_recommendations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="also measure an existing dataset.csv")
+    parser.add_argument("--testset", default="testset.json", help="test set of --dataset")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=50, help="playlists per synthetic catalog")
+    parser.add_argument("--n-recommendations", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    report = []
+    if args.dataset:
+        print(f"  {args.dataset}...", file=sys.stderr)
+        report.append(measure(args.dataset, args.testset, None, args.n_recommendations))
+    for n_tracks in args.sizes:
+        catalog_dir = prepare_catalog(args.data_dir, n_tracks, args.queries)
+        print(f"  {catalog_dir}...", file=sys.stderr)
+        report.append(measure(
+            os.path.join(catalog_dir, "dataset.csv"),
+            os.path.join(catalog_dir, f"testset-{args.queries}.json"),
+            os.path.join(catalog_dir, ".catalog_cache"),
+            args.n_recommendations,
+        ))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Peak memory of evaluation.build_features: this tree vs. a baseline git revision
+
+Each build runs in a fresh interpreter (a git worktree for the baseline) on
+the same synthetic catalogs. The child reports its resident memory after the
+imports and its peak after the build; their difference is the pipeline's own
+peak. The feature matrices of both builds are compared by hash.
+
+    python -m benchmarks.ingest_memory --baseline <rev>
+    python -m benchmarks.ingest_memory --baseline <rev> --sizes 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.memory_report import REPO_DIR, prepare_catalog
+
+_CHILD = """
+import hashlib, json, sys
+from time import perf_counter
+sys.path.insert(0, {tree!r})
+
+def memory_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+
+import numpy as np
+from evaluation import build_features
+before = memory_mb("VmRSS")
+start = perf_counter()
+df_clean, arrays = build_features({dataset_path!r})
+elapsed = perf_counter() - start
+X = arrays["X_scaled"]
+print(json.dumps({{
+    "build_s": elapsed,
+    "rss_after_imports_mb": before,
+    "peak_rss_mb": memory_mb("VmHWM"),
+    "pipeline_peak_mb": memory_mb("VmHWM") - before,
+    "x_scaled_mb": X.nbytes / (1 << 20),
+    "shape": list(X.shape),
+    "x_scaled_sha256": hashlib.sha256(np.ascontiguousarray(X).tobytes()).hexdigest(),
+}}))
+"""
+
+
+def run_build(tree, dataset_path, timeout):
+    code = _CHILD.format(tree=tree, dataset_path=dataset_path)
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-c", code], cwd=tree, capture_output=True, text=True, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        return {"error": f"timeout after {timeout}s"}
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", required=True, help="git revision to compare against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dataset", help="also measure an existing dataset.csv")
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds per build")
+    args = parser.parse_args()
+
+    datasets = [(n_tracks, os.path.join(prepare_catalog(args.data_dir, n_tracks, 1), "dataset.csv"))
+                for n_tracks in args.sizes]
+    if args.dataset:
+        datasets.insert(0, (None, os.path.abspath(args.dataset)))
+
+    report = {"baseline": args.baseline, "results": []}
+    with tempfile.TemporaryDirectory() as worktree:
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, args.baseline],
+            cwd=REPO_DIR, check=True, capture_output=True,
+        )
+        try:
+            for n_tracks, dataset_path in datasets:
+                print(f"  {dataset_path}...", file=sys.stderr)
+                baseline = run_build(worktree, dataset_path, args.timeout)
+                current = run_build(REPO_DIR, dataset_path, args.timeout)
+                report["results"].append({
+                    "dataset": dataset_path,
+                    "n_rows": n_tracks,
+                    "baseline": baseline,
+                    "current": current,
+                    "x_scaled_identical": baseline.get("x_scaled_sha256") == current.get("x_scaled_sha256"),
+                })
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree], cwd=REPO_DIR, capture_output=True
+            )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
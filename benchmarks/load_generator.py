@@ -0,0 +1,116 @@
+"""
+Replay testset.json playlists against a running server.py
+
+Each of --concurrency clients keeps one keep-alive connection and sends
+requests back to back. Client-side latency percentiles, throughput and
+status counts are printed as JSON together with the server's /metrics.
+
+    python server.py --port 8000 &
+    python -m benchmarks.load_generator --port 8000 --requests 2000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+from itertools import cycle
+from time import perf_counter
+
+import numpy as np
+
+
+async def _request(reader, writer, host, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = (
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    response = await reader.readexactly(length)
+    return status, json.loads(response)
+
+
+async def _client(host, port, queries, n_recommendations, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for input_track_ids, target_artists in queries:
+            start = perf_counter()
+            status, _ = await _request(reader, writer, host, "POST", "/recommend", {
+                "track_ids": input_track_ids,
+                "n_recommendations": n_recommendations,
+                "target_artists": target_artists,
+            })
+            latencies.append(perf_counter() - start)
+            statuses[status] += 1
+    finally:
+        writer.close()
+
+
+async def run(args):
+    with open(args.testset) as f:
+        testset = json.load(f)
+    playlists = cycle([
+        ([track[0] for track in inputs], sorted({track[1] for track in targets}))
+        for inputs, targets in testset.values()
+    ])
+    queries = [next(playlists) for _ in range(args.requests)]
+    # Round-robin the request list over the clients
+    per_client = [queries[i::args.concurrency] for i in range(args.concurrency)]
+
+    latencies, statuses = [], Counter()
+    start = perf_counter()
+    await asyncio.gather(*(
+        _client(args.host, args.port, client_queries, args.n_recommendations, latencies, statuses)
+        for client_queries in per_client if client_queries
+    ))
+    elapsed = perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, server_metrics = await _request(reader, writer, args.host, "GET", "/metrics")
+    writer.close()
+
+    latencies_ms = np.array(latencies) * 1e3
+    return {
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "max": float(latencies_ms.max()),
+        },
+        "server": server_metrics,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay testset playlists against server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--testset", default="testset.json")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--n-recommendations", type=int, default=5)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
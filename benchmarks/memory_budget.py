@@ -0,0 +1,62 @@
+"""
+Memory budget gate: profile the evaluation pipeline and fail over a peak-RSS budget
+
+Runs evaluation.EvaluationSession on one recommender under a MemoryProfile:
+load (and preprocess when the evaluation snapshot is built), the recommender
+build, the baseline index, and the query loops. Prints the per-phase report
+with the top allocation sites; exits with status 1 when a phase's peak RSS
+went over --budget-mb, so it can run as a pre-deploy check.
+
+    python -m benchmarks.memory_budget --budget-mb 1500
+    python -m benchmarks.memory_budget --target recommender_claude --budget-mb 2000 --output memory.json
+"""
+
+import argparse
+import sys
+
+from catalog_cache import DEFAULT_CACHE_DIR
+from evaluation import EvaluationSession
+from memory_profile import MemoryBudgetExceeded, MemoryProfile
+
+TARGETS = ["recommender", "recommender_claude"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=TARGETS, default="recommender")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--testset", default="testset.json")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="'none' to rebuild every snapshot")
+    parser.add_argument("--budget-mb", type=float, help="largest allowed peak RSS of any phase")
+    parser.add_argument("--top-sites", type=int, default=10, help="allocation sites reported per phase")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+    cache_dir = None if args.cache_dir == "none" else args.cache_dir
+
+    profile = MemoryProfile(budget_mb=args.budget_mb, top_sites=args.top_sites)
+    exceeded = None
+    try:
+        session = EvaluationSession(
+            args.dataset, args.testset, cache_dir, n_workers=args.workers, memory_profile=profile
+        )
+        with profile.phase(f"build: {args.target}"):
+            module = __import__(args.target)
+            recommender = module.Recommender(args.dataset, cache_dir=cache_dir)
+            if hasattr(recommender, "warm_up"):
+                recommender.warm_up()
+        metrics = session.evaluate({args.target: recommender})
+        print(metrics, file=sys.stderr)
+    except MemoryBudgetExceeded as error:
+        exceeded = error
+
+    if args.output:
+        profile.dump(args.output)
+    if exceeded is not None:
+        print(f"FAILED: {exceeded}", file=sys.stderr)
+        sys.exit(1)
+    print(profile.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Memory report: peak RSS of the recommenders at two git revisions
+
+Each target runs through `benchmarks.suite --run-target` in a fresh
+interpreter, once in a git worktree of the baseline revision and once in this
+tree, on the same synthetic catalogs. Both initialize from a catalog snapshot
+(the first run writes it). For this tree the resident catalog is also broken
+down by component.
+
+    python -m benchmarks.memory_report --baseline <rev>
+    python -m benchmarks.memory_report --baseline <rev> --sizes 89000 10000000 --targets recommender
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ["recommender", "recommender_claude"]
+
+
+def prepare_catalog(data_dir, n_tracks, n_playlists):
+    """ensure_catalog in a child: Linux children inherit the parent's ru_maxrss"""
+    code = (
+        "from benchmarks.synthetic import ensure_catalog; "
+        f"print(ensure_catalog({data_dir!r}, {n_tracks!r}, {n_playlists!r}))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    return os.path.join(REPO_DIR, completed.stdout.strip().splitlines()[-1])
+
+
+def run_target(tree, target, catalog_dir, testset_path, timeout):
+    command = [
+        sys.executable, "-m", "benchmarks.suite", "--run-target", target,
+        "--catalog", catalog_dir, "--testset", testset_path, "--snapshot",
+    ]
+    # First run writes the snapshot; measure the second one
+    for _ in range(2):
+        try:
+            completed = subprocess.run(
+                command, cwd=tree, capture_output=True, text=True, timeout=timeout
+            )
+        except subprocess.TimeoutExpired:
+            return {"error": f"timeout after {timeout}s"}
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {
+        "peak_rss_mb": result["peak_rss_mb"],
+        "catalog_rss_mb": result["peak_rss_mb"] - result["peak_rss_before_init_mb"],
+        "init_s": result["init_s"],
+        "latency_p50_ms": result["latency_ms"]["p50"],
+    }
+
+
+def component_sizes(target, catalog_dir):
+    """Bytes held by each part of a loaded recommender of this tree"""
+    import numpy as np
+
+    from string_table import StringTable
+
+    def size_of(value):
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, StringTable):
+            return value.data.nbytes + value.order.nbytes
+        if hasattr(value, "to_arrays"):
+            return sum(array.nbytes for array in value.to_arrays().values())
+        if hasattr(value, "memory_usage"):
+            return int(value.memory_usage(deep=True).sum())
+        return 0
+
+    module = __import__(target)
+    recommender = module.Recommender(
+        os.path.join(catalog_dir, "dataset.csv"),
+        cache_dir=os.path.join(catalog_dir, ".catalog_cache"),
+    )
+    components = {}
+    for name in ["feature_matrix", "raw_features", "track_ids", "artist_index", "genre_codes", "ivf_index"]:
+        if name in vars(recommender) and getattr(recommender, name) is not None:
+            components[name] = size_of(getattr(recommender, name))
+    # Loaded on demand by recommender.Recommender; report it separately
+    components["df (metadata)"] = size_of(recommender.df)
+    return {name: size / (1 << 20) for name, size in components.items()}
+
+
+def run_components(target, catalog_dir, timeout):
+    command = [
+        sys.executable, "-m", "benchmarks.memory_report",
+        "--components-of", target, "--catalog", catalog_dir,
+    ]
+    completed = subprocess.run(
+        command, cwd=REPO_DIR, capture_output=True, text=True, timeout=timeout
+    )
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", help="git revision to compare against")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[89_000, 10_000_000])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--queries", type=int, default=50, help="playlists per target")
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds per run")
+    parser.add_argument("--components-of", help=argparse.SUPPRESS)
+    parser.add_argument("--catalog", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.components_of:
+        with contextlib.redirect_stdout(sys.stderr):
+            components = component_sizes(args.components_of, args.catalog)
+        print(json.dumps(components))
+        return
+    if not args.baseline:
+        parser.error("--baseline is required")
+
+    report = {"baseline": args.baseline, "results": []}
+    with tempfile.TemporaryDirectory() as worktree:
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", worktree, args.baseline],
+            cwd=REPO_DIR, check=True, capture_output=True,
+        )
+        try:
+            for n_tracks in args.sizes:
+                print(f"Preparing catalog with {n_tracks} tracks...", file=sys.stderr)
+                catalog_dir = prepare_catalog(args.data_dir, n_tracks, args.queries)
+                testset_path = os.path.join(catalog_dir, f"testset-{args.queries}.json")
+
+                for target in args.targets:
+                    print(f"  {target}...", file=sys.stderr)
+                    report["results"].append({
+                        "target": target,
+                        "n_tracks": n_tracks,
+                        "baseline": run_target(worktree, target, catalog_dir, testset_path, args.timeout),
+                        "current": run_target(REPO_DIR, target, catalog_dir, testset_path, args.timeout),
+                        "components_mb": run_components(target, catalog_dir, args.timeout),
+                    })
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", worktree], cwd=REPO_DIR, capture_output=True
+            )
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Per-track cost of a growing listening session: stateless calls vs. PlaylistSession
+
+Each session starts empty and grows one track at a time up to --length tracks;
+after every append the next recommendations are requested. The stateless path
+calls Recommender.get_recommendations with the whole playlist, the session path
+PlaylistSession.append + get_recommendations. Reported per playlist length: mean
+time of the profile alone and of the whole step, and whether both paths gave
+the same recommendations at every step.
+
+    python -m benchmarks.playlist_session
+    python -m benchmarks.playlist_session --sizes 1000000 --length 1000
+"""
+
+import argparse
+import json
+import os
+import random
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.memory_report import prepare_catalog
+from playlist_session import PlaylistSession
+from recommender import Recommender
+
+CHECKPOINTS = [10, 100, 1000, 10_000]
+
+
+def measure(recommender, playlists, artist_sets, length, n_recommendations):
+    checkpoints = [n for n in CHECKPOINTS if n <= length]
+    # playlist length -> [stateless profile s, session profile s, stateless step s, session step s]
+    totals = {n: [0.0] * 4 for n in checkpoints}
+    same = True
+
+    for track_ids, artists in zip(playlists, artist_sets):
+        session = PlaylistSession(recommender)
+        for i, track_id in enumerate(track_ids[:length], 1):
+            playlist = track_ids[:i]
+
+            np.random.seed(0)
+            start = perf_counter()
+            expected = recommender.get_recommendations(playlist, n_recommendations, artists)
+            stateless_step = perf_counter() - start
+
+            np.random.seed(0)
+            start = perf_counter()
+            session.append(track_id)
+            actual = session.get_recommendations(n_recommendations, artists)
+            session_step = perf_counter() - start
+            same &= expected == actual
+
+            if i in totals:
+                start = perf_counter()
+                recommender._playlist_profile(recommender._input_rows(playlist))
+                stateless_profile = perf_counter() - start
+                start = perf_counter()
+                session.profile()
+                session_profile = perf_counter() - start
+                for j, value in enumerate([stateless_profile, session_profile, stateless_step, session_step]):
+                    totals[i][j] += value
+
+    return {
+        "same_recommendations": same,
+        "by_length": {
+            n: {
+                name: value / len(playlists) * 1e3
+                for name, value in zip(
+                    ["stateless_profile_ms", "session_profile_ms", "stateless_step_ms", "session_step_ms"],
+                    values,
+                )
+            }
+            for n, values in totals.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--length", type=int, default=1000, help="tracks per session")
+    parser.add_argument("--n-recommendations", type=int, default=5)
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    report = []
+    rng = random.Random(0)
+    for n_tracks in args.sizes:
+        catalog_dir = prepare_catalog(args.data_dir, n_tracks, args.sessions)
+        recommender = Recommender(
+            os.path.join(catalog_dir, "dataset.csv"), cache_dir=os.path.join(catalog_dir, ".catalog_cache")
+        )
+        with open(os.path.join(catalog_dir, f"testset-{args.sessions}.json")) as f:
+            testset = list(json.load(f).values())
+
+        all_track_ids = recommender.track_ids.lookup(np.arange(len(recommender.track_ids)))
+        playlists = [rng.sample(all_track_ids, args.length) for _ in testset]
+        artist_sets = [{artist for _, artist in target_tracks} for _, target_tracks in testset]
+        report.append({
+            "n_tracks": n_tracks,
+            "sessions": len(playlists),
+            **measure(recommender, playlists, artist_sets, args.length, args.n_recommendations),
+        })
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
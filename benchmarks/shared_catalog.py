@@ -0,0 +1,164 @@
+"""
+Host memory of several recommender workers: private catalogs vs. one shared catalog
+
+Starts --workers fresh interpreters at once per mode and, while all of them
+are alive after their queries, sums their proportional set size (PSS: each
+shared page is split between the processes mapping it), which is what the
+host actually pays. Modes:
+
+    csv       every worker builds its catalog from the CSV (cache_dir=None)
+    snapshot  every worker hashes the CSV and maps its own catalog_cache snapshot
+    shared    every worker attaches to the catalog published by one builder
+
+The shared mode then publishes a second catalog version (the CSV without its
+last 1% of tracks) and checks that every worker switches to it.
+
+    python -m benchmarks.shared_catalog --workers 4 --sizes 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from benchmarks.memory_report import REPO_DIR, prepare_catalog
+
+MODES = ["csv", "snapshot", "shared"]
+
+_WORKER = """
+import json, sys
+from time import perf_counter
+sys.path.insert(0, {repo!r})
+from recommender import Recommender
+
+start = perf_counter()
+if {mode!r} == "shared":
+    recommender = Recommender(shared_catalog_dir={catalog!r})
+else:
+    recommender = Recommender({dataset!r}, cache_dir={cache_dir!r})
+init_s = perf_counter() - start
+
+with open({testset!r}) as f:
+    playlists = list(json.load(f).values())
+for input_tracks, target_tracks in playlists:
+    recommender.get_recommendations(
+        [track for track, _ in input_tracks], 5, {{artist for _, artist in target_tracks}}
+    )
+print(json.dumps({{"init_s": init_s}}), flush=True)
+
+# Each further line on stdin: poll the shared catalog, then report its size
+recommender.catalog_poll_s = 0
+for _ in sys.stdin:
+    input_tracks, target_tracks = playlists[0]
+    recommender.get_recommendations(
+        [track for track, _ in input_tracks], 5, {{artist for _, artist in target_tracks}}
+    )
+    print(json.dumps({{"version": recommender._catalog_version, "n_tracks": len(recommender.track_ids)}}), flush=True)
+"""
+
+
+def memory_mb(pid):
+    """(RSS, PSS) of a process in MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            field, _, rest = line.partition(":")
+            if field in ("Rss", "Pss"):
+                values[field] = int(rest.split()[0]) / 1024
+    return values["Rss"], values["Pss"]
+
+
+def run_workers(mode, n_workers, dataset_path, testset_path, catalog_dir, cache_dir, swap_dataset=None):
+    code = _WORKER.format(
+        repo=REPO_DIR, mode=mode, catalog=catalog_dir, dataset=dataset_path,
+        cache_dir=cache_dir, testset=testset_path,
+    )
+    workers = [
+        subprocess.Popen([sys.executable, "-c", code], cwd=REPO_DIR, text=True,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        for _ in range(n_workers)
+    ]
+    try:
+        init_s = [json.loads(worker.stdout.readline())["init_s"] for worker in workers]
+        memory = [memory_mb(worker.pid) for worker in workers]
+        result = {
+            "init_s_max": max(init_s),
+            "rss_mb_total": sum(rss for rss, _ in memory),
+            "pss_mb_total": sum(pss for _, pss in memory),
+            "pss_mb_per_worker": sum(pss for _, pss in memory) / n_workers,
+        }
+
+        if swap_dataset is not None:
+            from recommender import Recommender
+
+            start = perf_counter()
+            version = Recommender.publish_catalog(catalog_dir, swap_dataset)
+            result["publish_s"] = perf_counter() - start
+            states = []
+            for worker in workers:
+                worker.stdin.write("\n")
+                worker.stdin.flush()
+                states.append(json.loads(worker.stdout.readline()))
+            result["swap"] = {
+                "version": version,
+                "workers_switched": sum(state["version"] == version for state in states),
+                "n_tracks": sorted({state["n_tracks"] for state in states}),
+            }
+        return result
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--queries", type=int, default=30, help="playlists per worker")
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    from recommender import Recommender
+
+    report = {"workers": args.workers, "results": []}
+    for n_tracks in args.sizes:
+        catalog = prepare_catalog(args.data_dir, n_tracks, args.queries)
+        dataset_path = os.path.join(catalog, "dataset.csv")
+        testset_path = os.path.join(catalog, f"testset-{args.queries}.json")
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            cache_dir = os.path.join(work_dir, "cache")
+            shared_dir = os.path.join(work_dir, "shared")
+            # A second catalog version: the CSV without its last 1% of tracks
+            swap_dataset = os.path.join(work_dir, "dataset-v2.csv")
+            tracks = pd.read_csv(dataset_path)
+            track_ids = tracks["track_id"].unique()
+            dropped = track_ids[len(track_ids) - len(track_ids) // 100:]
+            tracks[~tracks["track_id"].isin(dropped)].to_csv(swap_dataset, index=False)
+            del tracks
+
+            # Built once up front, so the workers measure attaching only
+            Recommender(dataset_path, cache_dir=cache_dir, lazy=True).warm_up()
+            Recommender.publish_catalog(shared_dir, dataset_path)
+
+            for mode in args.modes:
+                print(f"  {n_tracks} tracks, {mode}...", file=sys.stderr)
+                result = run_workers(
+                    mode, args.workers, dataset_path, testset_path, shared_dir,
+                    cache_dir if mode == "snapshot" else None,
+                    swap_dataset if mode == "shared" else None,
+                )
+                report["results"].append({"n_tracks": n_tracks, "mode": mode, **result})
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Cold-start benchmark: import time and time to first recommendation
+
+Each measurement runs in a fresh interpreter whose working directory holds
+dataset.csv, mirroring `python main.py`. Phases are timed inside the child;
+the parent adds the wall time including interpreter startup.
+
+    python -m benchmarks.startup --dataset dataset.csv --repeat 5
+    python -m benchmarks.startup --tracks 100000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from benchmarks.synthetic import ensure_catalog
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The query main.py sends
+MAIN_TRACK_IDS = [
+    "5SuOikwiRyPMVoIQDJUgSV", "4nmjL1mUKOAfAbo9QG9tSE", "12qmPGMrOCogibc7qyxT9s",
+    "3dPpQeLTWjCjEbSevDMQfW", "2pcuXnZhTirLXsfXGVFTv2", "4qPNDBW1i3p13qLCt0Ki3A",
+    "1pG5nd6gmfbMwUfT5shDQe", "7bhHLZxkRekrNPPkEdDTbn", "14BMBNRzv24eG6OKoIgPfP",
+    "0Pi3Ua6fJV1Yx5MGXhfybT",
+]
+MAIN_TARGET_ARTISTS = ["Jason Mraz"]
+
+_CHILD = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+sys.path.insert(0, {repo!r})
+from recommender import Recommender
+imported = perf_counter()
+recommender = Recommender("dataset.csv", cache_dir={cache_dir!r}, lazy={lazy!r})
+constructed = perf_counter()
+recommender.get_recommendations({track_ids!r}, 5, set({artists!r}))
+first = perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "init_s": constructed - imported,
+    "first_recommendation_s": first - constructed,
+}}))
+"""
+
+# Modules whose import dominated the old cold start
+HEAVY_MODULES = ["numpy", "pandas", "sklearn"]
+
+
+def run_once(workdir, cache_dir, lazy):
+    code = _CHILD.format(
+        repo=REPO_DIR, cache_dir=cache_dir, lazy=lazy,
+        track_ids=MAIN_TRACK_IDS, artists=MAIN_TARGET_ARTISTS,
+    )
+    start = perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, capture_output=True, text=True, check=True
+    )
+    wall = perf_counter() - start
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def import_footprint():
+    """Which heavy modules are really executed by `import recommender`"""
+    code = (
+        f"import sys; sys.path.insert(0, {REPO_DIR!r}); import recommender, json; "
+        "import importlib.util as u; "
+        f"print(json.dumps({{m: m in sys.modules and not isinstance(sys.modules[m], u._LazyModule) "
+        f"for m in {HEAVY_MODULES!r}}}))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return json.loads(completed.stdout)
+
+
+def summarize(runs):
+    summary = {}
+    for key in runs[0]:
+        values = sorted(run[key] for run in runs)
+        summary[key] = {"min": values[0], "median": values[len(values) // 2]}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="existing dataset.csv (default: a synthetic catalog)")
+    parser.add_argument("--tracks", type=int, default=100_000, help="synthetic catalog size")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join("benchmarks", "data"))
+    args = parser.parse_args()
+
+    if args.dataset:
+        workdir = os.path.dirname(os.path.abspath(args.dataset))
+    else:
+        workdir = os.path.abspath(ensure_catalog(args.data_dir, args.tracks, 1, 0))
+
+    report = {"workdir": workdir, "imported_by_recommender": import_footprint(), "modes": {}}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        modes = {
+            "eager_no_snapshot": (None, False),
+            "lazy_no_snapshot": (None, True),
+            "eager_snapshot": (cache_dir, False),
+            "lazy_snapshot": (cache_dir, True),
+        }
+        # Write the snapshot before the snapshot modes are timed
+        run_once(workdir, cache_dir, True)
+        for mode, (mode_cache_dir, lazy) in modes.items():
+            print(f"  {mode}...", file=sys.stderr)
+            runs = [run_once(workdir, mode_cache_dir, lazy) for _ in range(args.repeat)]
+            report["modes"][mode] = summarize(runs)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
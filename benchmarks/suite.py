@@ -0,0 +1,267 @@
+"""
+Benchmark suite over synthetic catalogs
+
+For every catalog size and target, a fresh subprocess measures init time,
+per-query latency percentiles, throughput and peak RSS. Results are written
+as JSON so runs can be compared.
+
+Run from the repository root:
+    python -m benchmarks.suite --sizes 10000 100000 --output bench.json
+    python -m benchmarks.suite --sizes 1000000 10000000 --targets recommender weighted_knn
+"""
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime, timezone
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.synthetic import ensure_catalog
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_DATA_DIR = os.path.join("benchmarks", "data")
+WARMUP_QUERIES = 3
+
+# Columns and weights used for the standalone weighted_knn targets
+KNN_FEATURES = ["danceability", "energy", "valence", "acousticness", "instrumentalness"]
+KNN_WEIGHTS = [1.5, 1.5, 1.2, 1.0, 0.8]
+
+
+def setup_recommender(dataset_path, testset_path, cache_dir):
+    from recommender import Recommender
+
+    return Recommender(dataset_path, cache_dir=cache_dir).get_recommendations
+
+
+def setup_recommender_claude(dataset_path, testset_path, cache_dir):
+    from recommender_claude import Recommender
+
+    return Recommender(dataset_path, cache_dir=cache_dir).get_recommendations
+
+
+def setup_baseline(dataset_path, testset_path, cache_dir):
+    from evaluation import BaselineRecommender, load_data
+
+    df_clean, X_scaled, _ = load_data(dataset_path, testset_path, cache_dir=cache_dir)
+    return BaselineRecommender(df_clean, X_scaled).get_recommendations
+
+
+def _setup_weighted_knn(dataset_path, knn):
+    import pandas as pd
+
+    df = pd.read_csv(dataset_path, usecols=["track_id"] + KNN_FEATURES)
+    df = df.drop_duplicates(subset=["track_id"]).reset_index(drop=True)
+    weight_columns = [f"{column}_weight" for column in KNN_FEATURES]
+    for column, weight in zip(weight_columns, KNN_WEIGHTS):
+        df[column] = weight
+
+    track_id_to_idx = {track_id: idx for idx, track_id in enumerate(df["track_id"])}
+    features = df[KNN_FEATURES].to_numpy()
+    track_ids = df["track_id"].to_numpy()
+
+    def get_recommendations(input_track_ids, n_recommendations, target_artist):
+        rows = [track_id_to_idx[t] for t in input_track_ids if t in track_id_to_idx]
+        target = features[rows].mean(axis=0)
+        indices = knn(df, KNN_FEATURES, weight_columns, n_recommendations, target)
+        return track_ids[indices].tolist()
+
+    return get_recommendations
+
+
+def setup_weighted_knn(dataset_path, testset_path, cache_dir):
+    from weighted_knn import weighted_knn
+
+    return _setup_weighted_knn(dataset_path, weighted_knn)
+
+
+def setup_weighted_knn_cosine(dataset_path, testset_path, cache_dir):
+    from weighted_knn import weighted_knn_cosine
+
+    return _setup_weighted_knn(dataset_path, weighted_knn_cosine)
+
+
+# Modules imported before the init timer starts
+TARGET_MODULES = {
+    "recommender": ["recommender"],
+    "recommender_claude": ["recommender_claude"],
+    "baseline": ["evaluation"],
+    "weighted_knn": ["weighted_knn", "pandas"],
+    "weighted_knn_cosine": ["weighted_knn", "pandas"],
+}
+
+TARGETS = {
+    "recommender": setup_recommender,
+    "recommender_claude": setup_recommender_claude,
+    "baseline": setup_baseline,
+    "weighted_knn": setup_weighted_knn,
+    "weighted_knn_cosine": setup_weighted_knn_cosine,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process"""
+    # Linux: ru_maxrss survives exec, so a child would report the parent's
+    # peak (e.g. after it generated a large catalog); VmHWM starts afresh
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / (1 << 10)
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run_target(target, catalog_dir, testset_path, n_recommendations, snapshot):
+    """Measure one target in this process; returns a result dict"""
+    with open(testset_path) as f:
+        testset = json.load(f)
+    queries = [
+        ([track[0] for track in inputs], {track[1] for track in targets})
+        for inputs, targets in testset.values()
+    ]
+
+    dataset_path = os.path.join(catalog_dir, "dataset.csv")
+    # Without --snapshot every init parses and preprocesses the CSV
+    cache_dir = os.path.join(catalog_dir, ".catalog_cache") if snapshot else None
+
+    start = perf_counter()
+    for module in TARGET_MODULES[target]:
+        importlib.import_module(module)
+    import_s = perf_counter() - start
+
+    rss_before = peak_rss_mb()
+    start = perf_counter()
+    get_recommendations = TARGETS[target](dataset_path, testset_path, cache_dir)
+    init_s = perf_counter() - start
+
+    for input_track_ids, target_artists in queries[:WARMUP_QUERIES]:
+        get_recommendations(input_track_ids, n_recommendations, target_artists)
+
+    latencies = []
+    start = perf_counter()
+    for input_track_ids, target_artists in queries:
+        query_start = perf_counter()
+        get_recommendations(input_track_ids, n_recommendations, target_artists)
+        latencies.append(perf_counter() - query_start)
+    total_s = perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1e3
+    return {
+        "import_s": import_s,
+        "init_s": init_s,
+        "n_queries": len(latencies),
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "max": float(latencies_ms.max()),
+        },
+        "throughput_qps": len(latencies) / total_s,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_before_init_mb": rss_before,
+    }
+
+
+def run_isolated(target, catalog_dir, testset_path, args):
+    """Run a target in a fresh interpreter so peak RSS is per target"""
+    command = [
+        sys.executable, "-m", "benchmarks.suite", "--run-target", target,
+        "--catalog", catalog_dir, "--testset", testset_path,
+        "--n-recommendations", str(args.n_recommendations),
+    ]
+    if args.snapshot:
+        command.append("--snapshot")
+
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=args.timeout)
+    except subprocess.TimeoutExpired:
+        return {"error": f"timeout after {args.timeout}s"}
+
+    if completed.returncode != 0:
+        lines = completed.stderr.strip().splitlines()
+        return {"error": lines[-1] if lines else f"exit code {completed.returncode}"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--queries", type=int, default=100, help="playlists per target")
+    parser.add_argument("--n-recommendations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--snapshot", action="store_true",
+                        help="initialize from a catalog snapshot instead of the CSV")
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds per target")
+    parser.add_argument("--output", help="JSON output path (default: stdout)")
+    parser.add_argument("--run-target", help=argparse.SUPPRESS)
+    parser.add_argument("--catalog", help=argparse.SUPPRESS)
+    parser.add_argument("--testset", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_target:
+        # Recommenders print progress; keep stdout for the JSON result
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_target(
+                args.run_target, args.catalog, args.testset, args.n_recommendations, args.snapshot
+            )
+        print(json.dumps(result))
+        return
+
+    report = {"machine": machine_info(), "config": vars(args), "results": []}
+    for n_tracks in args.sizes:
+        print(f"Preparing catalog with {n_tracks} tracks...", file=sys.stderr)
+        catalog_dir = ensure_catalog(args.data_dir, n_tracks, args.queries, args.seed)
+        testset_path = os.path.join(catalog_dir, f"testset-{args.queries}.json")
+
+        for target in args.targets:
+            print(f"  {target}...", file=sys.stderr)
+            if args.snapshot:
+                # First run writes the snapshot; measure the second one
+                run_isolated(target, catalog_dir, testset_path, args)
+            result = run_isolated(target, catalog_dir, testset_path, args)
+            report["results"].append({"target": target, "n_tracks": n_tracks, **result})
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
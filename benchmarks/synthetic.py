@@ -0,0 +1,147 @@
+"""
+Synthetic catalogs and playlists with the same schema as dataset.csv and testset.json
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+N_GENRES = 114
+# Fraction of tracks listed a second time under another genre, as in dataset.csv
+DUPLICATE_FRACTION = 0.1
+CHUNK_ROWS = 1_000_000
+
+_ID_ALPHABET = np.array(list("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"))
+
+
+def make_catalog(n_tracks: int, path: str, seed: int = 0) -> None:
+    """
+    Write a dataset.csv-shaped catalog of n_tracks unique tracks
+
+    Rows are generated and written in chunks so 10M-track catalogs fit in memory.
+    About 10% of the tracks get an extra row under a different genre.
+
+    Args:
+        n_tracks: Number of unique track IDs
+        path: Output CSV path
+        seed: Random seed; the same seed gives the same catalog
+    """
+    rng = np.random.default_rng(seed)
+    n_artists = max(10, n_tracks // 8)
+    artist_names = np.array([f"Artist {i}" for i in range(n_artists)], dtype=object)
+    genres = np.array([f"genre-{i}" for i in range(N_GENRES)], dtype=object)
+
+    row_offset = 0
+    with open(path, "w", newline="") as f:
+        for start in range(0, n_tracks, CHUNK_ROWS):
+            chunk = _make_chunk(rng, start, min(CHUNK_ROWS, n_tracks - start), artist_names, genres)
+            chunk.index = np.arange(row_offset, row_offset + len(chunk))
+            chunk.to_csv(f, header=start == 0)
+            row_offset += len(chunk)
+
+
+def _make_chunk(rng, start, n, artist_names, genres) -> pd.DataFrame:
+    track_ids = _ID_ALPHABET[rng.integers(0, len(_ID_ALPHABET), (n, 22))]
+    track_ids = track_ids.view("<U22").ravel()
+
+    # Genres are contiguous blocks of artists, so playlists can stay on-genre
+    genre = rng.integers(0, len(genres), n)
+    artists_per_genre = max(1, len(artist_names) // len(genres))
+    first_artist = genre * artists_per_genre + rng.integers(0, artists_per_genre, n)
+    first_artist %= len(artist_names)
+    second_artist = rng.integers(0, len(artist_names), n)
+    featuring = rng.random(n) < 0.2
+    artists = pd.Series(artist_names[first_artist]) + np.where(
+        featuring, ";" + artist_names[second_artist], ""
+    )
+
+    df = pd.DataFrame({
+        "track_id": track_ids,
+        "artists": artists.to_numpy(),
+        "album_name": [f"Album {i // 12}" for i in range(start, start + n)],
+        "track_name": [f"Track {i}" for i in range(start, start + n)],
+        "popularity": rng.integers(0, 101, n),
+        "duration_ms": rng.integers(30_000, 600_000, n),
+        "explicit": rng.random(n) < 0.08,
+        "danceability": rng.beta(5, 3, n),
+        "energy": rng.beta(4, 2, n),
+        "key": rng.integers(0, 12, n),
+        "loudness": -np.abs(rng.normal(8, 5, n)),
+        "mode": rng.integers(0, 2, n),
+        "speechiness": rng.beta(1, 10, n),
+        "acousticness": rng.beta(1, 2, n),
+        "instrumentalness": rng.beta(0.3, 2, n),
+        "liveness": rng.beta(2, 8, n),
+        "valence": rng.beta(2, 2, n),
+        "tempo": rng.normal(120, 30, n).clip(30, 240),
+        "time_signature": rng.choice([3, 4, 5, 1], n, p=[0.08, 0.89, 0.02, 0.01]),
+        "track_genre": genres[genre],
+    })
+
+    duplicates = df.sample(frac=DUPLICATE_FRACTION, random_state=int(rng.integers(1 << 31)))
+    duplicates = duplicates.assign(track_genre=genres[rng.integers(0, len(genres), len(duplicates))])
+    return pd.concat([df, duplicates], ignore_index=True)
+
+
+def make_playlists(
+    dataset_path: str,
+    n_playlists: int,
+    seed: int = 0,
+    n_inputs: tuple[int, int] = (10, 60),
+    n_targets: int = 5,
+) -> dict:
+    """
+    Build a testset.json-shaped dict of on-genre playlists from a catalog
+
+    Args:
+        dataset_path: Catalog CSV written by make_catalog
+        n_playlists: Number of playlists
+        seed: Random seed
+        n_inputs: (min, max) number of input tracks per playlist
+        n_targets: Number of held-out target tracks per playlist
+
+    Returns:
+        Dict of playlist_name -> [input_tracks, target_tracks], tracks as [track_id, artists]
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(dataset_path, usecols=["track_id", "artists", "track_genre"])
+    df = df.drop_duplicates(subset=["track_id"])
+    by_genre = df.groupby("track_genre").indices
+
+    genres = list(by_genre)
+    track_ids = df["track_id"].to_numpy()
+    artists = df["artists"].to_numpy()
+
+    testset = {}
+    for i in range(n_playlists):
+        rows = by_genre[genres[rng.integers(len(genres))]]
+        n_input = int(rng.integers(n_inputs[0], n_inputs[1] + 1))
+        picked = rng.choice(rows, size=min(len(rows), n_input + n_targets), replace=False)
+        tracks = [[str(track_ids[row]), str(artists[row])] for row in picked]
+        testset[f"playlist {i}"] = [tracks[n_targets:], tracks[:n_targets]]
+
+    return testset
+
+
+def ensure_catalog(data_dir: str, n_tracks: int, n_playlists: int, seed: int = 0) -> str:
+    """
+    Create (once) a directory with dataset.csv and testset.json for a catalog size
+
+    Returns:
+        Path of the catalog directory
+    """
+    path = os.path.join(data_dir, f"catalog-{n_tracks}-seed{seed}")
+    dataset_path = os.path.join(path, "dataset.csv")
+    testset_path = os.path.join(path, f"testset-{n_playlists}.json")
+
+    os.makedirs(path, exist_ok=True)
+    if not os.path.exists(dataset_path):
+        make_catalog(n_tracks, dataset_path + ".tmp", seed)
+        os.replace(dataset_path + ".tmp", dataset_path)
+    if not os.path.exists(testset_path):
+        with open(testset_path, "w") as f:
+            json.dump(make_playlists(dataset_path, n_playlists, seed), f)
+
+    return path
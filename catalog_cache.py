@@ -0,0 +1,258 @@
+"""
+Persistent preprocessed catalog snapshots
+Skips CSV parsing and rescaling when dataset.csv and the preprocessing config are unchanged
+
+A snapshot is a directory holding one .npy file per DataFrame column plus any
+extra arrays (feature matrices, artist postings, ...). Numeric arrays are
+loaded memory-mapped, string columns are stored as integer codes plus a
+separator-joined UTF-8 blob of the unique values.
+
+    .catalog_cache/
+        recommender-3f9c1e0a7b2d4c65/
+            meta.json
+            column_0.npy  codes_1.npy  uniques_1.npy  ...
+            extra_feature_matrix.npy  ...
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+from lazy_import import lazy_import
+
+# Deferred like numpy/pandas: only a snapshot build or load needs them
+hashlib = lazy_import("hashlib")
+json = lazy_import("json")
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+shutil = lazy_import("shutil")
+
+# Bump when the on-disk layout changes
+SNAPSHOT_FORMAT = 1
+
+DEFAULT_CACHE_DIR = ".catalog_cache"
+
+# Joins string values inside a blob; must not occur in the data
+_SEPARATOR = "\x1f"
+# Joins the items of a list-of-strings cell (e.g. the split artists column)
+_LIST_SEPARATOR = ";"
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_key(csv_path: str, config: dict) -> str:
+    """Key identifying a snapshot: CSV content + preprocessing config + format"""
+    payload = json.dumps(
+        {"format": SNAPSHOT_FORMAT, "csv": file_digest(csv_path), "config": config},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def load_or_build(
+    name: str,
+    csv_path: str,
+    config: dict,
+    build: Callable[[], tuple[pd.DataFrame, dict[str, np.ndarray]]],
+    cache_dir: str = DEFAULT_CACHE_DIR,
+) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    """
+    Load a snapshot, building and saving it first if missing or stale
+
+    Args:
+        name: Snapshot family (one per preprocessing pipeline)
+        csv_path: Source CSV; its content hash is part of the key
+        config: JSON-serializable preprocessing parameters; part of the key
+        build: Callable returning (DataFrame, extra arrays) from scratch
+        cache_dir: Directory holding snapshots
+
+    Returns:
+        (DataFrame, extra arrays); numeric extra arrays are read-only memmaps
+    """
+    return load_snapshot(ensure_snapshot(name, csv_path, config, build, cache_dir))
+
+
+def ensure_snapshot(
+    name: str,
+    csv_path: str,
+    config: dict,
+    build: Callable[[], tuple[pd.DataFrame, dict[str, np.ndarray]]],
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    remove_stale: bool = True,
+) -> str:
+    """
+    Like load_or_build, but only return the snapshot path (see load_arrays/load_frame)
+
+    remove_stale=False keeps the older snapshots of the family (see shared_catalog).
+    Otherwise only snapshots of the same CSV path and config are removed: those
+    of other datasets or configs may still be in use by other instances.
+    """
+    path = os.path.join(cache_dir, f"{name}-{snapshot_key(csv_path, config)}")
+
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        df, arrays = build()
+        source = {"csv": os.path.abspath(csv_path), "config": config}
+        save_snapshot(path, df, arrays, source)
+        if remove_stale:
+            _remove_stale(cache_dir, name, keep=path, source=source)
+
+    return path
+
+
+def save_snapshot(
+    path: str, df: pd.DataFrame, arrays: dict[str, np.ndarray], source: dict | None = None
+) -> None:
+    """
+    Write a snapshot directory atomically (build in a temp dir, then rename)
+
+    source: JSON-serializable description of what the snapshot was built from,
+            stored in meta.json (ensure_snapshot: CSV path and config)
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = []
+    for i, column in enumerate(df.columns):
+        columns.append(_save_column(tmp_path, i, column, df[column]))
+
+    np.save(os.path.join(tmp_path, "index.npy"), df.index.to_numpy())
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"extra_{key}.npy"), np.ascontiguousarray(array))
+
+    meta = {"format": SNAPSHOT_FORMAT, "columns": columns, "extras": list(arrays), "source": source}
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process published the same snapshot first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_snapshot(path: str) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    """Read a snapshot directory written by save_snapshot"""
+    return load_frame(path), load_arrays(path)
+
+
+def load_frame(path: str, categorical: bool = False) -> pd.DataFrame:
+    """
+    Read only the DataFrame of a snapshot
+
+    Args:
+        path: Snapshot directory
+        categorical: Return string columns with repeated values (genre, album, ...)
+                     as pandas Categoricals: int codes instead of one pointer per row
+    """
+    meta = _read_meta(path)
+    data = {}
+    for column in meta["columns"]:
+        data[column["name"]] = _load_column(path, column, categorical)
+
+    index = np.load(os.path.join(path, "index.npy"))
+    return pd.DataFrame(data, index=index)
+
+
+def load_arrays(path: str) -> dict[str, np.ndarray]:
+    """Read only the extra arrays of a snapshot, as read-only memmaps"""
+    return {
+        key: np.load(os.path.join(path, f"extra_{key}.npy"), mmap_mode="r")
+        for key in _read_meta(path)["extras"]
+    }
+
+
+def _read_meta(path: str) -> dict:
+    with open(os.path.join(path, "meta.json")) as f:
+        return json.load(f)
+
+
+def encode_strings(values) -> np.ndarray:
+    """Join strings into a single UTF-8 uint8 array"""
+    values = list(values)
+    if any(_SEPARATOR in value for value in values):
+        raise ValueError("String values must not contain the snapshot separator")
+    return np.frombuffer(_SEPARATOR.join(values).encode(), dtype=np.uint8)
+
+
+def decode_strings(blob: np.ndarray, count: int) -> list[str]:
+    """Inverse of encode_strings"""
+    if count == 0:
+        return []
+    return bytes(blob).decode().split(_SEPARATOR)
+
+
+def _save_column(path: str, i: int, name: str, series: pd.Series) -> dict:
+    values = series.to_numpy()
+
+    if values.dtype != object and not isinstance(series.dtype, pd.StringDtype):
+        np.save(os.path.join(path, f"column_{i}.npy"), values)
+        return {"name": name, "kind": "array", "file": f"column_{i}.npy"}
+
+    kind = "strings"
+    if len(values) and isinstance(values[0], list):
+        kind = "string_lists"
+        values = np.array(
+            [_LIST_SEPARATOR.join(items) for items in values], dtype=object
+        )
+
+    # Missing values get code -1
+    codes, uniques = pd.factorize(values)
+    np.save(os.path.join(path, f"codes_{i}.npy"), codes.astype(np.int32))
+    np.save(os.path.join(path, f"uniques_{i}.npy"), encode_strings(uniques))
+    return {
+        "name": name,
+        "kind": kind,
+        "file": f"codes_{i}.npy",
+        "uniques": f"uniques_{i}.npy",
+        "n_uniques": len(uniques),
+    }
+
+
+def _load_column(path: str, column: dict, categorical: bool = False):
+    if column["kind"] == "array":
+        return np.load(os.path.join(path, column["file"]))
+
+    codes = np.load(os.path.join(path, column["file"]))
+    uniques = decode_strings(
+        np.load(os.path.join(path, column["uniques"])), column["n_uniques"]
+    )
+    # Worth it only when values repeat; unique columns (track_id) stay objects
+    if categorical and column["kind"] == "strings" and 2 * len(uniques) <= len(codes):
+        return pd.Categorical.from_codes(codes, uniques)
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    if column["kind"] == "string_lists":
+        # Item by item: a slice assignment would broadcast equal-length lists
+        for i, value in enumerate(uniques):
+            lookup[i] = value.split(_LIST_SEPARATOR)
+    else:
+        lookup[:-1] = uniques
+    lookup[-1] = np.nan
+    # Code -1 (missing) picks the trailing NaN
+    return lookup[codes]
+
+
+def _remove_stale(cache_dir: str, name: str, keep: str, source: dict) -> None:
+    """Delete older snapshots of the same family, CSV path and config (an earlier CSV content)"""
+    # As read back from meta.json
+    source = json.loads(json.dumps(source))
+    for entry in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, entry)
+        if not entry.startswith(f"{name}-") or entry_path == keep or ".tmp-" in entry:
+            continue
+        try:
+            # Snapshots written before sources were recorded have none and are kept
+            stale = _read_meta(entry_path).get("source") == source
+        except (OSError, ValueError):
+            # No readable meta.json: not a snapshot
+            stale = False
+        if stale:
+            shutil.rmtree(entry_path, ignore_errors=True)
@@ -0,0 +1,302 @@
+"""
+Chunked, bounded-memory ingest of dataset.csv for evaluation.build_features
+
+The CSV is read CHUNK_ROWS rows at a time. A row repeating an earlier row on
+DEDUP_COLUMNS is dropped on the fly, the others are merged per track_id into
+growing per-track arrays, like the one-hot + groupby('track_id') of the
+in-memory version:
+
+    first values: NUMERIC_COLUMNS and STRING_COLUMNS keep the first
+                  non-missing value of the track; the time signature is the
+                  one of the track's first row
+    genres:       (n_tracks, n_words) uint64 bitsets, bit g is set when any
+                  row of the track has genre g
+
+The wide one-hot frame never exists: the feature matrix is written once, in
+track_id order, and standardized in place with the mean and variance
+StandardScaler computes, bit for bit.
+"""
+
+from __future__ import annotations
+
+from lazy_import import lazy_import
+from string_table import StringTable
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+
+# CSV rows per chunk
+CHUNK_ROWS = 1 << 16
+
+# A row equal to an earlier one on these is dropped (different track_id, genre or album)
+DEDUP_COLUMNS = [
+    'explicit', 'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
+    'artists', 'track_name', 'time_signature'
+]
+
+# Numeric columns in feature matrix order; the genre and time signature one-hots follow
+NUMERIC_COLUMNS = [
+    'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness',
+    'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
+    'explicit'
+]
+STRING_COLUMNS = ['artists', 'album_name', 'track_name']
+
+# Columns of the merged frame between the genre and the time signature one-hots
+MERGED_COLUMNS = [
+    'track_id', 'explicit', 'danceability', 'energy', 'key', 'loudness', 'mode',
+    'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
+    'artists', 'album_name', 'track_name'
+]
+
+
+def ingest_csv(dataset_path: str, chunk_rows: int = CHUNK_ROWS) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Build df_clean and the standardized feature matrix from the CSV in chunks
+
+    Args:
+        dataset_path: Path to the tracks CSV
+        chunk_rows: CSV rows read at a time
+
+    Returns:
+        (df_clean, X_scaled), equal to the in-memory one-hot/groupby/StandardScaler version
+    """
+    tracks = _TrackAccumulator()
+    # Read text columns as strings in every chunk, as a full read infers them
+    chunks = pd.read_csv(
+        dataset_path, index_col=0, chunksize=chunk_rows,
+        dtype={column: str for column in ['track_id', 'track_genre'] + STRING_COLUMNS},
+    )
+    for chunk in chunks:
+        tracks.add(chunk)
+
+    return tracks.finish()
+
+
+def standardize(X: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Standardize the columns of X in place; same values as StandardScaler().fit_transform(X)
+
+    StandardScaler gets the column-major matrix DataFrame.values returns, so
+    its column sums are pairwise sums over contiguous columns. Working one
+    column at a time reproduces its mean and corrected two-pass variance
+    exactly, with one column of temporary memory instead of two copies of X.
+
+    Args:
+        X: (n_samples, n_features) column-major float64 matrix
+
+    Returns:
+        (mean, scale)
+    """
+    n_samples, n_features = X.shape
+    mean = np.zeros(n_features)
+    scale = np.ones(n_features)
+    eps = np.finfo(np.float64).eps
+
+    for j in range(n_features):
+        if n_samples == 0:
+            break
+        column = X[:, j]
+        mean[j] = column.sum() / n_samples
+        centered = column - mean[j]
+        var = (np.sum(centered ** 2) - np.sum(centered) ** 2 / n_samples) / n_samples
+
+        # Near-constant columns keep scale 1, as in StandardScaler
+        if var > n_samples * eps * var + (n_samples * mean[j] * eps) ** 2:
+            scale[j] = np.sqrt(var)
+        np.divide(centered, scale[j], out=column)
+
+    return mean, scale
+
+
+class _TrackAccumulator:
+    """Per-track state of the rows ingested so far"""
+
+    def __init__(self):
+        self.track_ids = StringTable()
+        self.n_tracks = 0
+        # First non-missing values; NaN until one is seen
+        self.numeric = np.empty((0, len(NUMERIC_COLUMNS)))
+        self.strings = np.empty((0, len(STRING_COLUMNS)), dtype=object)
+        # Time signature of each track's first row
+        self.time_signature = np.empty(0)
+        self.genre_bits = np.zeros((0, 1), dtype=np.uint64)
+
+        # Genres and time signatures of all kept rows, by first appearance
+        self.genre_ids: dict[str, int] = {}
+        self.time_signatures: set[float] = set()
+        # 64-bit hashes of the DEDUP_COLUMNS of kept rows
+        self.seen_rows: set[int] = set()
+        # dtype kinds a full read_csv would infer: int only if every chunk is int
+        self.kinds = {column: set() for column in NUMERIC_COLUMNS + ['time_signature']}
+        self.string_dtype = None
+
+    def add(self, chunk):
+        for column in self.kinds:
+            self.kinds[column].add(chunk[column].dtype.kind)
+        self.string_dtype = chunk['track_id'].dtype
+
+        chunk = self._drop_duplicates(chunk)
+        if len(chunk) == 0:
+            return
+
+        # Vocabularies of the one-hot columns include rows without a track_id
+        for genre in chunk['track_genre'].dropna().unique():
+            self.genre_ids.setdefault(genre, len(self.genre_ids))
+        self.time_signatures.update(chunk['time_signature'].dropna().astype(np.float64).tolist())
+
+        # groupby drops rows without a track_id
+        chunk = chunk[chunk['track_id'].notna()]
+        slots = self._slots(chunk)
+
+        numeric = np.column_stack([
+            chunk[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in NUMERIC_COLUMNS
+        ])
+        for j in range(len(NUMERIC_COLUMNS)):
+            self._fill_first(self.numeric[:, j], slots, numeric[:, j], ~np.isnan(numeric[:, j]))
+        for j, column in enumerate(STRING_COLUMNS):
+            values = chunk[column].to_numpy(dtype=object, na_value=np.nan)
+            self._fill_first(self.strings[:, j], slots, values, chunk[column].notna().to_numpy(), missing=pd.isna)
+
+        self._add_genres(slots, chunk['track_genre'])
+
+    def _drop_duplicates(self, chunk):
+        # Numbers are hashed as float64: int and float chunks of a column compare equal
+        key = chunk[DEDUP_COLUMNS].copy()
+        for column in DEDUP_COLUMNS:
+            if column not in ('artists', 'track_name'):
+                key[column] = key[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        # A 64-bit collision between distinct rows is negligible at catalog sizes
+        hashes = pd.util.hash_pandas_object(key, index=False).to_numpy()
+
+        keep = np.zeros(len(hashes), dtype=bool)
+        seen = self.seen_rows
+        for i, row_hash in enumerate(hashes.tolist()):
+            if row_hash not in seen:
+                seen.add(row_hash)
+                keep[i] = True
+        return chunk[keep]
+
+    def _slots(self, chunk):
+        """Track slot of every row; unseen track_ids get new slots in order of appearance"""
+        track_ids = chunk['track_id'].to_numpy(dtype=object)
+        slots = self.track_ids.find(track_ids)
+        new = np.flatnonzero(slots < 0)
+        if len(new) == 0:
+            return slots
+
+        new_ids = pd.unique(track_ids[new])
+        slots[new] = self.n_tracks + pd.Index(new_ids).get_indexer(track_ids[new])
+        self.track_ids.append(new_ids)
+        self._grow(self.n_tracks + len(new_ids))
+
+        # A new track's first row in this chunk is its first row overall
+        new_slots, first = np.unique(slots[new], return_index=True)
+        self.time_signature[new_slots] = (
+            chunk['time_signature'].to_numpy(dtype=np.float64, na_value=np.nan)[new[first]]
+        )
+        return slots
+
+    def _grow(self, n_tracks):
+        capacity = len(self.numeric)
+        if n_tracks > capacity:
+            capacity = max(n_tracks, 2 * capacity)
+            extra = capacity - len(self.numeric)
+            self.numeric = np.concatenate([self.numeric, np.full((extra, len(NUMERIC_COLUMNS)), np.nan)])
+            strings = np.empty((extra, len(STRING_COLUMNS)), dtype=object)
+            strings[:] = np.nan
+            self.strings = np.concatenate([self.strings, strings])
+            self.time_signature = np.concatenate([self.time_signature, np.full(extra, np.nan)])
+            self.genre_bits = np.concatenate(
+                [self.genre_bits, np.zeros((extra, self.genre_bits.shape[1]), dtype=np.uint64)]
+            )
+        self.n_tracks = n_tracks
+
+    @staticmethod
+    def _fill_first(target, slots, values, present, missing=np.isnan):
+        """Set target[slot] to the first present value of the slot's rows, unless already set"""
+        rows = np.flatnonzero(present)
+        first_slots, first = np.unique(slots[rows], return_index=True)
+        rows = rows[first]
+        unset = missing(target[first_slots])
+        target[first_slots[unset]] = values[rows[unset]]
+
+    def _add_genres(self, slots, genres):
+        present = genres.notna().to_numpy()
+        genre_ids = np.fromiter(
+            (self.genre_ids[genre] for genre in genres[present]), dtype=np.int64, count=int(present.sum())
+        )
+        slots = slots[present]
+
+        n_words = (len(self.genre_ids) + 63) // 64
+        if n_words > self.genre_bits.shape[1]:
+            extra = np.zeros((len(self.genre_bits), n_words - self.genre_bits.shape[1]), dtype=np.uint64)
+            self.genre_bits = np.concatenate([self.genre_bits, extra], axis=1)
+
+        bits = np.left_shift(np.uint64(1), (genre_ids % 64).astype(np.uint64))
+        for word in range(n_words):
+            in_word = genre_ids // 64 == word
+            np.bitwise_or.at(self.genre_bits[:, word], slots[in_word], bits[in_word])
+
+    def finish(self):
+        """Assemble df_clean and the standardized feature matrix"""
+        self.seen_rows.clear()
+
+        # groupby sorts by track_id; byte order of UTF-8 is code point order
+        order = self.track_ids.order
+        # dropna over the feature columns; only the numeric ones can be missing
+        kept = ~np.isnan(self.numeric[:self.n_tracks]).any(axis=1)[order]
+        rows = order[kept]
+
+        genres = sorted(self.genre_ids)
+        time_signatures = sorted(self.time_signatures)
+        df_clean = self._frame(rows, kept, genres, time_signatures)
+        # df_clean holds the values from here on
+        self.numeric = self.strings = self.time_signature = self.genre_bits = None
+
+        # Column-major like df_clean[feature_columns].values, filled column by column
+        feature_columns = (
+            NUMERIC_COLUMNS
+            + [f'genre_{genre}' for genre in genres]
+            + [column for column in df_clean.columns if column.startswith('time_signature_')]
+        )
+        X = np.empty((len(df_clean), len(feature_columns)), order='F')
+        for j, column in enumerate(feature_columns):
+            X[:, j] = df_clean[column].to_numpy(dtype=np.float64)
+        standardize(X)
+
+        return df_clean, X
+
+    def _genre_flag(self, rows, genre_id):
+        word = self.genre_bits[rows, genre_id // 64]
+        return (word >> np.uint64(genre_id % 64)) & np.uint64(1) == 1
+
+    def _frame(self, rows, kept, genres, time_signatures):
+        columns = {}
+        for genre in genres:
+            columns[f'genre_{genre}'] = self._genre_flag(rows, self.genre_ids[genre])
+
+        merged = {'track_id': pd.array(self.track_ids.lookup(rows), dtype=self.string_dtype)}
+        for j, column in enumerate(NUMERIC_COLUMNS):
+            merged[column] = self.numeric[rows, j].astype(self._numeric_dtype(column))
+        for j, column in enumerate(STRING_COLUMNS):
+            merged[column] = pd.array(self.strings[rows, j], dtype=self.string_dtype)
+        for column in MERGED_COLUMNS:
+            columns[column] = merged[column]
+
+        # get_dummies names the levels of an int column '4', of a float column '4.0'
+        to_level = self._numeric_dtype('time_signature')
+        for value in time_signatures:
+            columns[f'time_signature_{to_level(value)}'] = self.time_signature[rows] == value
+
+        return pd.DataFrame(columns, index=np.flatnonzero(kept))
+
+    def _numeric_dtype(self, column):
+        kinds = self.kinds[column]
+        if kinds == {'i'}:
+            return np.int64
+        if kinds == {'b'}:
+            return np.bool_
+        return np.float64
@@ -1,75 +1,88 @@
+import hashlib
 import json
+import os
+import platform
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
-from time import time
+from time import perf_counter, time
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler
 from sklearn.metrics.pairwise import cosine_similarity
+from catalog_cache import DEFAULT_CACHE_DIR, file_digest, load_or_build
+from catalog_ingest import ingest_csv
+from hybrid_features import HybridFeatures
+from memory_profile import NULL_MEMORY_PROFILE
+import shared_arrays
+from topk import StreamingTopK
 
-def load_data():
-    # Load the dataset
-    df = pd.read_csv("dataset.csv", index_col=0)
-    df.drop_duplicates(subset=['explicit', 'danceability', 'energy', 'key', 'loudness', 'mode',
-        'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
-        'artists', 'track_name', 'time_signature'], inplace=True) # There are duplicates that have different track_id, genre and album. There are duplicates in other dimensions (eg. popularity and duration) but these are taken
+# Catalog rows scored per block by BaselineRecommender
+SCORE_BLOCK_ROWS = 1 << 16
 
-    # One-hot encode genres
-    genre_dummies = pd.get_dummies(df['track_genre'], prefix='genre')
-    time_signature_dummies = pd.get_dummies(df['time_signature'], prefix='time_signature')
+# Baseline timings cached by EvaluationSession, inside the snapshot directory
+BASELINE_TIMINGS_FILE = 'baseline_timings.json'
 
-    # Combine with original dataframe
-    df_with_genres = pd.concat([df, genre_dummies, time_signature_dummies], axis=1)
-
-    # Define columns to aggregate
-    group_cols = [
-        'track_id', 'explicit', 'danceability', 'energy', 'key', 'loudness', 'mode',
-        'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
-        'artists', 'album_name', 'track_name'
-    ] + list(time_signature_dummies.columns)
-
-    # Aggregation dictionary
-    agg_dict = {col: 'max' for col in genre_dummies.columns}
-    for col in group_cols:
-        agg_dict[col] = 'first'
-
-    # Merge duplicates
-    df_merged = df_with_genres.groupby('track_id', as_index=False).agg(agg_dict)
+def load_data(dataset_path="dataset.csv", testset_path="testset.json", cache_dir=DEFAULT_CACHE_DIR,
+              memory_profile=NULL_MEMORY_PROFILE):
+    """
+    Load the catalog feature matrix and the test set
 
-    # Final feature columns
-    feature_columns = [
-        'danceability', 'energy', 'key', 'loudness', 'mode',
-        'speechiness', 'acousticness', 'instrumentalness',
-        'liveness', 'valence', 'tempo', 'duration_ms', 'popularity',
-        'explicit'
-    ] + list(genre_dummies.columns) + list(time_signature_dummies.columns)
+    Args:
+        dataset_path: Path to the tracks CSV
+        testset_path: Path to the test set JSON
+        cache_dir: Snapshot directory (see catalog_cache), None to always rebuild
+        memory_profile: memory_profile.MemoryProfile recording the 'load' phase
+                        and, when the catalog is built from the CSV, 'preprocess'
 
-    # Drop missing values
-    df_clean = df_merged.dropna(subset=feature_columns).copy()
+    Returns:
+        (df_clean, X_scaled, testset)
+    """
+    def build():
+        with memory_profile.phase('preprocess'):
+            return build_features(dataset_path)
 
-    # Create feature matrix
-    X = df_clean[feature_columns].values
+    with memory_profile.phase('load'):
+        if cache_dir is None:
+            df_clean, arrays = build()
+        else:
+            df_clean, arrays = load_or_build('evaluation', dataset_path, {'features': 'genre_one_hot'},
+                                             build, cache_dir)
+        X_scaled = arrays['X_scaled']
 
-    # Normalize features
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+        with open(testset_path, 'r') as f:
+            testset = json.load(f)
 
+    return df_clean, X_scaled, testset
 
-    with open('testset.json', 'r') as f:
-        testset = json.load(f)
+def build_features(dataset_path="dataset.csv"):
+    """
+    Preprocess the CSV into df_clean and the standardized feature matrix
 
-    return df_clean, X_scaled, testset
+    Tracks are deduplicated and merged per track_id (genres one-hot encoded,
+    first value of the other columns), then the features are standardized.
+    The CSV is ingested in chunks, see catalog_ingest.
+    """
+    df_clean, X_scaled = ingest_csv(dataset_path)
+    return df_clean, {'X_scaled': X_scaled}
 
 class BaselineRecommender:
-    def __init__(self, df, features_scaled):
+    def __init__(self, df, features_scaled, similarity='hybrid'):
         """
         Initialize the recommender system
         
         Args:
             df: DataFrame with song information including track_id
             features_scaled: Normalized feature matrix (after PCA)
+            similarity: 'hybrid' scores from a dense block of the continuous
+                        features plus a sparse block of the one-hot columns
+                        (see hybrid_features), 'dense' scores every column of
+                        features_scaled with sklearn; both give the same scores
+                        up to rounding
         """
+        if similarity not in ('hybrid', 'dense'):
+            raise ValueError(f"Unknown similarity: {similarity!r}")
         self.df = df.reset_index(drop=True)
         self.features = features_scaled
+        self.hybrid = HybridFeatures(features_scaled) if similarity == 'hybrid' else None
         self.track_id_to_idx = {track_id: idx for idx, track_id in enumerate(self.df['track_id'])}
         
     def get_recommendations(self, input_track_ids, n_recommendations, target_artist):
@@ -94,30 +107,160 @@ class BaselineRecommender:
             return self.df.sample(n_recommendations)['track_id'].tolist()
         
         # Get features of input tracks and compute average profile
-        input_features = self.features[valid_indices]
+        if self.hybrid is not None:
+            input_features = self.hybrid.rows(valid_indices)
+        else:
+            input_features = self.features[valid_indices]
         avg_profile = np.mean(input_features, axis=0).reshape(1, -1)
         
-        # Calculate similarity with all songs
-        similarities = cosine_similarity(avg_profile, self.features)[0]
-        
         # If target_artist is specified, filter to only songs from those artists
-        artist_mask = self.df['artists'].isin(target_artist)
-        # Set similarity to -inf for songs not by the target artists
-        similarities = np.where(artist_mask, similarities, -np.inf)
+        artist_mask = self.df['artists'].isin(target_artist).to_numpy()
         
-        # Get indices of most similar songs
-        similar_indices = np.argsort(similarities)[::-1]
+        # Most similar songs by the target artists, skipping the input songs;
+        # similarities are computed block by block, never for the whole catalog at once
+        selection = StreamingTopK(n_recommendations, exclude=valid_indices)
+        for start in range(0, len(self.features), SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, len(self.features))
+            if self.hybrid is not None:
+                similarities = self.hybrid.cosine_similarity(avg_profile[0], start, stop)
+            else:
+                similarities = cosine_similarity(avg_profile, self.features[start:stop])[0]
+            selection.push(similarities, start, allow=artist_mask[start:stop])
+        recommended_indices = selection.result()[0].tolist()
         
-        # Filter out input songs if requested
-        similar_indices = [idx for idx in similar_indices if idx not in valid_indices]
+        # Too few songs by the target artists: fill up with other songs in catalog order
+        if len(recommended_indices) < n_recommendations:
+            others = np.flatnonzero(~artist_mask)
+            others = others[~np.isin(others, valid_indices)]
+            recommended_indices += others[:n_recommendations - len(recommended_indices)].tolist()
         
-        # Get top n recommendations
-        recommended_indices = similar_indices[:n_recommendations]
         recommended_track_ids = self.df.iloc[recommended_indices]['track_id'].tolist()
         
         return recommended_track_ids
 
-def recommender_metrics(recommender, testset, n_recommendations=5):
+def playlist_ndcg(recommender, input_tracks, target_tracks, n_recommendations=5, latencies=None):
+    """
+    NDCG of the recommendations for a single test playlist
+
+    Args:
+        recommender: ContentBasedRecommender instance
+        input_tracks: List of [track_id, artist] pairs given to the recommender
+        target_tracks: List of [track_id, artist] pairs held out from the playlist
+        n_recommendations: Number of recommendations from the system
+        latencies: Optional list; the get_recommendations time in seconds is appended
+
+    Returns:
+        NDCG@n_recommendations
+    """
+    # Extract track IDs from tracks
+    # _tracks is a list of [track_id, artist] pairs
+    input_track_ids = [track[0] for track in input_tracks]
+    target_track_ids = [track[0] for track in target_tracks]
+    target_set = set(target_track_ids)
+    
+    # Build a pool of candidate songs: only songs by artists in target_tracks
+    target_artists = set([track[1] for track in target_tracks])
+    
+    # Get recommendations filtered by artists
+    start = perf_counter()
+    predictions = recommender.get_recommendations(
+        input_track_ids, 
+        n_recommendations=n_recommendations,
+        target_artist=target_artists
+    )
+    if latencies is not None:
+        latencies.append(perf_counter() - start)
+            
+    # NDCG@K: Normalized Discounted Cumulative Gain
+    # Binary relevance: 1 if the song is in target_tracks, 0 otherwise
+    dcg = 0.0
+    idcg = 0.0
+    
+    # Calculate DCG for predictions
+    for rank, track_id in enumerate(predictions, start=1):
+        relevance = 1 if track_id in target_set else 0
+        dcg += relevance / np.log2(rank + 1)
+    
+    # Calculate IDCG (ideal DCG) - assumes all relevant items at top positions
+    n_relevant = min(len(target_track_ids), n_recommendations)
+    for rank in range(1, n_relevant + 1):
+        idcg += 1.0 / np.log2(rank + 1)
+    
+    # Normalize DCG
+    return dcg / idcg if idcg > 0 else 0.0
+
+def playlist_ndcgs(recommender, testset, n_recommendations=5, n_workers=1, chunk_size=16, latencies=None):
+    """
+    NDCG of every test playlist, in testset order
+
+    Args:
+        recommender: ContentBasedRecommender instance
+        testset: Dict of playlist_name -> [input_tracks, target_tracks] pairs
+        n_recommendations: Number of recommendations from the system
+        n_workers: Number of worker processes, 1 evaluates in this process
+        chunk_size: Playlists sent to a worker per task
+        latencies: Optional list; per-playlist get_recommendations times in
+                   seconds are appended, in testset order
+
+    Returns:
+        List of per-playlist NDCG values
+    """
+    playlists = list(testset.values())
+
+    if n_workers <= 1:
+        return [
+            playlist_ndcg(recommender, input_tracks, target_tracks, n_recommendations, latencies)
+            for input_tracks, target_tracks in tqdm(playlists)
+        ]
+
+    chunks = [playlists[i:i + chunk_size] for i in range(0, len(playlists), chunk_size)]
+    results = [None] * len(chunks)
+    chunk_latencies = [None] * len(chunks)
+
+    # Workers attach to the recommender's arrays through shared memory
+    with shared_arrays.SharedArrayPool() as pool:
+        payload = pool.dumps(recommender)
+        with ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(payload,)) as executor:
+            futures = {
+                executor.submit(_evaluate_chunk, chunk, n_recommendations): i
+                for i, chunk in enumerate(chunks)
+            }
+            with tqdm(total=len(playlists)) as progress:
+                for future in as_completed(futures):
+                    ndcgs, times, instrumentation = future.result()
+                    results[futures[future]] = ndcgs
+                    chunk_latencies[futures[future]] = times
+                    if instrumentation is not None:
+                        # Fold worker stage timings into the caller's instrumentation
+                        recommender.instrumentation.merge(instrumentation)
+                    progress.update(len(ndcgs))
+
+    if latencies is not None:
+        latencies.extend(latency for chunk in chunk_latencies for latency in chunk)
+    return [ndcg for chunk in results for ndcg in chunk]
+
+_worker_recommender = None
+
+def _init_worker(payload):
+    global _worker_recommender
+    _worker_recommender = shared_arrays.loads(payload)
+    instrumentation = getattr(_worker_recommender, 'instrumentation', None)
+    if instrumentation is not None and instrumentation.enabled:
+        # Drop data copied from the parent; only report this worker's queries
+        instrumentation.take()
+
+def _evaluate_chunk(playlists, n_recommendations):
+    latencies = []
+    ndcgs = [
+        playlist_ndcg(_worker_recommender, input_tracks, target_tracks, n_recommendations, latencies)
+        for input_tracks, target_tracks in playlists
+    ]
+    instrumentation = getattr(_worker_recommender, 'instrumentation', None)
+    if instrumentation is not None and instrumentation.enabled:
+        return ndcgs, latencies, instrumentation.take()
+    return ndcgs, latencies, None
+
+def recommender_metrics(recommender, testset, n_recommendations=5, n_workers=1, chunk_size=16):
     """
     Evaluate the recommender system using the testset
     
@@ -126,49 +269,20 @@ def recommender_metrics(recommender, testset, n_recommendations=5):
         testset: Dict of playlist_name -> [input_tracks, target_tracks] pairs
                  where each track is a [track_id, artist] pair
         n_recommendations: Number of recommendations from the system
+        n_workers: Number of worker processes, 1 evaluates in this process
+        chunk_size: Playlists sent to a worker per task
         
     Returns:
         Dictionary with evaluation metrics
     """
+    ndcgs = playlist_ndcgs(recommender, testset, n_recommendations, n_workers, chunk_size)
+    return _ndcg_metrics(ndcgs, len(testset))
+
+def _ndcg_metrics(ndcgs, n_playlists):
+    # Summed in testset order, so the result does not depend on n_workers
     total_ndcg = 0
-    
-    for playlist_name, (input_tracks, target_tracks) in tqdm(testset.items()):
-        # Extract track IDs from tracks
-        # _tracks is a list of [track_id, artist] pairs
-        input_track_ids = [track[0] for track in input_tracks]
-        target_track_ids = [track[0] for track in target_tracks]
-        target_set = set(target_track_ids)
-        
-        # Build a pool of candidate songs: only songs by artists in target_tracks
-        target_artists = set([track[1] for track in target_tracks])
-        
-        # Get recommendations filtered by artists
-        predictions = recommender.get_recommendations(
-            input_track_ids, 
-            n_recommendations=n_recommendations,
-            target_artist=target_artists
-        )
-                
-        # NDCG@K: Normalized Discounted Cumulative Gain
-        # Binary relevance: 1 if the song is in target_tracks, 0 otherwise
-        dcg = 0.0
-        idcg = 0.0
-        
-        # Calculate DCG for predictions
-        for rank, track_id in enumerate(predictions, start=1):
-            relevance = 1 if track_id in target_set else 0
-            dcg += relevance / np.log2(rank + 1)
-        
-        # Calculate IDCG (ideal DCG) - assumes all relevant items at top positions
-        n_relevant = min(len(target_track_ids), n_recommendations)
-        for rank in range(1, n_relevant + 1):
-            idcg += 1.0 / np.log2(rank + 1)
-        
-        # Normalize DCG
-        ndcg = dcg / idcg if idcg > 0 else 0.0
+    for ndcg in ndcgs:
         total_ndcg += ndcg
-        
-    n_playlists = len(testset)
     
     metrics = {
         'NDCG@5': total_ndcg.item() / n_playlists
@@ -176,17 +290,171 @@ def recommender_metrics(recommender, testset, n_recommendations=5):
     
     return metrics
 
-def evaluate(recommender, n_recommendations=5):
-    df_clean, X_scaled, testset = load_data()
-    baseline = BaselineRecommender(df_clean, X_scaled)
-    t0 = time()
-    print('Testing recommender quality...')
-    metrics = recommender_metrics(recommender, testset, n_recommendations)
-    t1 = time()
-    print('Testing recommender performance...')
-    recommender_metrics(baseline, testset, n_recommendations)
-    t2 = time()
-    
-    metrics['Performance'] = (t1-t0)/(t2-t1)
+class EvaluationSession:
+    def __init__(self, dataset_path="dataset.csv", testset_path="testset.json", cache_dir=DEFAULT_CACHE_DIR,
+                 n_recommendations=5, n_workers=1, memory_profile=None):
+        """
+        Catalog and test set loaded once, for evaluating any number of recommenders
 
-    return metrics
+        The baseline run behind the Performance ratio is timed once per machine
+        and configuration (catalog, test set, n_recommendations, n_workers and the
+        baseline's code); the timing is kept in cache_dir/baseline_timings.json.
+
+        Args:
+            dataset_path: Path to the tracks CSV
+            testset_path: Path to the test set JSON
+            cache_dir: Snapshot directory (see catalog_cache), None to always rebuild
+                       and time the baseline once per session
+            n_recommendations: Number of recommendations per playlist
+            n_workers: Number of worker processes, 1 evaluates in this process
+            memory_profile: Optional memory_profile.MemoryProfile; records the
+                            phases load, preprocess, baseline index and one
+                            query loop per recommender, and enforces its budget
+        """
+        self.dataset_path = dataset_path
+        self.testset_path = testset_path
+        self.cache_dir = cache_dir
+        self.n_recommendations = n_recommendations
+        self.n_workers = n_workers
+        self.memory_profile = memory_profile if memory_profile is not None else NULL_MEMORY_PROFILE
+        self.df_clean, self.X_scaled, self.testset = load_data(dataset_path, testset_path, cache_dir,
+                                                               self.memory_profile)
+        self._baseline = None
+        self._baseline_seconds = None
+
+    @property
+    def baseline(self):
+        """BaselineRecommender over the session's catalog, built on first use"""
+        if self._baseline is None:
+            with self.memory_profile.phase('baseline index'):
+                self._baseline = BaselineRecommender(self.df_clean, self.X_scaled)
+        return self._baseline
+
+    def run(self, recommender):
+        """
+        One pass over the test set
+
+        Args:
+            recommender: Object with get_recommendations, or a function with its
+                         signature (only objects can be sent to worker processes)
+
+        Returns:
+            (per-playlist NDCGs, per-playlist latencies in seconds, total seconds)
+        """
+        if not hasattr(recommender, 'get_recommendations'):
+            recommender = _FunctionRecommender(recommender)
+        latencies = []
+        start = time()
+        ndcgs = playlist_ndcgs(recommender, self.testset, self.n_recommendations, self.n_workers,
+                               latencies=latencies)
+        return ndcgs, latencies, time() - start
+
+    def baseline_seconds(self):
+        """Seconds of a baseline pass over the test set, from the timing cache when present"""
+        if self._baseline_seconds is not None:
+            return self._baseline_seconds
+
+        key = self._baseline_key()
+        timings = self._read_baseline_timings()
+        if key in timings:
+            self._baseline_seconds = timings[key]['seconds']
+            return self._baseline_seconds
+
+        print('Testing recommender performance...')
+        baseline = self.baseline
+        with self.memory_profile.phase('query loop: baseline'):
+            self._baseline_seconds = self.run(baseline)[2]
+        if self.cache_dir is not None:
+            timings[key] = {'seconds': self._baseline_seconds, 'config': self._baseline_config()}
+            self._write_baseline_timings(timings)
+        return self._baseline_seconds
+
+    def evaluate(self, recommenders):
+        """
+        Evaluate recommenders on the session's test set, one after the other
+
+        Args:
+            recommenders: Dict of name -> recommender (see run), or a single recommender
+
+        Returns:
+            Dict of name -> metrics (a single metrics dict for a single recommender):
+            'NDCG@5', 'Performance' (time relative to the baseline) and
+            'latency_ms' (mean, p50, p95, p99, max of get_recommendations)
+        """
+        if not isinstance(recommenders, dict):
+            return self.evaluate({'recommender': recommenders})['recommender']
+
+        results = {}
+        for name, recommender in recommenders.items():
+            print(f'Testing {name}...')
+            with self.memory_profile.phase(f'query loop: {name}'):
+                ndcgs, latencies, seconds = self.run(recommender)
+            metrics = _ndcg_metrics(ndcgs, len(self.testset))
+            metrics['Performance'] = seconds / self.baseline_seconds()
+            metrics['latency_ms'] = _latency_summary(latencies)
+            results[name] = metrics
+        return results
+
+    def _baseline_config(self):
+        return {
+            'machine': [platform.node(), platform.machine(), platform.processor(), os.cpu_count()],
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'dataset': file_digest(self.dataset_path),
+            'testset': file_digest(self.testset_path),
+            'n_recommendations': self.n_recommendations,
+            'n_workers': self.n_workers,
+            # A change to the baseline's code invalidates its timing
+            'code': [file_digest(sys.modules[module].__file__)
+                     for module in (__name__, HybridFeatures.__module__, StreamingTopK.__module__)],
+        }
+
+    def _baseline_key(self):
+        return hashlib.sha256(json.dumps(self._baseline_config(), sort_keys=True).encode()).hexdigest()[:16]
+
+    def _read_baseline_timings(self):
+        if self.cache_dir is None:
+            return {}
+        try:
+            with open(os.path.join(self.cache_dir, BASELINE_TIMINGS_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_baseline_timings(self, timings):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, BASELINE_TIMINGS_FILE)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            json.dump(timings, f, indent=2)
+        os.replace(tmp_path, path)
+
+class _FunctionRecommender:
+    """Adapts a get_recommendations-like function to the recommender interface"""
+
+    def __init__(self, get_recommendations):
+        self.get_recommendations = get_recommendations
+
+def _latency_summary(latencies):
+    latencies_ms = np.array(latencies) * 1e3
+    if not len(latencies_ms):
+        return {}
+    return {
+        'mean': float(latencies_ms.mean()),
+        'p50': float(np.percentile(latencies_ms, 50)),
+        'p95': float(np.percentile(latencies_ms, 95)),
+        'p99': float(np.percentile(latencies_ms, 99)),
+        'max': float(latencies_ms.max()),
+    }
+
+def evaluate(recommender, n_recommendations=5, n_workers=1, memory_profile=None):
+    """
+    NDCG@5, Performance and latency of one recommender on dataset.csv/testset.json
+
+    To compare several recommenders, use one EvaluationSession instead: it loads
+    the catalog once and times the baseline once per machine and configuration.
+    Pass a memory_profile.MemoryProfile to profile the phases (see EvaluationSession).
+    """
+    session = EvaluationSession(n_recommendations=n_recommendations, n_workers=n_workers,
+                                memory_profile=memory_profile)
+    return session.evaluate(recommender)
@@ -0,0 +1,299 @@
+"""
+Popularity-ranked fallback tables for requests without usable candidates
+
+Built once per catalog (and stored in its snapshot), so fallback and
+cold-start requests are answered from a few array slices instead of a scan
+of the catalog:
+
+    tiers = FallbackTiers(popularity, genre_codes, artist_index)
+    rows = tiers.recommend(5, artists={"Artist"}, genres=tiers.genre_codes[input_rows], exclude=input_rows)
+
+Tiers are used in order until n rows are found: tracks of the target artists,
+then tracks of the given genres, then the whole catalog. Within a tier, rows
+are taken by popularity (ties: lowest row first), or sampled uniformly at
+random from a seeded generator so that results are reproducible.
+
+Catalog updates move rows in the tables (add_rows, set_rows, remove_rows,
+after the same update of the ArtistIndex) instead of sorting them again.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class FallbackTiers:
+    def __init__(self, popularity: np.ndarray, genre_codes: np.ndarray, artist_index) -> None:
+        """
+        Args:
+            popularity: (n_rows,) popularity of every catalog row, higher is better
+            genre_codes: (n_rows,) genre id of every row, -1 for none
+            artist_index: artist_index.ArtistIndex of the same rows
+
+        Layout:
+            ranked:        (n_rows,) rows by popularity, most popular first
+            genre_codes:   (n_rows,) genre id of every row, as given
+            genre_offsets: (n_genres + 1,) array, rows of genre g by popularity
+                           are genre_rows[genre_offsets[g]:genre_offsets[g + 1]]
+            genre_rows:    (n_rows with a genre,) array of rows
+            artist_rows:   artist_index.rows, ordered by popularity within each
+                           artist (same offsets as artist_index)
+        """
+        popularity = np.asarray(popularity, dtype=np.float64)
+        self.ranked = np.lexsort((np.arange(len(popularity)), -popularity))
+        self.genre_codes = np.asarray(genre_codes, dtype=np.int32)
+        self._set_rank()
+
+        # A stable sort by genre keeps the popularity order within every genre
+        ranked_genres = self.genre_codes[self.ranked]
+        has_genre = ranked_genres >= 0
+        self.genre_rows = self.ranked[has_genre][np.argsort(ranked_genres[has_genre], kind="stable")]
+        self._set_genre_offsets()
+
+        posting_artists, rows = _postings(artist_index)
+        self.artist_rows = rows[np.lexsort((self.rank[rows], posting_artists))]
+        self._artist_index = artist_index
+        # Offsets artist_rows is grouped by, kept to find the moved rows after an update
+        self._artist_offsets = artist_index.offsets
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], artist_index) -> "FallbackTiers":
+        """Rebuild the tables from the arrays of to_arrays() and the catalog's ArtistIndex"""
+        tiers = cls.__new__(cls)
+        # Plain ndarray views: slicing a np.memmap costs microseconds per slice
+        tiers.ranked = np.asarray(arrays["fallback_ranked"])
+        tiers.genre_codes = np.asarray(arrays["fallback_genre_codes"])
+        tiers.genre_offsets = np.asarray(arrays["fallback_genre_offsets"])
+        tiers.genre_rows = np.asarray(arrays["fallback_genre_rows"])
+        tiers.artist_rows = np.asarray(arrays["fallback_artist_rows"])
+        tiers._artist_index = artist_index
+        tiers._artist_offsets = artist_index.offsets
+        tiers._set_rank()
+        return tiers
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Flat arrays for persisting the tables (e.g. as catalog snapshot extras)"""
+        return {
+            "fallback_ranked": self.ranked,
+            "fallback_genre_codes": self.genre_codes,
+            "fallback_genre_offsets": self.genre_offsets,
+            "fallback_genre_rows": self.genre_rows,
+            "fallback_artist_rows": self.artist_rows,
+        }
+
+    def _set_rank(self):
+        # Position of every row in ranked, to merge tiers of several artists or genres
+        self.rank = np.empty(len(self.ranked), dtype=np.int64)
+        self.rank[self.ranked] = np.arange(len(self.ranked))
+
+    def _set_genre_offsets(self):
+        counts = np.bincount(self.genre_codes[self.genre_rows], minlength=int(self.genre_codes.max(initial=-1)) + 1)
+        self.genre_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.genre_offsets[1:])
+
+    def add_rows(self, popularity: np.ndarray, genre_codes: np.ndarray) -> None:
+        """
+        Append rows n_rows, n_rows + 1, ... after ArtistIndex.add_rows added them
+
+        Args:
+            popularity: (n_rows,) popularity of every row, the new rows last
+            genre_codes: Genre id of every new row, -1 for none
+        """
+        self.genre_codes = np.concatenate([self.genre_codes, np.asarray(genre_codes, dtype=np.int32)])
+        self._place(np.arange(len(self.ranked), len(self.genre_codes)), popularity)
+
+    def set_rows(self, rows: Iterable[int], popularity: np.ndarray, genre_codes: np.ndarray) -> None:
+        """
+        Move existing rows after an update of their popularity, genre or artists
+        (after ArtistIndex.set_rows)
+
+        Args:
+            rows: Distinct rows
+            popularity: (n_rows,) popularity of every row, updated
+            genre_codes: New genre id of every given row, -1 for none
+        """
+        rows = _int_array(rows)
+        self.genre_codes = np.array(self.genre_codes)
+        self.genre_codes[rows] = genre_codes
+        self._place(rows, popularity)
+
+    def remove_rows(self, rows: Iterable[int]) -> None:
+        """Drop rows and renumber the remaining ones, after ArtistIndex.remove_rows"""
+        keep = np.ones(len(self.ranked), dtype=bool)
+        keep[_int_array(rows)] = False
+        # Old row -> new row for the rows that stay; the tables keep their order
+        new_row = np.cumsum(keep) - 1
+
+        self.ranked = new_row[self.ranked[keep[self.ranked]]]
+        self.genre_rows = new_row[self.genre_rows[keep[self.genre_rows]]]
+        self.artist_rows = new_row[self.artist_rows[keep[self.artist_rows]]]
+        self.genre_codes = self.genre_codes[keep]
+        self._set_rank()
+        self._set_genre_offsets()
+        self._artist_offsets = self._artist_index.offsets
+
+    def _place(self, rows, popularity):
+        # Take rows out of the tables and merge them back at their new positions
+        popularity = np.asarray(popularity, dtype=np.float64)
+        moved = np.zeros(len(popularity), dtype=bool)
+        moved[rows] = True
+
+        stay = self.ranked[~moved[self.ranked]]
+        rows = rows[np.lexsort((rows, -popularity[rows]))]
+        self.ranked = np.insert(stay, _ranked_positions(-popularity[stay], stay, -popularity[rows], rows), rows)
+        self._set_rank()
+
+        # Rows the groups keep are in the same order in ranked, so the groups stay sorted by rank
+        stay = self.genre_rows[~moved[self.genre_rows]]
+        new = rows[self.genre_codes[rows] >= 0]
+        self.genre_rows = self._merge(stay, self.genre_codes[stay], new, self.genre_codes[new])
+        self._set_genre_offsets()
+
+        artists = np.repeat(np.arange(len(self._artist_offsets) - 1, dtype=np.int64), np.diff(self._artist_offsets))
+        keep = ~moved[self.artist_rows]
+        posting_artists, posting_rows = _postings(self._artist_index)
+        new = moved[posting_rows]
+        self.artist_rows = self._merge(
+            self.artist_rows[keep], artists[keep], posting_rows[new], posting_artists[new]
+        )
+        self._artist_offsets = self._artist_index.offsets
+
+    def _merge(self, rows, groups, new_rows, new_groups):
+        """Insert new_rows into rows ordered by (group, rank)"""
+        n_rows = len(self.rank)
+        keys = groups.astype(np.int64) * n_rows + self.rank[rows]
+        new_keys = new_groups.astype(np.int64) * n_rows + self.rank[new_rows]
+        order = np.argsort(new_keys)
+        return np.insert(rows, np.searchsorted(keys, new_keys[order]), new_rows[order])
+
+    def recommend(
+        self,
+        n: int,
+        artists: Iterable[str] = (),
+        genres: Iterable[int] = (),
+        exclude: Iterable[int] = (),
+        seed: int | None = None,
+    ) -> np.ndarray:
+        """
+        Up to n fallback rows, tier by tier
+
+        Args:
+            n: Number of rows
+            artists: Target artist names (first tier); unknown names are ignored
+            genres: Genre ids (second tier), e.g. genre_codes[input_rows]; -1 is ignored
+            exclude: Rows that must not be returned, e.g. the input tracks
+            seed: None takes every tier by popularity; an int samples each tier
+                  uniformly at random with np.random.default_rng(seed)
+
+        Returns:
+            (min(n, n_eligible),) array of rows, without repeats
+        """
+        blocked = np.sort(_int_array(exclude))
+        rng = None if seed is None else np.random.default_rng(seed)
+        artist_to_id = self._artist_index.artist_to_id
+        artist_ids = [artist_to_id.get(artist) for artist in artists]
+        genre_ids = np.unique(_int_array(genres))
+        # Each tier: limit -> up to limit of its rows, most popular first or sampled
+        tiers = [
+            lambda limit: self._head(
+                self._artist_index.offsets, self.artist_rows, [a for a in artist_ids if a is not None], limit, rng
+            ),
+            lambda limit: self._head(
+                self.genre_offsets, self.genre_rows, genre_ids[genre_ids >= 0], limit, rng, disjoint=True
+            ),
+            lambda limit: self._head(
+                np.array([0, len(self.ranked)]), self.ranked, [0], limit, rng, disjoint=True
+            ),
+        ]
+
+        chosen = []
+        n_chosen = 0
+        for tier in tiers:
+            need = n - n_chosen
+            if need <= 0:
+                break
+            # At most len(blocked) of need + len(blocked) rows are blocked
+            head = tier(need + len(blocked))
+            head = head[~_contains(blocked, head)][:need]
+            chosen.append(head)
+            n_chosen += len(head)
+            blocked = np.sort(np.concatenate([blocked, head]))
+
+        if not chosen:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(chosen)
+
+    def _head(self, offsets, rows, ids, limit, rng, disjoint=False):
+        """
+        Up to limit rows of the union of several groups of a CSR table: the most
+        popular ones, or with an rng a uniform sample of them in random order.
+        disjoint: no row is in two of the groups
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(ids):
+            return rows[:0]
+        starts = offsets[ids]
+        lengths = offsets[ids + 1] - starts
+        if rng is None:
+            # The first limit rows of the union are among the first limit of each group
+            lengths = np.minimum(lengths, limit)
+        ends = np.cumsum(lengths)
+        total = int(ends[-1])
+
+        if rng is not None and disjoint:
+            # Sample positions of the concatenated groups without gathering them
+            positions = rng.choice(total, min(total, limit), replace=False)
+            groups = np.searchsorted(ends, positions, side="right")
+            return rows[starts[groups] + positions - (ends - lengths)[groups]]
+
+        # Position p of group g is rows[starts[g] + p]
+        merged = rows[np.repeat(starts - (ends - lengths), lengths) + np.arange(total)]
+        if not disjoint and len(ids) > 1:
+            # Groups may share rows (tracks with several artists)
+            merged = np.unique(merged)
+        if rng is not None:
+            return merged[rng.choice(len(merged), min(len(merged), limit), replace=False)]
+        if len(ids) > 1:
+            ranks = self.rank[merged]
+            if len(merged) > limit:
+                # Only the first limit need sorting
+                merged = merged[np.argpartition(ranks, limit - 1)[:limit]]
+                ranks = self.rank[merged]
+            merged = merged[np.argsort(ranks)]
+        return merged[:limit]
+
+
+def _postings(artist_index):
+    # (artist id, row) pairs, grouped by artist
+    counts = np.diff(artist_index.offsets)
+    return np.repeat(np.arange(len(counts), dtype=np.int64), counts), np.asarray(artist_index.rows)
+
+
+def _ranked_positions(keys, rows, new_keys, new_rows):
+    """Insertion points of new rows into rows, both sorted by (key, row)"""
+    positions = np.searchsorted(keys, new_keys, side="right")
+    low = np.searchsorted(keys, new_keys, side="left")
+    # Within a run of equal keys, rows ascend; new rows after all of them go last
+    tied = np.flatnonzero((low < positions) & (new_rows < rows.max(initial=-1)))
+    for i in tied.tolist():
+        positions[i] = low[i] + np.searchsorted(rows[low[i]:positions[i]], new_rows[i])
+    return positions
+
+
+def _contains(sorted_rows, rows):
+    """Mask of the rows found in sorted_rows (np.isin is slow on such small arrays)"""
+    if not len(sorted_rows):
+        return np.zeros(len(rows), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_rows, rows), len(sorted_rows) - 1)
+    return sorted_rows[positions] == rows
+
+
+def _int_array(values):
+    # Without iterating arrays element by element (slow for memory-mapped ones)
+    if isinstance(values, np.ndarray):
+        return values.astype(np.int64, copy=False).reshape(-1)
+    return np.fromiter(values, dtype=np.int64)
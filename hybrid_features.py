@@ -0,0 +1,140 @@
+"""
+Hybrid dense/sparse form of a standardized feature matrix
+Used by evaluation.BaselineRecommender for exact cosine similarities
+
+Most columns of the baseline's X_scaled are standardized one-hots (genres,
+time signatures): each takes only two values, low = -mean / scale for 0 and
+high = (1 - mean) / scale for 1. Such two-valued columns are kept as a
+multi-hot CSR block of the rows at their high value; the other columns stay
+in a small dense block. For a profile p,
+
+    x . p = dense(x) . p_dense + low . p_binary + sum over active j of p_j * (high_j - low_j)
+
+where the middle term is the same for every row, so a score costs one short
+dot product plus a few sparse terms instead of a dot product over every column.
+
+Layout:
+    dense_columns:  (d_dense,) columns of X in the dense block
+    binary_columns: (d_binary,) two-valued columns of X
+    dense:          (n, d_dense) values of the dense columns
+    low, high:      (d_binary,) the two values of each binary column
+    offsets:        (n + 1,) active binary columns of row i are
+                    columns[offsets[i]:offsets[i + 1]]
+    columns:        (n_active,) positions into binary_columns, sorted per row
+    norms:          (n,) L2 norm of every row of X
+"""
+
+from __future__ import annotations
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Rows of X read at a time while building
+BUILD_BLOCK_ROWS = 1 << 16
+
+
+class HybridFeatures:
+    def __init__(self, X: np.ndarray, block_rows: int = BUILD_BLOCK_ROWS) -> None:
+        """
+        Split a feature matrix into its dense and multi-hot blocks
+
+        Args:
+            X: (n, d) feature matrix, may be a memory map; read block by block
+            block_rows: Rows of X read at a time
+        """
+        n_rows, n_columns = X.shape
+        self.n_columns = n_columns
+        low = np.asarray(X.min(axis=0), dtype=np.float64) if n_rows else np.zeros(n_columns)
+        high = np.asarray(X.max(axis=0), dtype=np.float64) if n_rows else np.zeros(n_columns)
+
+        binary = np.ones(n_columns, dtype=bool)
+        for start in range(0, n_rows, block_rows):
+            block = np.asarray(X[start:start + block_rows])
+            binary &= np.all((block == low) | (block == high), axis=0)
+
+        self.dense_columns = np.flatnonzero(~binary)
+        self.binary_columns = np.flatnonzero(binary)
+        self.low = low[self.binary_columns]
+        self.high = high[self.binary_columns]
+        # A constant column never has an active row
+        two_valued = self.high != self.low
+
+        dense = np.empty((n_rows, len(self.dense_columns)), dtype=np.float64)
+        norms = np.empty(n_rows, dtype=np.float64)
+        counts = np.empty(n_rows, dtype=np.int64)
+        columns = []
+        for start in range(0, n_rows, block_rows):
+            block = np.asarray(X[start:start + block_rows], dtype=np.float64)
+            stop = start + len(block)
+            dense[start:stop] = block[:, self.dense_columns]
+            # Same expression as sklearn's row_norms, so the norms match the dense path
+            norms[start:stop] = np.sqrt(np.einsum("ij,ij->i", block, block))
+
+            active = (block[:, self.binary_columns] == self.high) & two_valued
+            counts[start:stop] = active.sum(axis=1)
+            columns.append(np.nonzero(active)[1].astype(np.int32))
+
+        self.dense = dense
+        self.norms = norms
+        self.offsets = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.columns = np.concatenate(columns) if columns else np.empty(0, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.norms)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the arrays of both blocks"""
+        return sum(array.nbytes for array in (
+            self.dense_columns, self.binary_columns, self.dense, self.low, self.high,
+            self.offsets, self.columns, self.norms,
+        ))
+
+    def rows(self, indices) -> np.ndarray:
+        """(len(indices), d) rows of X, bit for bit"""
+        indices = np.asarray(indices, dtype=np.int64)
+        out = np.empty((len(indices), self.n_columns), dtype=np.float64)
+        out[:, self.dense_columns] = self.dense[indices]
+
+        binary = np.tile(self.low, (len(indices), 1))
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        # Positions of the active entries of every requested row, concatenated
+        positions = np.arange(counts.sum()) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        active_columns = self.columns[positions]
+        binary[np.repeat(np.arange(len(indices)), counts), active_columns] = self.high[active_columns]
+        out[:, self.binary_columns] = binary
+        return out
+
+    def cosine_similarity(self, profile: np.ndarray, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """
+        Cosine similarity between a profile and rows start..stop - 1 of X
+
+        Args:
+            profile: (d,) vector in the columns of X
+            start, stop: Row range, the whole matrix by default
+
+        Returns:
+            (stop - start,) similarities; 0 where the row or the profile is all zero,
+            like sklearn's cosine_similarity
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        profile = np.asarray(profile, dtype=np.float64).reshape(-1)
+        profile_binary = profile[self.binary_columns]
+
+        # Standardization folded into one shared offset and one weight per binary column
+        dots = self.dense[start:stop] @ profile[self.dense_columns]
+        dots += self.low @ profile_binary
+        weights = (self.high - self.low) * profile_binary
+
+        first, last = self.offsets[start], self.offsets[stop]
+        row_of_active = np.repeat(np.arange(stop - start), np.diff(self.offsets[start:stop + 1]))
+        dots += np.bincount(row_of_active, weights=weights[self.columns[first:last]],
+                            minlength=stop - start)
+
+        scale = self.norms[start:stop] * np.sqrt(profile @ profile)
+        similarities = np.zeros(stop - start, dtype=np.float64)
+        np.divide(dots, scale, out=similarities, where=scale > 0)
+        return similarities
@@ -0,0 +1,205 @@
+"""
+Opt-in stage timers, counters and histograms for the recommenders
+
+Recommenders hold NULL_INSTRUMENTATION by default, whose methods do nothing.
+Assign an Instrumentation to collect data:
+
+    recommender.instrumentation = Instrumentation()
+    evaluate(recommender)
+    print(recommender.instrumentation.format())
+    recommender.instrumentation.dump("stages.json")
+"""
+
+import json
+import math
+from bisect import bisect_left
+from contextlib import nullcontext
+from time import perf_counter_ns
+
+# Upper bucket bounds, 1-2-5 steps
+LATENCY_BOUNDS_MS = tuple(
+    base * 10.0 ** exponent for exponent in range(-3, 5) for base in (1, 2, 5)
+)
+SIZE_BOUNDS = tuple(2 ** exponent for exponent in range(25))
+
+
+class Histogram:
+    """Bucketed distribution with exact count, sum, min and max"""
+
+    def __init__(self, bounds: tuple) -> None:
+        self.bounds = bounds
+        # Last bucket holds values above bounds[-1]
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        for i, count in enumerate(other.buckets):
+            self.buckets[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (capped at max)"""
+        if self.count == 0:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                bound = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else math.nan,
+            "min": self.min if self.count else math.nan,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max if self.count else math.nan,
+            "buckets": {
+                _bucket_label(self.bounds, i): count
+                for i, count in enumerate(self.buckets)
+                if count
+            },
+        }
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self) -> None:
+        # Stage name -> latency histogram in milliseconds
+        self.stages: dict[str, Histogram] = {}
+        # Value name -> histogram of observed sizes (e.g. candidate pool size)
+        self.values: dict[str, Histogram] = {}
+        self.counters: dict[str, int] = {}
+
+    def stage(self, name: str) -> "_StageTimer":
+        """Context manager timing one execution of a stage"""
+        return _StageTimer(self, name)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        histogram = self.values.get(name)
+        if histogram is None:
+            histogram = self.values[name] = Histogram(SIZE_BOUNDS)
+        histogram.add(value)
+
+    def merge(self, other: "Instrumentation") -> None:
+        """Add another instance's data (e.g. from a worker process) to this one"""
+        for source, target, bounds in (
+            (other.stages, self.stages, LATENCY_BOUNDS_MS),
+            (other.values, self.values, SIZE_BOUNDS),
+        ):
+            for name, histogram in source.items():
+                target.setdefault(name, Histogram(bounds)).merge(histogram)
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+    def take(self) -> "Instrumentation":
+        """Return the data collected so far and start over"""
+        taken = Instrumentation()
+        taken.stages, taken.values, taken.counters = self.stages, self.values, self.counters
+        self.stages, self.values, self.counters = {}, {}, {}
+        return taken
+
+    def report(self) -> dict:
+        return {
+            "stages_ms": {name: h.to_dict() for name, h in self.stages.items()},
+            "values": {name: h.to_dict() for name, h in self.values.items()},
+            "counters": dict(self.counters),
+        }
+
+    def dump(self, path: str) -> None:
+        """Write report() as JSON"""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def format(self) -> str:
+        """Human-readable table of the stage latencies, values and counters"""
+        lines = [
+            f"{'stage':<20} {'count':>8} {'total ms':>10} {'mean ms':>9} "
+            f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+        ]
+        for name, histogram in self.stages.items():
+            lines.append(_format_row(name, histogram))
+        if self.values:
+            lines.append("")
+            lines.append(f"{'value':<20} {'count':>8} {'total':>10} {'mean':>9} "
+                         f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+            for name, histogram in self.values.items():
+                lines.append(_format_row(name, histogram))
+        if self.counters:
+            lines.append("")
+            for name, amount in self.counters.items():
+                lines.append(f"{name:<20} {amount:>8}")
+        return "\n".join(lines)
+
+
+class _NullInstrumentation:
+    """Disabled instrumentation: every call is a no-op"""
+
+    enabled = False
+    _context = nullcontext()
+
+    def stage(self, name):
+        return self._context
+
+    def count(self, name, amount=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
+
+
+class _StageTimer:
+    __slots__ = ("instrumentation", "name", "start")
+
+    def __init__(self, instrumentation: Instrumentation, name: str) -> None:
+        self.instrumentation = instrumentation
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed_ms = (perf_counter_ns() - self.start) / 1e6
+        stages = self.instrumentation.stages
+        histogram = stages.get(self.name)
+        if histogram is None:
+            histogram = stages[self.name] = Histogram(LATENCY_BOUNDS_MS)
+        histogram.add(elapsed_ms)
+
+
+def _bucket_label(bounds, i):
+    return f"<={bounds[i]:g}" if i < len(bounds) else f">{bounds[-1]:g}"
+
+
+def _format_row(name, histogram):
+    stats = histogram.to_dict()
+    return (
+        f"{name:<20} {stats['count']:>8} {stats['total']:>10.2f} {stats['mean']:>9.3f} "
+        f"{stats['p50']:>8.3f} {stats['p95']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}"
+    )
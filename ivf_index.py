@@ -0,0 +1,181 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index for cosine distance
+Partitions unit-normalized vectors with spherical k-means; a query scans only
+the nprobe lists whose centroids are closest to it
+
+Layout (CSR, like artist_index):
+    centroids: (n_lists, n_features) unit-norm list centroids
+    offsets:   (n_lists + 1,) array, list l holds rows[offsets[l]:offsets[l + 1]]
+    rows:      (n_vectors,) catalog row ids grouped by list, ascending per list
+    vectors:   (n_vectors, n_features) the vectors in `rows` order, so a list
+               is one contiguous block
+"""
+
+from __future__ import annotations
+
+from lazy_import import lazy_import
+from topk import smallest_k
+
+np = lazy_import("numpy")
+
+# Rows per block when assigning vectors to centroids (bounds temporary memory)
+ASSIGN_BLOCK_ROWS = 1 << 16
+
+
+class IVFIndex:
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        n_lists: int | None = None,
+        n_iter: int = 10,
+        train_size: int | None = None,
+        seed: int = 0,
+    ) -> None:
+        """
+        Train the coarse quantizer and fill the inverted lists
+
+        Args:
+            vectors: (n_vectors, n_features) unit-normalized vectors; float32
+                     vectors are stored as float32, anything else as float64
+            n_lists: Number of lists; default sqrt(n_vectors). More lists make
+                     each probe cheaper but need a larger nprobe for the same recall
+            n_iter: Spherical k-means iterations
+            train_size: Vectors sampled for training; default 256 per list
+            seed: Random seed for the initial centroids and the training sample
+        """
+        vectors = _as_float(vectors)
+        n_vectors = len(vectors)
+        if n_lists is None:
+            n_lists = int(np.sqrt(n_vectors))
+        n_lists = max(1, min(n_lists, n_vectors))
+        if train_size is None:
+            train_size = 256 * n_lists
+
+        rng = np.random.default_rng(seed)
+        if train_size < n_vectors:
+            sample = vectors[np.sort(rng.choice(n_vectors, train_size, replace=False))]
+        else:
+            sample = vectors
+
+        self._fill(_spherical_kmeans(sample, n_lists, n_iter, rng), vectors)
+
+    @classmethod
+    def from_centroids(cls, centroids: np.ndarray, vectors: np.ndarray) -> "IVFIndex":
+        """Fill the lists of already trained centroids with a new set of vectors"""
+        index = cls.__new__(cls)
+        index._fill(centroids, _as_float(vectors))
+        return index
+
+    @classmethod
+    def from_arrays(
+        cls, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, vectors: np.ndarray
+    ) -> "IVFIndex":
+        """Rebuild an index from arrays previously taken from to_arrays()"""
+        index = cls.__new__(cls)
+        index.centroids = centroids
+        index.offsets = offsets
+        index.rows = rows
+        index.vectors = vectors
+        return index
+
+    def _fill(self, centroids, vectors):
+        assignments = _assign(vectors, centroids)
+
+        # Stable sort keeps rows ascending within a list
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(centroids))
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = order.astype(np.int64)
+        self.vectors = vectors[order]
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """Arrays for persisting the index (e.g. as catalog snapshot extras)"""
+        return {
+            "centroids": self.centroids,
+            "offsets": self.offsets,
+            "rows": self.rows,
+            "vectors": self.vectors,
+        }
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = 8) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate k nearest vectors to a unit-norm query by cosine distance
+
+        Lists are probed in order of centroid similarity; beyond nprobe lists,
+        probing continues only until the lists hold at least k vectors, so the
+        result has min(k, n_vectors) entries.
+
+        Args:
+            query: (n_features,) unit-normalized query vector
+            k: Number of neighbours
+            nprobe: Lists scanned at least; n_lists makes the search exact
+
+        Returns:
+            (distances, rows) closest first, ties broken by position in the index
+        """
+        query = np.asarray(query, dtype=np.float64).reshape(-1)
+        lists = self.probe_order(query)
+
+        sizes = self.offsets[lists + 1] - self.offsets[lists]
+        n_probe = max(nprobe, int(np.searchsorted(np.cumsum(sizes), k)) + 1)
+        lists = np.sort(lists[:n_probe])
+
+        positions = np.concatenate(
+            [np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists]
+        )
+        distances = 1.0 - self.vectors[positions] @ query
+
+        top = smallest_k(distances, k)
+        return distances[top], self.rows[positions[top]]
+
+    def probe_order(self, query: np.ndarray) -> np.ndarray:
+        """List ids sorted by centroid similarity to the query, most similar first"""
+        return np.argsort(-(self.centroids @ query), kind="stable")
+
+
+def _as_float(vectors):
+    vectors = np.asarray(vectors)
+    return vectors if vectors.dtype == np.float32 else vectors.astype(np.float64)
+
+
+def _spherical_kmeans(sample, n_lists, n_iter, rng):
+    """k-means on the unit sphere: assign by dot product, renormalize the means"""
+    centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        sums = np.stack(
+            [np.bincount(assignments, weights=column, minlength=n_lists) for column in sample.T],
+            axis=1,
+        )
+        norms = np.linalg.norm(sums, axis=1)
+
+        # Re-seed empty lists with random sample vectors
+        empty = norms == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+            norms[empty] = np.linalg.norm(sums[empty], axis=1)
+
+        centroids = sums / np.where(norms == 0, 1.0, norms)[:, None]
+
+    return centroids
+
+
+def _assign(vectors, centroids):
+    """Index of the most similar centroid for every vector"""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = vectors[start:start + ASSIGN_BLOCK_ROWS]
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
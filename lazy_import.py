@@ -0,0 +1,30 @@
+"""
+Deferred imports for heavy dependencies
+Keeps `import recommender` cheap: numpy/pandas load on first attribute access
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """
+    Return the top-level module `name` without executing it yet
+
+    The module is registered in sys.modules and executed the first time one of
+    its attributes is used. An already imported module is returned as is.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
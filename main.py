@@ -1,4 +1,3 @@
-import pandas
 from recommender import Recommender
 
 def main():
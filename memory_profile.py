@@ -0,0 +1,279 @@
+"""
+Opt-in memory profiling of pipeline phases, with an optional memory budget
+
+Pass a MemoryProfile to the evaluation pipeline (or time your own code with
+phase()) to record, per phase: peak and final RSS, the Python-level peak
+traced by tracemalloc, and the code that allocated the memory still held when
+the phase ends:
+
+    profile = MemoryProfile(budget_mb=1500)
+    with profile.phase("recommender build"):
+        recommender = Recommender()
+    evaluate(recommender, memory_profile=profile)
+    print(profile.format())
+
+A phase whose peak RSS exceeds budget_mb raises MemoryBudgetExceeded when it
+ends, with the report of every phase so far. The check runs when the phase
+ends, so the budget should sit below the container's hard limit.
+
+Phases may nest; a phase's numbers include those of the phases inside it.
+Peak RSS is per phase on Linux (VmHWM, reset through /proc/self/clear_refs);
+elsewhere it is the peak of the process so far. Worker processes are only
+seen through the largest peak RSS of any finished child process. Windows has
+no resource module: RSS comes from psutil when it is installed, else it is
+reported as 0 (the tracemalloc numbers still work).
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+from contextlib import nullcontext
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
+# Frames kept per traced allocation, to find the calling repository code
+TRACE_FRAMES = 16
+
+# Allocation sites holding less are not reported
+MIN_SITE_BYTES = 64 << 10
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """A phase's peak RSS went over MemoryProfile.budget_mb"""
+
+    def __init__(self, phase: str, peak_rss_mb: float, budget_mb: float, report: str) -> None:
+        super().__init__(
+            f"Phase {phase!r} peaked at {peak_rss_mb:.1f} MB RSS, over the {budget_mb:g} MB budget\n{report}"
+        )
+        self.phase = phase
+        self.peak_rss_mb = peak_rss_mb
+        self.budget_mb = budget_mb
+
+
+class MemoryProfile:
+    enabled = True
+
+    def __init__(self, budget_mb: float | None = None, top_sites: int = 10, trace_frames: int = TRACE_FRAMES) -> None:
+        """
+        Args:
+            budget_mb: Largest allowed peak RSS of a phase, None for no limit
+            top_sites: Allocation sites reported per phase
+            trace_frames: Frames tracemalloc keeps per allocation; more find
+                          the repository code behind deeper library calls
+        """
+        self.budget_mb = budget_mb
+        self.top_sites = top_sites
+        self.trace_frames = trace_frames
+        # One dict per phase in the order they started, None while a phase runs
+        self.phases: list[dict | None] = []
+        self._open: list[_Phase] = []
+        self._started_tracing = False
+
+    def phase(self, name: str) -> "_Phase":
+        """Context manager profiling one phase"""
+        return _Phase(self, name)
+
+    def report(self) -> dict:
+        return {"budget_mb": self.budget_mb, "phases": [phase for phase in self.phases if phase is not None]}
+
+    def dump(self, path: str) -> None:
+        """Write report() as JSON"""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def format(self) -> str:
+        """Human-readable table of the phases and their top allocation sites"""
+        lines = [
+            f"{'phase':<28} {'seconds':>8} {'peak RSS':>9} {'RSS end':>8} {'RSS +':>8} "
+            f"{'py peak':>8} {'py +':>8}  (MB)"
+        ]
+        phases = self.report()["phases"]
+        for phase in phases:
+            name = "  " * phase["depth"] + phase["name"]
+            lines.append(
+                f"{name:<28} {phase['seconds']:>8.2f} {phase['peak_rss_mb']:>9.1f} "
+                f"{phase['rss_end_mb']:>8.1f} {phase['rss_end_mb'] - phase['rss_start_mb']:>+8.1f} "
+                f"{phase['traced_peak_mb']:>8.1f} {phase['traced_growth_mb']:>+8.1f}"
+            )
+            if phase.get("workers_peak_rss_mb"):
+                lines.append(f"  worker processes peaked at {phase['workers_peak_rss_mb']:.1f} MB RSS")
+        for phase in phases:
+            if phase["top_sites"]:
+                lines.append("")
+                lines.append(f"{phase['name']}: memory still held at the end, by allocation site")
+                for site in phase["top_sites"]:
+                    lines.append(f"  {site['size_mb']:>+9.1f} MB {site['count']:>+9} blocks  {site['site']}")
+        if self.budget_mb is not None:
+            lines.append("")
+            lines.append(f"budget: {self.budget_mb:g} MB peak RSS per phase")
+        return "\n".join(lines)
+
+    def _fold_peaks(self):
+        # Credit the peaks since the last reset to every open phase, then reset
+        # them so that a phase starting now measures only its own peak
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        rss_peak = _peak_rss()
+        for phase in self._open:
+            phase.traced_peak = max(phase.traced_peak, traced_peak)
+            phase.rss_peak = max(phase.rss_peak, rss_peak)
+        tracemalloc.reset_peak()
+        _reset_peak_rss()
+
+    def _site(self, traceback):
+        # Innermost frame in this repository, else the innermost frame
+        for frame in reversed(traceback):
+            if frame.filename.startswith(REPO_DIR) and frame.filename != __file__:
+                return f"{os.path.relpath(frame.filename, REPO_DIR)}:{frame.lineno}"
+        frame = traceback[-1]
+        return f"{frame.filename}:{frame.lineno}"
+
+    def _top_sites(self, start, end):
+        sites = {}
+        # Snapshot.filter_traces is too slow for catalogs of Python objects:
+        # the profiler's own allocations are dropped per traceback instead
+        for stat in end.compare_to(start, "traceback"):
+            if stat.traceback[-1].filename in (__file__, tracemalloc.__file__):
+                continue
+            site = self._site(stat.traceback)
+            size, count = sites.get(site, (0, 0))
+            sites[site] = (size + stat.size_diff, count + stat.count_diff)
+        top = sorted(sites.items(), key=lambda item: -item[1][0])[:self.top_sites]
+        return [
+            {"site": site, "size_mb": size / (1 << 20), "count": count}
+            for site, (size, count) in top
+            if size >= MIN_SITE_BYTES
+        ]
+
+
+class _NullMemoryProfile:
+    """Disabled profiling: phase() does nothing"""
+
+    enabled = False
+    _context = nullcontext()
+
+    def phase(self, name):
+        return self._context
+
+
+NULL_MEMORY_PROFILE = _NullMemoryProfile()
+
+
+class _Phase:
+    def __init__(self, profile: MemoryProfile, name: str) -> None:
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self) -> None:
+        profile = self.profile
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(profile.trace_frames)
+            profile._started_tracing = True
+        # Before the measurements start: the snapshot itself takes memory
+        self.snapshot = tracemalloc.take_snapshot()
+        profile._fold_peaks()
+        self.depth = len(profile._open)
+        self.index = len(profile.phases)
+        profile._open.append(self)
+        profile.phases.append(None)
+
+        self.traced_peak = 0
+        self.rss_peak = 0
+        self.rss_start = _current_rss()
+        self.workers_peak_start = _workers_peak_rss()
+        self.traced_start = tracemalloc.get_traced_memory()[0]
+        self.start = perf_counter()
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        profile = self.profile
+        seconds = perf_counter() - self.start
+        profile._fold_peaks()
+        profile._open.remove(self)
+        rss_end = _current_rss()
+        traced_end = tracemalloc.get_traced_memory()[0]
+        workers_peak = _workers_peak_rss()
+
+        end = tracemalloc.take_snapshot()
+        result = {
+            "name": self.name,
+            "depth": self.depth,
+            "seconds": seconds,
+            "peak_rss_mb": self.rss_peak / (1 << 20),
+            "rss_start_mb": self.rss_start / (1 << 20),
+            "rss_end_mb": rss_end / (1 << 20),
+            "traced_peak_mb": self.traced_peak / (1 << 20),
+            "traced_growth_mb": (traced_end - self.traced_start) / (1 << 20),
+            "workers_peak_rss_mb": workers_peak / (1 << 20) if workers_peak > self.workers_peak_start else None,
+            "top_sites": profile._top_sites(self.snapshot, end),
+        }
+        self.snapshot = None
+        profile.phases[self.index] = result
+
+        if not profile._open and profile._started_tracing:
+            tracemalloc.stop()
+            profile._started_tracing = False
+
+        peak_mb = max(result["peak_rss_mb"], result["workers_peak_rss_mb"] or 0)
+        if exc_type is None and profile.budget_mb is not None and peak_mb > profile.budget_mb:
+            raise MemoryBudgetExceeded(self.name, peak_mb, profile.budget_mb, profile.format())
+
+
+def _proc_status_bytes(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _max_rss_bytes(children=False):
+    if resource is None:
+        return 0 if children else _psutil_rss(peak=True)
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _psutil_rss(peak=False):
+    try:
+        import psutil
+    except ImportError:
+        return 0
+    info = psutil.Process().memory_info()
+    # peak_wset: peak working set, Windows only
+    return getattr(info, "peak_wset", info.rss) if peak else info.rss
+
+
+def _current_rss():
+    rss = _proc_status_bytes("VmRSS:")
+    if rss is not None:
+        return rss
+    return _psutil_rss() if resource is None else _max_rss_bytes()
+
+
+def _peak_rss():
+    peak = _proc_status_bytes("VmHWM:")
+    return peak if peak is not None else _max_rss_bytes()
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _workers_peak_rss():
+    return _max_rss_bytes(children=True)
@@ -0,0 +1,209 @@
+"""
+Incremental playlist profile for listening sessions that grow one track at a time
+
+Recommender.get_recommendations rebuilds the playlist profile from every
+input track on each call. A PlaylistSession keeps it up to date instead:
+appending or removing a track costs O(1) however long the playlist is (only
+removing one of the three trend-window tracks rescans the playlist's rows).
+
+    session = PlaylistSession(recommender, ["track_a", "track_b"])
+    session.append("track_c")
+    session.get_recommendations(5, {"Artist"})
+    session.remove("track_a")
+
+The profile is the one Recommender._playlist_profile computes for the same
+tracks:
+    - clustering columns: mean and exp(-k * std) from running sums and sums
+      of squares, kept as exact integers (no drift after removals) and rounded
+      once per query;
+    - trend-follower columns: rolling_next_value over the trailing window,
+      i.e. the three known tracks with the highest catalog rows, since the
+      stateless call orders its input tracks by catalog row.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+# Features are summed as integer multiples of 2**-_SCALE_BITS, exact for every float64
+_SCALE_BITS = 1074
+
+
+class PlaylistSession:
+    def __init__(self, recommender, track_ids: list[str] = (), k: int = 5) -> None:
+        """
+        Args:
+            recommender: recommender.Recommender whose catalog the session queries
+            track_ids: Initial playlist
+            k: Decay of the clustering weight exp(-k * std), as in Recommender.cluster_weight
+        """
+        self.recommender = recommender
+        self.k = k
+        # track_id -> occurrences in the playlist, in first-appended order
+        self._track_counts: dict[str, int] = {}
+        for track_id in track_ids:
+            self._track_counts[track_id] = self._track_counts.get(track_id, 0) + 1
+        self._feature_matrix = None
+
+    def __len__(self) -> int:
+        return sum(self._track_counts.values())
+
+    @property
+    def track_ids(self) -> list[str]:
+        """Distinct tracks of the playlist, in first-appended order"""
+        return list(self._track_counts)
+
+    def append(self, track_id: str) -> None:
+        """Add a track; IDs missing from the catalog are kept but do not affect the profile"""
+        self._sync()
+        count = self._track_counts.get(track_id, 0)
+        self._track_counts[track_id] = count + 1
+        if count == 0:
+            row = self._find_row(track_id)
+            self._rows[track_id] = row
+            if row >= 0:
+                self._add_row(row)
+
+    def remove(self, track_id: str) -> None:
+        """
+        Remove one occurrence of a track
+
+        Raises:
+            ValueError: The track is not in the playlist
+        """
+        count = self._track_counts.get(track_id, 0)
+        if count == 0:
+            raise ValueError(f"{track_id!r} is not in the playlist")
+        self._sync()
+        if count > 1:
+            self._track_counts[track_id] = count - 1
+            return
+
+        del self._track_counts[track_id]
+        row = self._rows.pop(track_id)
+        if row >= 0:
+            self._remove_row(row)
+
+    def profile(self) -> tuple[np.ndarray, np.ndarray]:
+        """(values, weights) per feature column, as Recommender._playlist_profile"""
+        self._sync()
+        recommender = self.recommender
+        n_rows = len(self._input_rows)
+        if n_rows == 0:
+            return recommender._playlist_profile(np.empty(0, dtype=np.intp))
+
+        n_clustering = len(recommender.clustering_columns)
+        n_trend = len(recommender.trend_follower_columns)
+        values = np.ones(len(recommender.feature_columns))
+        weights = np.full(len(recommender.feature_columns), 0.4)
+
+        # Rounded to the storage type, like np.mean/np.std over the stored features
+        dtype = self._feature_matrix.dtype.type
+        for j in range(n_clustering):
+            total, square_total = self._sums[j], self._square_sums[j]
+            mean = total / (n_rows << _SCALE_BITS)
+            variance = (n_rows * square_total - total * total) / (n_rows * n_rows << 2 * _SCALE_BITS)
+            values[j] = dtype(mean)
+            weights[j] = np.exp(-self.k * dtype(math.sqrt(variance)))
+
+        window = self._feature_matrix[self._window]
+        for j in range(n_clustering, n_clustering + n_trend):
+            values[j] = recommender.rolling_next_value(window[:, j])
+            weights[j] = 0.3
+
+        return values, weights
+
+    def get_recommendations(self, n_recommendations: int, target_artist: set[str]) -> list[str]:
+        """
+        Recommendations for the current playlist, as
+        recommender.get_recommendations(playlist, n_recommendations, target_artist)
+        """
+        recommender = self.recommender
+        recommender._poll_shared_catalog()
+        recommender._refresh_scaling()
+        cache = recommender.result_cache
+        if cache is None:
+            return self._recommend(n_recommendations, target_artist)[0]
+
+        # The ranking only depends on the set of tracks, not their order or count
+        key = cache.make_key(self._track_counts, target_artist, recommender.fallback_seed)
+        ranking = cache.get(key, n_recommendations)
+        if ranking is not None:
+            recommender.instrumentation.count("cache_hits")
+            return ranking
+
+        ranking, sliceable = self._recommend(n_recommendations, target_artist)
+        cache.put(key, n_recommendations, ranking, sliceable)
+        return ranking
+
+    def _recommend(self, n_recommendations, target_artist):
+        # (ranking, sliceable) as Recommender._recommend
+        recommender = self.recommender
+        recommender.instrumentation.count("queries")
+        with recommender.instrumentation.stage("profile"):
+            self._sync()
+            input_rows = np.fromiter(self._input_rows, dtype=np.intp, count=len(self._input_rows))
+            if len(input_rows) == 0:
+                return recommender._fallback(n_recommendations, target_artist, input_rows)
+            values, weights = self.profile()
+
+        candidate_rows = recommender._candidate_rows(target_artist, input_rows)
+        if len(candidate_rows) == 0:
+            return recommender._fallback(n_recommendations, target_artist, input_rows)
+
+        return recommender._rank_candidates(candidate_rows, values, weights, n_recommendations), True
+
+    def _sync(self):
+        """Rebuild the running state if the catalog changed since it was computed"""
+        if self.recommender.feature_matrix is self._feature_matrix:
+            return
+        # Catalog updates and rescaling replace the feature matrix (rows may move)
+        self._feature_matrix = self.recommender.feature_matrix
+        n_clustering = len(self.recommender.clustering_columns)
+        self._sums = [0] * n_clustering
+        self._square_sums = [0] * n_clustering
+        # Catalog rows of the known tracks
+        self._input_rows: set[int] = set()
+        # Up to three highest rows, ascending: the trend-follower window
+        self._window: list[int] = []
+
+        track_ids = list(self._track_counts)
+        rows = self.recommender.track_ids.find(track_ids) if track_ids else []
+        self._rows = dict(zip(track_ids, (int(row) for row in rows)))
+        for row in self._rows.values():
+            if row >= 0:
+                self._add_row(row)
+
+    def _find_row(self, track_id):
+        return int(self.recommender.track_ids.find([track_id])[0])
+
+    def _add_row(self, row):
+        self._input_rows.add(row)
+        for j, value in enumerate(self._clustering_values(row)):
+            self._sums[j] += value
+            self._square_sums[j] += value * value
+
+        if len(self._window) < 3 or row > self._window[0]:
+            self._window = sorted(self._window + [row])[-3:]
+
+    def _remove_row(self, row):
+        self._input_rows.discard(row)
+        for j, value in enumerate(self._clustering_values(row)):
+            self._sums[j] -= value
+            self._square_sums[j] -= value * value
+
+        if row in self._window:
+            # The next highest row is only known by a scan of the playlist
+            self._window = sorted(heapq.nlargest(3, self._input_rows))
+
+    def _clustering_values(self, row):
+        # Exact integer multiples of 2**-_SCALE_BITS
+        n_clustering = len(self.recommender.clustering_columns)
+        for value in self._feature_matrix[row, :n_clustering].tolist():
+            numerator, denominator = value.as_integer_ratio()
+            yield numerator << (_SCALE_BITS - denominator.bit_length() + 1)
@@ -1,8 +1,20 @@
-from evaluation import evaluate
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
+from __future__ import annotations
+
+from time import monotonic
+
+from lazy_import import lazy_import
+from artist_index import ArtistIndex
+from catalog_build import BuildSteps
+from fallback_tiers import FallbackTiers
+from weighted_knn import weighted_euclidean_topk
+from catalog_cache import DEFAULT_CACHE_DIR, ensure_snapshot, load_arrays, load_frame
+from instrumentation import NULL_INSTRUMENTATION
+from result_cache import ResultCache
+from string_table import StringTable
+import shared_catalog
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
 
 
 class Recommender:
@@ -19,17 +31,372 @@ class Recommender:
 
     custom_columns = ["popularity"]
 
-    def __init__(self) -> None:
-        self.df = pd.read_csv("dataset.csv")
-        self.df["artists"] = self.df["artists"].str.split(";")
-        self.df = self.df.dropna(subset=["artists", "track_name"])
-        self.df = self.df.drop_duplicates(subset=["track_id"], keep="first")
-        self.df = self.df.reset_index(drop=True)
+    # Attributes set by warm_up(); touching one on a lazy instance loads the catalog
+    catalog_attributes = frozenset(
+        ["df", "feature_matrix", "raw_features", "track_ids", "artist_index", "fallback_tiers"]
+    )
+
+    def __init__(
+        self,
+        dataset_path: str = "dataset.csv",
+        cache_dir: str | None = DEFAULT_CACHE_DIR,
+        lazy: bool = False,
+        feature_dtype: str = "float32",
+        shared_catalog_dir: str | None = None,
+        build_workers: int | None = None,
+    ) -> None:
+        """
+        Load the catalog, from a preprocessed snapshot when one is up to date
+
+        Args:
+            dataset_path: Path to the tracks CSV
+            cache_dir: Snapshot directory (see catalog_cache), None to always rebuild
+            lazy: Defer loading to the first query or an explicit warm_up()
+            feature_dtype: Storage type of the feature matrix; distances are
+                           still computed in float64
+            shared_catalog_dir: Attach to the catalog published there with
+                                publish_catalog() instead of loading dataset_path
+                                (see shared_catalog); queries switch to a newly
+                                published version within catalog_poll_s seconds
+            build_workers: Threads for the independent steps of a catalog build
+                           from the CSV, None for catalog_build.DEFAULT_BUILD_WORKERS
+        """
+        self.dataset_path = dataset_path
+        self.cache_dir = cache_dir
+        self.feature_dtype = feature_dtype
+        self.shared_catalog_dir = shared_catalog_dir
+        self.build_workers = build_workers
+        # Seconds per step of the last catalog build from the CSV (see catalog_build)
+        self.build_timings: dict[str, float] = {}
+        # Seconds between checks for a newly published shared catalog
+        self.catalog_poll_s = 1.0
+        self._catalog_version = None
+        self._catalog_polled = monotonic()
+
+        # Replace with an instrumentation.Instrumentation to collect stage timings
+        self.instrumentation = NULL_INSTRUMENTATION
+        # Replace with a result_cache.ResultCache to serve repeated queries from memory
+        self.result_cache: ResultCache | None = None
+        # Fallback tracks: None takes the most popular of each tier, an int
+        # samples each tier at random with that seed (see fallback_tiers)
+        self.fallback_seed: int | None = None
+
+        # Min-max bounds of the scaled columns, computed on the first catalog update
+        self._scale_bounds = None
+        # True when an update moved a bound and the scaled columns must be recomputed
+        self._scaling_stale = False
+
+        if not lazy:
+            self.warm_up()
+
+    def __getattr__(self, name):
+        # Only called for missing attributes, i.e. catalog data not loaded yet
+        if name in type(self).catalog_attributes and "dataset_path" in self.__dict__:
+            self.warm_up()
+            if name == "df" and "df" not in self.__dict__:
+                # Track metadata is only needed by catalog updates
+                self.df = load_frame(self._snapshot_path, categorical=True)
+            if name == "fallback_tiers" and "fallback_tiers" not in self.__dict__:
+                # Dropped by a catalog update; rebuilt on the next fallback
+                self.fallback_tiers = self._fallback_tiers(self.df, self.artist_index)
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def is_warm(self) -> bool:
+        return "feature_matrix" in self.__dict__
+
+    def warm_up(self) -> "Recommender":
+        """Load the catalog now (no-op when already loaded); returns self"""
+        if self.is_warm:
+            return self
+
+        if self.shared_catalog_dir is not None:
+            # Zero-copy: the arrays are mappings of the published files
+            self._catalog_version, self._snapshot_path = shared_catalog.attach(
+                self.shared_catalog_dir, "recommender"
+            )
+            arrays = load_arrays(self._snapshot_path)
+        elif self.cache_dir is None:
+            self.df, arrays = self._build_catalog(self.dataset_path)
+        else:
+            # The DataFrame is loaded from the snapshot on first access of self.df
+            self._snapshot_path = ensure_snapshot(
+                "recommender",
+                self.dataset_path,
+                self._catalog_config(),
+                lambda: self._build_catalog(self.dataset_path),
+                self.cache_dir,
+            )
+            arrays = load_arrays(self._snapshot_path)
+
+        self.raw_features = arrays["raw_features"]
+        self.track_ids = StringTable.from_arrays(arrays["track_id_data"], arrays["track_id_order"])
+        self.artist_index = ArtistIndex.from_arrays(arrays, len(self.track_ids))
+        self.fallback_tiers = FallbackTiers.from_arrays(arrays, self.artist_index)
+        # Set last: is_warm checks for feature_matrix
+        self.feature_matrix = arrays["feature_matrix"]
+        return self
+
+    @classmethod
+    def publish_catalog(
+        cls,
+        shared_catalog_dir: str,
+        dataset_path: str = "dataset.csv",
+        feature_dtype: str = "float32",
+        build_workers: int | None = None,
+    ) -> str:
+        """
+        Build the catalog of dataset_path and publish it for shared_catalog_dir workers
+
+        Returns:
+            Name of the published version
+        """
+        builder = cls(dataset_path, cache_dir=None, lazy=True, feature_dtype=feature_dtype, build_workers=build_workers)
+        return shared_catalog.publish(
+            shared_catalog_dir,
+            "recommender",
+            dataset_path,
+            builder._catalog_config(),
+            lambda: builder._build_catalog(dataset_path),
+        )
+
+    def refresh_catalog(self) -> bool:
+        """
+        Switch to the current version of the shared catalog if a new one was published
+
+        Local catalog updates (add_tracks, ...) are dropped by a switch.
+
+        Returns:
+            True if the catalog was switched
+        """
+        self._catalog_polled = monotonic()
+        if self.shared_catalog_dir is None or not self.is_warm:
+            return False
+        version = shared_catalog.current_version(self.shared_catalog_dir, "recommender")
+        if version is None or version == self._catalog_version:
+            return False
+
+        for name in type(self).catalog_attributes:
+            self.__dict__.pop(name, None)
+        self._scale_bounds = None
+        self._scaling_stale = False
+        self._catalog_changed()
+        self.warm_up()
+        return True
+
+    def _poll_shared_catalog(self):
+        if self.shared_catalog_dir is not None and monotonic() - self._catalog_polled >= self.catalog_poll_s:
+            self.refresh_catalog()
+
+    def _catalog_config(self) -> dict:
+        return {
+            "clustering_columns": self.clustering_columns,
+            "trend_follower_columns": self.trend_follower_columns,
+            "custom_columns": self.custom_columns,
+            "extras": ["raw_features", "track_id_table", "artist_table", "fallback_tiers"],
+            "feature_dtype": self.feature_dtype,
+        }
+
+    def _build_catalog(self, dataset_path):
+        with BuildSteps(self.build_workers) as steps:
+            df = steps.run("read_csv", pd.read_csv, dataset_path)
+            df = steps.run("clean", self._clean_tracks, df)
+
+            # On the pool while the features are scaled (the Series are taken now,
+            # before scaling replaces columns of df)
+            track_ids = steps.submit("track_ids", StringTable, df["track_id"])
+            artist_index = steps.submit("artist_index", ArtistIndex, df["artists"])
+
+            raw_features, feature_matrix = steps.run("features", self._scaled_features, df)
+            artist_index = artist_index.result()
+            fallback_tiers = steps.run("fallback_tiers", self._fallback_tiers, df, artist_index)
+            track_ids = track_ids.result()
+        self.build_timings = steps.timings
+
+        arrays = {
+            "feature_matrix": feature_matrix,
+            "raw_features": raw_features,
+            "track_id_data": track_ids.data,
+            "track_id_order": track_ids.order,
+            **artist_index.to_arrays(),
+            **fallback_tiers.to_arrays(),
+        }
+        return df, arrays
+
+    def _scaled_features(self, df):
+        # (unscaled values, kept so updates can rescale when a bound moves; feature matrix)
+        raw_features = df[self.scaled_columns].to_numpy(dtype=np.float64)
+        self._scale_tracks(df, raw_features, min_max_bounds(raw_features))
+        return raw_features, df[self.feature_columns].to_numpy(dtype=self.feature_dtype)
+
+    @staticmethod
+    def _fallback_tiers(tracks, artist_index):
+        # Popularity ranking per catalog, genre and artist (scaled popularity keeps the order)
+        return FallbackTiers(tracks["popularity"].to_numpy(), pd.factorize(tracks["track_genre"])[0], artist_index)
+
+    @staticmethod
+    def _clean_tracks(tracks):
+        # Rows as they would survive CSV preprocessing
+        tracks = tracks.copy()
+        tracks["artists"] = tracks["artists"].str.split(";")
+        tracks = tracks.dropna(subset=["artists", "track_name"])
+        tracks = tracks.drop_duplicates(subset=["track_id"], keep="first")
+        return tracks.reset_index(drop=True)
+
+    def _scale_tracks(self, tracks, raw_features, bounds):
+        # In place: popularity to [0, 1], min-max scaling of the other feature columns
+        tracks["popularity"] = tracks["popularity"] / 100.0
+        scaled = min_max_scale(raw_features, *bounds)
+        for j, column in enumerate(self.scaled_columns):
+            tracks[column] = scaled[:, j]
+
+    def add_tracks(self, tracks: pd.DataFrame) -> int:
+        """
+        Append tracks to the catalog without rebuilding it
+
+        Rows are preprocessed like dataset.csv rows; tracks already in the
+        catalog are skipped (a rebuild keeps the first occurrence). If a new
+        value lies outside a column's min-max bounds, every row of the scaled
+        columns is rescaled before the next query.
+
+        Args:
+            tracks: DataFrame with the columns of dataset.csv
+
+        Returns:
+            Number of tracks added
+        """
+        bounds = self._current_scale_bounds()
+        tracks = self._clean_tracks(tracks)
+        tracks = tracks[self.track_ids.find(tracks["track_id"]) < 0].reset_index(drop=True)
+        if len(tracks) == 0:
+            return 0
+
+        raw_features = tracks[self.scaled_columns].to_numpy(dtype=np.float64)
+        self._move_scale_bounds(
+            (np.fmin(bounds[0], np.nanmin(raw_features, axis=0)),
+             np.fmax(bounds[1], np.nanmax(raw_features, axis=0)))
+        )
+        self._scale_tracks(tracks, raw_features, self._scale_bounds)
+
+        self.df = pd.concat([self.df, tracks], ignore_index=True)
+        self.raw_features = np.concatenate([self.raw_features, raw_features])
+        self.feature_matrix = np.concatenate(
+            [self.feature_matrix, tracks[self.feature_columns].to_numpy(dtype=self.feature_matrix.dtype)]
+        )
+        self.track_ids.append(tracks["track_id"])
+        self.artist_index.add_rows(tracks["artists"])
+
+        self._catalog_changed()
+        return len(tracks)
+
+    def remove_tracks(self, track_ids: list[str]) -> int:
+        """
+        Remove tracks from the catalog; unknown IDs are ignored
+
+        The remaining rows keep their relative order, as in a rebuild from a
+        CSV without the removed rows.
 
-        self.df["popularity"] = self.df["popularity"] / 100.0
+        Returns:
+            Number of tracks removed
+        """
+        bounds = self._current_scale_bounds()
+        rows = self.track_ids.find(track_ids)
+        rows = np.unique(rows[rows >= 0])
+        if len(rows) == 0:
+            return 0
+
+        removed_raw = self.raw_features[rows]
+        keep = np.ones(len(self.df), dtype=bool)
+        keep[rows] = False
+
+        self.df = self.df[keep].reset_index(drop=True)
+        self.raw_features = self.raw_features[keep]
+        self.feature_matrix = self.feature_matrix[keep]
+        self.track_ids.remove_rows(rows)
+        self.artist_index.remove_rows(rows)
+
+        # Bounds can only shrink if a removed value sat on one
+        if np.any((removed_raw == bounds[0]) | (removed_raw == bounds[1])):
+            self._move_scale_bounds(min_max_bounds(self.raw_features))
+
+        self._catalog_changed()
+        return len(rows)
+
+    def update_tracks(self, tracks: pd.DataFrame) -> int:
+        """
+        Replace catalog tracks in place, matched by track_id; unknown IDs are ignored
 
-        for column in self.clustering_columns + self.trend_follower_columns:
-            self.df[column] = MinMaxScaler().fit_transform(self.df[[column]])
+        Args:
+            tracks: DataFrame with the columns of dataset.csv
+
+        Returns:
+            Number of tracks updated
+        """
+        bounds = self._current_scale_bounds()
+        tracks = self._clean_tracks(tracks)
+        rows = self.track_ids.find(tracks["track_id"])
+        tracks = tracks[rows >= 0].reset_index(drop=True)
+        rows = rows[rows >= 0]
+        if len(tracks) == 0:
+            return 0
+        old_raw = self.raw_features[rows]
+        raw_features = tracks[self.scaled_columns].to_numpy(dtype=np.float64)
+        self.raw_features = np.array(self.raw_features)
+        self.raw_features[rows] = raw_features
+
+        if np.any((old_raw == bounds[0]) | (old_raw == bounds[1])):
+            # A value on a bound changed: the bound may shrink
+            self._move_scale_bounds(min_max_bounds(self.raw_features))
+        else:
+            self._move_scale_bounds(
+                (np.fmin(bounds[0], np.nanmin(raw_features, axis=0)),
+                 np.fmax(bounds[1], np.nanmax(raw_features, axis=0)))
+            )
+        self._scale_tracks(tracks, raw_features, self._scale_bounds)
+
+        df = self.df.copy()
+        for column in tracks.columns.intersection(df.columns):
+            values = df[column].to_numpy(copy=True)
+            values[rows] = tracks[column].to_numpy()
+            df[column] = values
+        self.df = df
+        self.feature_matrix = np.array(self.feature_matrix)
+        self.feature_matrix[rows] = tracks[self.feature_columns].to_numpy(dtype=self.feature_matrix.dtype)
+        self.artist_index.set_rows(rows, tracks["artists"])
+
+        self._catalog_changed()
+        return len(tracks)
+
+    def _current_scale_bounds(self):
+        if self._scale_bounds is None:
+            self._scale_bounds = min_max_bounds(self.raw_features)
+        return self._scale_bounds
+
+    def _move_scale_bounds(self, bounds):
+        # Lazy: the bulk rescale runs before the next query
+        if not all(np.array_equal(old, new) for old, new in zip(self._scale_bounds, bounds)):
+            self._scale_bounds = bounds
+            self._scaling_stale = True
+
+    def _refresh_scaling(self):
+        """Rescale every row after a min-max bound moved"""
+        if not self._scaling_stale:
+            return
+        scaled = min_max_scale(self.raw_features, *self._scale_bounds)
+        df = self.df.copy()
+        for j, column in enumerate(self.scaled_columns):
+            df[column] = scaled[:, j]
+        self.df = df
+        self.feature_matrix = np.array(self.feature_matrix)
+        # The scaled columns lead the feature matrix
+        self.feature_matrix[:, :len(self.scaled_columns)] = scaled
+        self._scaling_stale = False
+
+    def _catalog_changed(self):
+        self.__dict__.pop("fallback_tiers", None)
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
 
     def get_recommendations(
         self,
@@ -49,57 +416,208 @@ class Recommender:
             List of recommended track IDs of length n_recommendations
             The list should be ordered by relevance (most relevant first)
         """
-
-        playlist_clustering_df = pd.DataFrame(columns=["value", "weight"])
-        track_df = self.df[self.df["track_id"].isin(input_track_ids)]
-
-        for col in self.clustering_columns:
-            mean, weight = self.cluster_weight(track_df[col])
-            playlist_clustering_df.loc[col] = {"value": mean, "weight": weight}
-
-        for col in self.trend_follower_columns:
-            value = self.rolling_next_value(track_df[col].values)
-            playlist_clustering_df.loc[col] = {"value": value, "weight": 0.3}
-
-        for col in self.custom_columns:
-            playlist_clustering_df.loc[col] = {"value": 1, "weight": 0.4}
-
-        mask = self.df["artists"].apply(
-            lambda artists: bool(set(artists) & target_artist)
+        self._poll_shared_catalog()
+        self._refresh_scaling()
+        cache = self.result_cache
+        if cache is None:
+            return self._recommend(input_track_ids, n_recommendations, target_artist)[0]
+
+        key = cache.make_key(input_track_ids, target_artist, self.fallback_seed)
+        ranking = cache.get(key, n_recommendations)
+        if ranking is not None:
+            self.instrumentation.count("cache_hits")
+            return ranking
+
+        ranking, sliceable = self._recommend(input_track_ids, n_recommendations, target_artist)
+        cache.put(key, n_recommendations, ranking, sliceable)
+        return ranking
+
+    def _recommend(self, input_track_ids, n_recommendations, target_artist):
+        # (ranking, whether its first m items are the ranking for m recommendations)
+        self.instrumentation.count("queries")
+        with self.instrumentation.stage("profile"):
+            input_rows = self._input_rows(input_track_ids)
+            # Cold start: without known input tracks there is no profile to rank by
+            if len(input_rows) == 0:
+                return self._fallback(n_recommendations, target_artist, input_rows)
+            values, weights = self._playlist_profile(input_rows)
+
+        candidate_rows = self._candidate_rows(target_artist, input_rows)
+        if len(candidate_rows) == 0:
+            return self._fallback(n_recommendations, target_artist, input_rows)
+
+        ranking = self._rank_candidates(
+            candidate_rows, values, weights, n_recommendations
         )
-        possibility_df = self.df[mask]
+        return ranking, True
 
-        mask = possibility_df["track_id"].apply(
-            lambda track_id: bool(track_id not in input_track_ids)
-        )
-        possibility_df = possibility_df[mask]
-
-        if len(possibility_df) == 0:
-            # If no valid input tracks, return random recommendations
-            artist_songs = self.df[self.df["artists"].isin(target_artist)]
-            if len(artist_songs) >= n_recommendations:
-                return artist_songs.sample(n_recommendations)["track_id"].tolist()
-            return self.df.sample(n_recommendations)["track_id"].tolist()
-
-        model = self.weighted_knn_fit(
-            possibility_df[
-                self.clustering_columns
-                + self.trend_follower_columns
-                + self.custom_columns
-            ],
-            playlist_clustering_df["weight"],
-            n_recommendations,
-        )
+    def get_recommendations_batch(
+        self,
+        input_track_ids_list: list[list[str]],
+        n_recommendations: int,
+        target_artists: list[set[str]],
+    ) -> list[list[str]]:
+        """
+        Get recommendations for many playlists at once
 
-        distances, indices = self.query_weighted_knn(
-            model,
-            playlist_clustering_df["weight"],
-            playlist_clustering_df["value"],
-        )
+        The playlist profiles (clustering means, stds, weights and trend values)
+        are computed for the whole batch with NumPy reductions. Each result is
+        the same ranking get_recommendations returns for that playlist.
 
-        return possibility_df.iloc[indices]["track_id"].to_list()
+        Args:
+            input_track_ids_list: One list of input track IDs per playlist
+            n_recommendations: Integer specifying how many songs to recommend
+            target_artists: One set of target artist names per playlist
 
-        # return recommended_track_ids
+        Returns:
+            One list of recommended track IDs per playlist, in input order
+        """
+        self._poll_shared_catalog()
+        self._refresh_scaling()
+        cache = self.result_cache
+        if cache is None:
+            results = self._recommend_batch(input_track_ids_list, n_recommendations, target_artists)
+            return [ranking for ranking, _ in results]
+
+        keys = [
+            cache.make_key(track_ids, target_artist, self.fallback_seed)
+            for track_ids, target_artist in zip(input_track_ids_list, target_artists)
+        ]
+        results = [cache.get(key, n_recommendations) for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        self.instrumentation.count("cache_hits", len(results) - len(misses))
+
+        if misses:
+            rankings = self._recommend_batch(
+                [input_track_ids_list[i] for i in misses],
+                n_recommendations,
+                [target_artists[i] for i in misses],
+            )
+            for i, (ranking, sliceable) in zip(misses, rankings):
+                cache.put(keys[i], n_recommendations, ranking, sliceable)
+                results[i] = ranking
+
+        return results
+
+    def _recommend_batch(self, input_track_ids_list, n_recommendations, target_artists):
+        self.instrumentation.count("queries", len(input_track_ids_list))
+        with self.instrumentation.stage("batch_profile"):
+            input_rows = [self._input_rows(track_ids) for track_ids in input_track_ids_list]
+            values, weights = self._playlist_profiles(input_rows)
+
+        results = []
+        for i, (rows, target_artist) in enumerate(zip(input_rows, target_artists)):
+            candidate_rows = self._candidate_rows(target_artist, rows) if len(rows) else rows
+            if len(candidate_rows) == 0:
+                results.append(self._fallback(n_recommendations, target_artist, rows))
+                continue
+
+            ranking = self._rank_candidates(
+                candidate_rows, values[i], weights[i], n_recommendations
+            )
+            results.append((ranking, True))
+
+        return results
+
+    @property
+    def feature_columns(self) -> list[str]:
+        return self.clustering_columns + self.trend_follower_columns + self.custom_columns
+
+    @property
+    def scaled_columns(self) -> list[str]:
+        return self.clustering_columns + self.trend_follower_columns
+
+    def _input_rows(self, input_track_ids):
+        # Catalog rows of the known input tracks, in catalog order
+        rows = self.track_ids.find(input_track_ids)
+        return np.unique(rows[rows >= 0])
+
+    def _candidate_rows(self, target_artist, input_rows):
+        # Union of the target artists' postings minus the input tracks
+        with self.instrumentation.stage("artist_mask"):
+            candidate_rows = self.artist_index.rows_for(target_artist)
+        with self.instrumentation.stage("exclude_inputs"):
+            if len(input_rows):
+                candidate_rows = candidate_rows[~np.isin(candidate_rows, input_rows)]
+        self.instrumentation.observe("candidate_pool", len(candidate_rows))
+        return candidate_rows
+
+    def _playlist_profile(self, input_rows):
+        # Target value and weight per feature column for one playlist
+        features = self.feature_matrix[input_rows]
+        n_clustering = len(self.clustering_columns)
+        n_trend = len(self.trend_follower_columns)
+
+        values = np.ones(len(self.feature_columns))
+        weights = np.full(len(self.feature_columns), 0.4)
+
+        for j in range(n_clustering):
+            values[j], weights[j] = self.cluster_weight(features[:, j])
+
+        for j in range(n_clustering, n_clustering + n_trend):
+            values[j] = self.rolling_next_value(features[:, j])
+            weights[j] = 0.3
+
+        return values, weights
+
+    def _playlist_profiles(self, input_rows_list, k=5):
+        """
+        Vectorized _playlist_profile over a batch
+
+        Playlists are grouped by track count and stacked into a
+        (playlists, features, tracks) block, so every mean/std runs over one
+        contiguous row just like the per-playlist calls and gives identical values.
+        """
+        n_clustering = len(self.clustering_columns)
+        n_trend = len(self.trend_follower_columns)
+        trend = slice(n_clustering, n_clustering + n_trend)
+
+        values = np.ones((len(input_rows_list), len(self.feature_columns)))
+        weights = np.full((len(input_rows_list), len(self.feature_columns)), 0.4)
+        weights[:, trend] = 0.3
+
+        lengths = np.array([len(rows) for rows in input_rows_list], dtype=np.int64)
+        # Empty (cold-start) playlists keep the defaults: the caller falls back for them
+        for length in np.unique(lengths[lengths > 0]):
+            members = np.flatnonzero(lengths == length)
+            rows = np.stack([input_rows_list[i] for i in members]).reshape(len(members), length)
+            block = np.ascontiguousarray(self.feature_matrix[rows].transpose(0, 2, 1))
+
+            clustering = block[:, :n_clustering]
+            values[members, :n_clustering] = clustering.mean(axis=2)
+            weights[members, :n_clustering] = np.exp(-k * clustering.std(axis=2))
+
+            window = min(length, 3)
+            values[members, trend] = block[:, trend, length - window:].mean(axis=2)
+
+        return values, weights
+
+    def _rank_candidates(self, candidate_rows, values, weights, n_recommendations):
+        # Weighted Euclidean top-k over the candidate block, no model per query
+        with self.instrumentation.stage("knn"):
+            distances, indices = weighted_euclidean_topk(
+                self.feature_matrix[candidate_rows], values, weights, n_recommendations
+            )
+
+        with self.instrumentation.stage("lookup"):
+            return self.track_ids.lookup(candidate_rows[indices])
+
+    def _fallback(self, n_recommendations, target_artist, input_rows):
+        # No candidates by the target artists, or no known input tracks: tracks of
+        # the target artists, then of the input tracks' genres, then of the catalog
+        self.instrumentation.count("fallback")
+        with self.instrumentation.stage("fallback"):
+            tiers = self.fallback_tiers
+            rows = tiers.recommend(
+                n_recommendations,
+                artists=target_artist or (),
+                genres=tiers.genre_codes[input_rows],
+                exclude=input_rows,
+                seed=self.fallback_seed,
+            )
+            # Popularity order keeps the tracks for fewer recommendations as a
+            # prefix; a seeded sample for n tracks depends on n
+            return self.track_ids.lookup(rows), self.fallback_seed is None
 
     def cluster_weight(self, values, k=5):
         values = np.array(values)
@@ -108,38 +626,34 @@ class Recommender:
         weight = np.exp(-k * std)
         return mean, weight
 
-    def weighted_knn_fit(self, X, feature_weights, n_neighbors=5):
-        # Scale features by sqrt(weight)
-        # X_weighted = X * np.sqrt(feature_weights)
-        # model = NearestNeighbors(n_neighbors=n_neighbors, metric="euclidean")
-        # model.fit(X_weighted)
-        # return model
-
-        X_weighted = X.values * np.sqrt(feature_weights.values)
-
-        # print(x_weighted)
-
-        model = NearestNeighbors(n_neighbors=n_neighbors, metric="euclidean")
-        model.fit(X_weighted)
+    def rolling_next_value(self, series):
+        # Last value of a rolling mean: the mean of the trailing window
+        series = np.array(series)
+        window = min(len(series), 3)
 
-        return model
+        next_value = np.mean(series[len(series) - window:])
 
-    def query_weighted_knn(self, model: NearestNeighbors, feature_weights, query):
-        q_weighted = query * np.sqrt(feature_weights.values)
+        return next_value
 
-        distances, indices = model.kneighbors([q_weighted])
 
-        return distances[0], indices[0]
+def min_max_bounds(raw_features):
+    """Per-column (min, max), ignoring NaN"""
+    return np.nanmin(raw_features, axis=0), np.nanmax(raw_features, axis=0)
 
-    def rolling_next_value(self, series):
-        window = min(len(series), 3)
 
-        next_value = pd.Series(series).rolling(window).mean().iloc[-1]
+def min_max_scale(raw_features, data_min, data_max):
+    """Scale columns to [0, 1] with the same arithmetic as sklearn's MinMaxScaler"""
+    data_range = data_max - data_min
+    # Constant columns are left unscaled, like sklearn's _handle_zeros_in_scale
+    data_range = np.where(data_range < 10 * np.finfo(np.float64).eps, 1.0, data_range)
+    scale = 1.0 / data_range
+    return raw_features * scale + (0.0 - data_min * scale)
 
-        return next_value
 
+if __name__ == "__main__":
+    from evaluation import evaluate
 
-recommender = Recommender()
+    recommender = Recommender()
 
-results = evaluate(recommender)
-print(results)
+    results = evaluate(recommender)
+    print(results)
@@ -2,25 +2,37 @@ import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import NearestNeighbors
+from artist_index import ArtistIndex
+from catalog_build import BuildSteps
+from catalog_cache import DEFAULT_CACHE_DIR, ensure_snapshot, load_arrays, load_frame, load_or_build
+from fallback_tiers import FallbackTiers
+from ivf_index import IVFIndex
+from instrumentation import NULL_INSTRUMENTATION
+from string_table import StringTable
+from topk import top_k
 
 class Recommender:
 
-    def __init__(self):
-        """Initialize the recommender by loading and preprocessing data"""
-        print("Loading dataset...")
-        # Load dataset
-        self.df = pd.read_csv('dataset.csv')
-
-        # Handle missing values
-        self.df = self.df.dropna(subset=['artists', 'track_name'])
-
-        # Remove duplicate track_ids (keep first occurrence)
-        self.df = self.df.drop_duplicates(subset=['track_id'], keep='first')
-
-        # Reset index to ensure continuous indexing
-        self.df = self.df.reset_index(drop=True)
+    def __init__(self, dataset_path='dataset.csv', cache_dir=DEFAULT_CACHE_DIR,
+                 candidate_index='brute', n_lists=None, nprobe=64, feature_dtype='float32', build_workers=None):
+        """
+        Initialize the recommender by loading and preprocessing data
 
-        print(f"Dataset loaded: {len(self.df)} unique tracks")
+        Args:
+            dataset_path: Path to the tracks CSV
+            cache_dir: Snapshot directory (see catalog_cache), None to always rebuild
+            candidate_index: 'brute' scans the whole catalog for candidates,
+                             'ivf' uses an approximate IVFIndex (see ivf_index)
+            n_lists: IVF lists, default sqrt(number of tracks)
+            nprobe: IVF lists scanned per query; can be changed on the instance
+            feature_dtype: Storage type of the unit-norm feature matrix
+            build_workers: Threads for the independent steps of a catalog build
+                           from the CSV, None for catalog_build.DEFAULT_BUILD_WORKERS
+        """
+        self.feature_dtype = feature_dtype
+        self.build_workers = build_workers
+        # Seconds per step of the last catalog build from the CSV (see catalog_build)
+        self.build_timings = {}
 
         # Define audio features to use for similarity
         self.audio_features = [
@@ -29,14 +41,6 @@ class Recommender:
             'loudness', 'tempo'
         ]
 
-        # Normalize features that have different scales
-        print("Normalizing features...")
-        self.scaler_tempo = StandardScaler()
-        self.scaler_loudness = StandardScaler()
-
-        self.df['tempo_normalized'] = self.scaler_tempo.fit_transform(self.df[['tempo']])
-        self.df['loudness_normalized'] = self.scaler_loudness.fit_transform(self.df[['loudness']])
-
         # Create feature matrix for similarity calculation
         self.feature_cols = [
             'danceability', 'energy', 'valence', 'acousticness',
@@ -44,62 +48,322 @@ class Recommender:
             'loudness_normalized', 'tempo_normalized'
         ]
 
-        self.feature_matrix = self.df[self.feature_cols].values
+        print("Loading dataset...")
+        if cache_dir is None:
+            self.df, arrays = self._build_catalog(dataset_path)
+        else:
+            # Reuse the preprocessed snapshot when dataset.csv is unchanged
+            snapshot_path = ensure_snapshot(
+                'recommender_claude',
+                dataset_path,
+                {
+                    'feature_cols': self.feature_cols,
+                    'rerank_arrays': ['artist_table', 'genre_codes', 'fallback_tiers'],
+                    'track_id_table': True,
+                    'feature_dtype': self.feature_dtype,
+                },
+                lambda: self._build_catalog(dataset_path),
+                cache_dir
+            )
+            # Repeated strings (genre, album, ...) as categorical codes
+            self.df = load_frame(snapshot_path, categorical=True)
+            arrays = load_arrays(snapshot_path)
+
+        print(f"Dataset loaded: {len(self.df)} unique tracks")
+
+        self.feature_matrix = arrays['feature_matrix']
+        self.scaler_tempo = self._restore_scaler(arrays['scaler_stats'][0], len(self.df))
+        self.scaler_loudness = self._restore_scaler(arrays['scaler_stats'][1], len(self.df))
+
+        # Build KNN model for efficient similarity search
+        print("Building KNN index...")
+        self._fit_knn()
+
+        # Approximate candidate index, persisted next to the catalog snapshot
+        self.ivf_index = None
+        self.nprobe = nprobe
+        if candidate_index == 'ivf':
+            print("Building IVF index...")
+            self.ivf_index = self._load_ivf_index(dataset_path, cache_dir, n_lists)
+        elif candidate_index != 'brute':
+            raise ValueError(f"Unknown candidate_index: {candidate_index!r}")
+
+        # Track ID <-> row lookup
+        self.track_ids = StringTable.from_arrays(arrays['track_id_data'], arrays['track_id_order'])
+
+        # Columnar inputs of the re-ranker
+        self.artist_index = ArtistIndex.from_arrays(arrays, len(self.df))
+        self.genre_codes = arrays['genre_codes']
+        self.popularity_scores = self.df['popularity_score'].to_numpy(dtype=np.float64)
+
+        # Popularity-ranked tracks per catalog, genre and artist for cold-start queries
+        self.fallback_tiers = FallbackTiers.from_arrays(arrays, self.artist_index)
+
+        # Replace with an instrumentation.Instrumentation to collect stage timings
+        self.instrumentation = NULL_INSTRUMENTATION
+        # Replace with a result_cache.ResultCache to serve repeated queries from memory
+        self.result_cache = None
+        # Cold-start tracks: None takes the most popular of each tier, an int
+        # samples each tier at random with that seed (see fallback_tiers)
+        self.fallback_seed = None
+
+        # True after a catalog update until the features are renormalized
+        self._features_stale = False
+        # Genre name <-> genre code, from the first catalog update on (see _genre_ids)
+        self._genre_table = None
+
+        print("Recommender initialized successfully!")
+
+    def _build_catalog(self, dataset_path):
+        """Preprocess the CSV into the DataFrame and arrays stored in the snapshot"""
+        with BuildSteps(self.build_workers) as steps:
+            # Load dataset
+            df = steps.run('read_csv', pd.read_csv, dataset_path)
+            df = steps.run('clean', self._clean_tracks, df)
+
+            # On the pool while the features are normalized (which adds columns to df)
+            track_ids = steps.submit('track_ids', StringTable, df['track_id'])
+            # Parse artists for matching (names are stripped), all rows at once
+            artist_index = steps.submit('artist_index', ArtistIndex.from_joined, df['artists'].astype(str),
+                                        strip=True)
+            # Missing genres get code -1
+            genre_codes = steps.submit('genre_codes', lambda genres: pd.factorize(genres)[0].astype(np.int32),
+                                       df['track_genre'])
+
+            # Normalize features that have different scales
+            print("Normalizing features...")
+            feature_matrix, scaler_tempo, scaler_loudness = steps.run('features', self._normalize_features, df)
+
+            # Add popularity-normalized score for boosting
+            df['popularity_score'] = df['popularity'] / 100.0
+
+            artist_index, genre_codes = artist_index.result(), genre_codes.result()
+            fallback_tiers = steps.run('fallback_tiers', FallbackTiers, df['popularity'].to_numpy(), genre_codes,
+                                       artist_index)
+            track_ids = track_ids.result()
+        self.build_timings = steps.timings
+
+        arrays = {
+            'feature_matrix': feature_matrix,
+            'track_id_data': track_ids.data,
+            'track_id_order': track_ids.order,
+            **artist_index.to_arrays(),
+            'genre_codes': genre_codes,
+            **fallback_tiers.to_arrays(),
+            # (mean, variance) per scaler, in the order tempo, loudness
+            'scaler_stats': np.array([
+                [scaler_tempo.mean_[0], scaler_tempo.var_[0]],
+                [scaler_loudness.mean_[0], scaler_loudness.var_[0]],
+            ]),
+        }
+        return df, arrays
+
+    @staticmethod
+    def _clean_tracks(tracks):
+        """Drop rows without artists or name and repeated track_ids, like the CSV preprocessing"""
+        # Handle missing values
+        tracks = tracks.dropna(subset=['artists', 'track_name'])
+
+        # Remove duplicate track_ids (keep first occurrence)
+        tracks = tracks.drop_duplicates(subset=['track_id'], keep='first')
+
+        # Reset index to ensure continuous indexing
+        return tracks.reset_index(drop=True)
+
+    @staticmethod
+    def _artist_lists(artists):
+        return ([artist.strip() for artist in str(x).split(';')] for x in artists)
+
+    def _normalize_features(self, df):
+        """
+        Fit the tempo/loudness scalers on df, add the normalized columns to it
+        and return (unit-norm feature matrix, scaler_tempo, scaler_loudness)
+        """
+        scaler_tempo = StandardScaler()
+        scaler_loudness = StandardScaler()
+
+        df['tempo_normalized'] = scaler_tempo.fit_transform(df[['tempo']])
+        df['loudness_normalized'] = scaler_loudness.fit_transform(df[['loudness']])
+
+        feature_matrix = df[self.feature_cols].values
 
         # Handle any remaining NaN or Inf values
-        self.feature_matrix = np.nan_to_num(self.feature_matrix, nan=0.0, posinf=1.0, neginf=-1.0)
+        feature_matrix = np.nan_to_num(feature_matrix, nan=0.0, posinf=1.0, neginf=-1.0)
 
         # Normalize feature vectors to avoid issues with cosine distance
         # Add small epsilon to avoid division by zero
-        norms = np.linalg.norm(self.feature_matrix, axis=1, keepdims=True)
+        norms = np.linalg.norm(feature_matrix, axis=1, keepdims=True)
         norms = np.where(norms == 0, 1e-10, norms)  # Replace zero norms with small value
-        self.feature_matrix = self.feature_matrix / norms
+        feature_matrix = (feature_matrix / norms).astype(self.feature_dtype)
 
-        # Build KNN model for efficient similarity search
-        print("Building KNN index...")
-        # Use min_neighbors to handle edge cases
-        n_neighbors = min(500, len(self.df) - 1)
-        self.knn_model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine', algorithm='brute')
-        self.knn_model.fit(self.feature_matrix)
+        return feature_matrix, scaler_tempo, scaler_loudness
 
-        # Create lookup dictionaries
-        self.track_id_to_idx = {track_id: idx for idx, track_id in enumerate(self.df['track_id'])}
-        self.idx_to_track_id = {idx: track_id for track_id, idx in self.track_id_to_idx.items()}
+    def add_tracks(self, tracks):
+        """
+        Append tracks to the catalog without rebuilding it
 
-        # Parse artists into sets for matching
-        self.df['artist_set'] = self.df['artists'].apply(
-            lambda x: set(artist.strip() for artist in str(x).split(';'))
-        )
+        Rows are preprocessed like dataset.csv rows; tracks already in the
+        catalog are skipped (a rebuild keeps the first occurrence). Any change
+        moves the tempo/loudness mean and variance, so the features are
+        renormalized in one pass before the next query.
 
-        # Add popularity-normalized score for boosting
-        self.df['popularity_score'] = self.df['popularity'] / 100.0
+        Args:
+            tracks: DataFrame with the columns of dataset.csv
 
-        print("Recommender initialized successfully!")
+        Returns:
+            Number of tracks added
+        """
+        tracks = self._clean_tracks(tracks)
+        tracks = tracks[self.track_ids.find(tracks['track_id']) < 0].reset_index(drop=True)
+        if len(tracks) == 0:
+            return 0
+
+        tracks['popularity_score'] = tracks['popularity'] / 100.0
+        genre_codes = self._genre_ids(tracks['track_genre'])
+        self.df = pd.concat([self.df, tracks], ignore_index=True)
+        self.track_ids.append(tracks['track_id'])
+        self.artist_index.add_rows(self._artist_lists(tracks['artists']))
+        self.fallback_tiers.add_rows(self.df['popularity'].to_numpy(), genre_codes)
+        self._catalog_changed()
+        return len(tracks)
+
+    def remove_tracks(self, track_ids):
+        """
+        Remove tracks from the catalog; unknown IDs are ignored
 
-    def get_recommendations(self, input_track_ids: list[str], n_recommendations: int, target_artist: set[str]) -> list[str]:
+        The remaining rows keep their relative order, as in a rebuild from a
+        CSV without the removed rows.
+
+        Returns:
+            Number of tracks removed
         """
-        Get recommendations based on multiple input songs
+        rows = self.track_ids.find(track_ids)
+        rows = np.unique(rows[rows >= 0])
+        if len(rows) == 0:
+            return 0
+
+        # Genre codes outlive their last track, in case it comes back
+        self._genres()
+        keep = np.ones(len(self.df), dtype=bool)
+        keep[rows] = False
+        self.df = self.df[keep].reset_index(drop=True)
+        self.track_ids.remove_rows(rows)
+        self.artist_index.remove_rows(rows)
+        self.fallback_tiers.remove_rows(rows)
+        self._catalog_changed()
+        return len(rows)
+
+    def update_tracks(self, tracks):
+        """
+        Replace catalog tracks in place, matched by track_id; unknown IDs are ignored
 
         Args:
-            input_track_ids: List of track IDs to base recommendations on
-            n_recommendations: Integer specifying how many songs to recommend
-            target_artist: A set of artist names. This is a hint of which artists were removed from the playlist. You may use this set to recommend songs.
+            tracks: DataFrame with the columns of dataset.csv
 
         Returns:
-            List of recommended track IDs of length n_recommendations
-            The list should be ordered by relevance (most relevant first)
+            Number of tracks updated
         """
+        tracks = self._clean_tracks(tracks)
+        rows = self.track_ids.find(tracks['track_id'])
+        tracks = tracks[rows >= 0].reset_index(drop=True)
+        rows = rows[rows >= 0]
+        if len(tracks) == 0:
+            return 0
+
+        tracks['popularity_score'] = tracks['popularity'] / 100.0
+        genre_codes = self._genre_ids(tracks['track_genre'])
+        df = self.df.copy()
+        for column in tracks.columns.intersection(df.columns):
+            values = df[column].to_numpy(copy=True)
+            values[rows] = tracks[column].to_numpy()
+            df[column] = values
+        self.df = df
+        self.artist_index.set_rows(rows, self._artist_lists(tracks['artists']))
+        self.fallback_tiers.set_rows(rows, self.df['popularity'].to_numpy(), genre_codes)
+        self._catalog_changed()
+        return len(tracks)
+
+    def _genres(self):
+        """Genre name <-> genre code table, taken from the catalog at the first update"""
+        if self._genre_table is None:
+            # Codes are 0, 1, ... by first appearance until then (pd.factorize)
+            codes, first_rows = np.unique(self.genre_codes, return_index=True)
+            self._genre_table = StringTable(self.df['track_genre'].iloc[first_rows[codes >= 0]])
+        return self._genre_table
+
+    def _genre_ids(self, genres):
+        """
+        Genre codes of new or updated rows: -1 for none, the next unused codes for
+        new genres. Codes are never renumbered, unlike those of a rebuild
+        """
+        table = self._genres()
+        genres = genres.to_numpy(dtype=object)
+        known = pd.notna(genres)
+        found = table.find(genres[known])
+        new_codes, new_genres = pd.factorize(genres[known][found < 0])
+        found[found < 0] = new_codes + len(table)
+        table.append(new_genres)
+
+        codes = np.full(len(genres), -1, dtype=np.int32)
+        codes[known] = found
+        return codes
+
+    def _catalog_changed(self):
+        # track_ids, artist_index and fallback_tiers are updated in place
+        self.genre_codes = self.fallback_tiers.genre_codes
+        self._features_stale = True
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def _refresh_features(self):
+        """Renormalize the catalog and rebuild the search structures after updates"""
+        if not self._features_stale:
+            return
+
+        self.feature_matrix, self.scaler_tempo, self.scaler_loudness = self._normalize_features(self.df)
+        self.popularity_scores = self.df['popularity_score'].to_numpy(dtype=np.float64)
+
+        if self.ivf_index is not None:
+            # Keeps the trained centroids; rebuild the recommender to retrain them
+            self.ivf_index = IVFIndex.from_centroids(self.ivf_index.centroids, self.feature_matrix)
+            # Only searched without the IVF index (see nearest_candidates)
+            self.knn_model = None
+        else:
+            self._fit_knn()
+
+        self._features_stale = False
+
+    def _fit_knn(self):
+        # Use min_neighbors to handle edge cases
+        n_neighbors = min(500, len(self.df) - 1)
+        self.knn_model = NearestNeighbors(n_neighbors=n_neighbors, metric='cosine', algorithm='brute')
+        self.knn_model.fit(self.feature_matrix)
 
-        # Get indices of input tracks
-        input_indices = []
-        for track_id in input_track_ids:
-            if track_id in self.track_id_to_idx:
-                input_indices.append(self.track_id_to_idx[track_id])
-
-        if not input_indices:
-            # Fallback: return most popular tracks
-            return self.df.nlargest(n_recommendations, 'popularity')['track_id'].tolist()
+    def _load_ivf_index(self, dataset_path, cache_dir, n_lists):
+        """Train the IVF index, or load it from its own snapshot family"""
+        def build():
+            return IVFIndex(self.feature_matrix, n_lists=n_lists)
+
+        if cache_dir is None:
+            return build()
+
+        config = {
+            'feature_cols': self.feature_cols, 'feature_dtype': self.feature_dtype,
+            'n_lists': n_lists, 'n_iter': 10, 'seed': 0,
+        }
+        _, arrays = load_or_build(
+            'ivf_recommender_claude',
+            dataset_path,
+            config,
+            lambda: (pd.DataFrame(), build().to_arrays()),
+            cache_dir
+        )
+        return IVFIndex.from_arrays(
+            arrays['centroids'], arrays['offsets'], arrays['rows'], arrays['vectors']
+        )
 
+    def playlist_profile(self, input_indices):
+        """Unit-norm mean feature vector of the input tracks, shape (1, n_features)"""
         # Create aggregate feature vector from input tracks (using mean)
         input_features = self.feature_matrix[input_indices]
         target_profile = np.mean(input_features, axis=0).reshape(1, -1)
@@ -108,51 +372,134 @@ class Recommender:
         profile_norm = np.linalg.norm(target_profile)
         if profile_norm > 0:
             target_profile = target_profile / profile_norm
+        return target_profile
 
-        # Find candidate tracks using KNN
-        # Use more candidates to ensure target_artist songs are in the pool
-        n_candidates = min(max(n_recommendations * 20, 1000), len(self.df))
-        distances, indices = self.knn_model.kneighbors(target_profile, n_neighbors=n_candidates)
-
-        candidate_indices = indices[0]
-        base_similarities = 1 - distances[0]  # Convert cosine distances to similarities
-
-        # Get genres from input tracks
-        input_genres = set(self.df.iloc[input_indices]['track_genre'].values)
-
-        # Calculate final scores with various boosts
-        scores = []
-        for idx, base_sim in zip(candidate_indices, base_similarities):
-            # Skip if it's an input track
-            if idx in input_indices:
-                continue
+    def nearest_candidates(self, target_profile, n_candidates):
+        """
+        Candidate tracks closest to a unit-norm profile by cosine distance
 
-            track_row = self.df.iloc[idx]
-            score = base_sim
+        Returns:
+            (candidate_indices, similarities) most similar first
+        """
+        if self.ivf_index is not None:
+            distances, indices = self.ivf_index.search(target_profile.reshape(-1), n_candidates, self.nprobe)
+            return indices, 1 - distances
 
-            # Artist boost: if track is by a target artist, boost significantly
-            if target_artist:
-                artist_overlap = track_row['artist_set'].intersection(target_artist)
-                if artist_overlap:
-                    score *= 1.5  # 50% boost for target artists
+        if self.knn_model is None:
+            self._fit_knn()
+        distances, indices = self.knn_model.kneighbors(target_profile.reshape(1, -1), n_neighbors=n_candidates)
+        return indices[0], 1 - distances[0]
 
-            # Genre matching: boost if genre matches input tracks
-            if track_row['track_genre'] in input_genres:
-                score *= 1.1  # 10% boost for genre match
+    def _rerank(self, candidate_indices, base_similarities, input_indices, n_recommendations, target_artist):
+        """
+        Boost the candidate similarities and return the top rows, best first
 
-            # Popularity boost (slight preference for popular tracks)
-            score *= (1 + 0.1 * track_row['popularity_score'])
+        Boosts are applied in the same order as a per-candidate loop would, so
+        scores are bit-identical; ties keep the neighbour search order.
+        """
+        candidates = candidate_indices
+        scores = np.array(base_similarities, dtype=np.float64)
+
+        # Artist boost: if track is by a target artist, boost significantly
+        if target_artist:
+            by_target_artist = np.isin(candidates, self.artist_index.rows_for(target_artist))
+            scores[by_target_artist] *= 1.5  # 50% boost for target artists
+
+        # Genre matching: boost if genre matches input tracks
+        input_genres = np.unique(self.genre_codes[input_indices])
+        scores[np.isin(self.genre_codes[candidates], input_genres)] *= 1.1  # 10% boost for genre match
+
+        # Popularity boost (slight preference for popular tracks)
+        scores *= (1 + 0.1 * self.popularity_scores[candidates])
+
+        # Highest scores first, skipping input tracks; ties by candidate position
+        not_input = ~np.isin(candidates, input_indices)
+        return candidates[top_k(scores, n_recommendations, allow=not_input)]
+
+    @staticmethod
+    def _restore_scaler(stats, n_samples):
+        """Rebuild a fitted single-column StandardScaler from (mean, variance)"""
+        scaler = StandardScaler()
+        scaler.mean_ = np.array([stats[0]])
+        scaler.var_ = np.array([stats[1]])
+        scaler.scale_ = np.sqrt(scaler.var_)
+        scaler.n_features_in_ = 1
+        scaler.n_samples_seen_ = n_samples
+        return scaler
 
-            scores.append((idx, score))
+    def get_recommendations(self, input_track_ids: list[str], n_recommendations: int, target_artist: set[str]) -> list[str]:
+        """
+        Get recommendations based on multiple input songs
 
-        # Sort by score and get top N
-        scores.sort(key=lambda x: x[1], reverse=True)
-        top_indices = [idx for idx, _ in scores[:n_recommendations]]
+        Args:
+            input_track_ids: List of track IDs to base recommendations on
+            n_recommendations: Integer specifying how many songs to recommend
+            target_artist: A set of artist names. This is a hint of which artists were removed from the playlist. You may use this set to recommend songs.
 
-        # Convert indices back to track IDs
-        recommended_track_ids = [self.idx_to_track_id[idx] for idx in top_indices]
+        Returns:
+            List of recommended track IDs of length n_recommendations
+            The list should be ordered by relevance (most relevant first)
+        """
+        self._refresh_features()
+        cache = self.result_cache
+        if cache is None:
+            return self._recommend(input_track_ids, n_recommendations, target_artist)[0]
+
+        # The candidate pool size, the IVF probe count and the fallback seed change the ranking too
+        n_candidates = max(n_recommendations * 20, 1000)
+        nprobe = self.nprobe if self.ivf_index is not None else None
+        key = cache.make_key(input_track_ids, target_artist, n_candidates, nprobe, self.fallback_seed)
+        ranking = cache.get(key, n_recommendations)
+        if ranking is not None:
+            self.instrumentation.count("cache_hits")
+            return ranking
+
+        ranking, sliceable = self._recommend(input_track_ids, n_recommendations, target_artist)
+        cache.put(key, n_recommendations, ranking, sliceable)
+        return ranking
+
+    def _recommend(self, input_track_ids, n_recommendations, target_artist):
+        # (ranking, whether its first m items are the ranking for m recommendations)
+        instrumentation = self.instrumentation
+        instrumentation.count("queries")
+
+        with instrumentation.stage("profile"):
+            # Get indices of input tracks
+            # Known input tracks, repeats and order kept
+            rows = self.track_ids.find(input_track_ids)
+            input_indices = rows[rows >= 0].tolist()
+
+            if input_indices:
+                target_profile = self.playlist_profile(input_indices)
 
-        return recommended_track_ids
+        if not input_indices:
+            # Fallback: most popular tracks of the target artists, then of the catalog
+            instrumentation.count("fallback")
+            with instrumentation.stage("fallback"):
+                rows = self.fallback_tiers.recommend(
+                    n_recommendations, artists=target_artist or (), seed=self.fallback_seed
+                )
+                # A seeded sample for n tracks depends on n
+                return self.track_ids.lookup(rows), self.fallback_seed is None
+
+        with instrumentation.stage("knn"):
+            # Find candidate tracks using KNN
+            # Use more candidates to ensure target_artist songs are in the pool
+            n_candidates = min(max(n_recommendations * 20, 1000), len(self.df))
+            candidate_indices, base_similarities = self.nearest_candidates(target_profile, n_candidates)
+
+        instrumentation.observe("candidate_pool", len(candidate_indices))
+
+        with instrumentation.stage("rerank"):
+            top_indices = self._rerank(
+                candidate_indices, base_similarities, input_indices, n_recommendations, target_artist
+            )
+
+        with instrumentation.stage("lookup"):
+            # Convert indices back to track IDs
+            recommended_track_ids = self.track_ids.lookup(top_indices)
+
+        return recommended_track_ids, True
 
 # Only run evaluation when this file is executed directly
 if __name__ == "__main__":
@@ -0,0 +1,116 @@
+"""
+Bounded LRU cache of recommendation results
+
+Recommenders hold result_cache = None by default. Assign a ResultCache to
+serve repeated queries from memory:
+
+    recommender.result_cache = ResultCache(max_entries=100_000, max_bytes=256 << 20)
+    recommender.get_recommendations(track_ids, 5, {"Artist"})
+    print(recommender.result_cache.stats())
+
+Keys keep the input track order (playlist profiles are order-sensitive). A
+ranking cached for n recommendations also answers any smaller n by slicing,
+unless it was stored with sliceable=False (e.g. a seeded fallback sample, which
+depends on n): then it only answers n itself.
+"""
+
+import sys
+from collections import OrderedDict
+
+# Approximate per-entry bookkeeping: OrderedDict slot, entry tuple, key tuple
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 << 20) -> None:
+        """
+        Args:
+            max_entries: Entries kept at most; least recently used are evicted first
+            max_bytes: Approximate memory budget of keys and rankings
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # key -> (n_recommendations, ranking, size in bytes, sliceable)
+        self._entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(input_track_ids, target_artist, *extra) -> tuple:
+        """Ordered input tracks + target artist set (+ anything else the ranking depends on)"""
+        return (tuple(input_track_ids), frozenset(target_artist or ()), *extra)
+
+    def get(self, key: tuple, n_recommendations: int) -> list | None:
+        """Cached ranking for key cut to n_recommendations, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None or not _answers(entry, n_recommendations):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return list(entry[1][:n_recommendations])
+
+    def put(self, key: tuple, n_recommendations: int, ranking: list, sliceable: bool = True) -> None:
+        """
+        Store a ranking unless the cached one already answers n_recommendations
+
+        Args:
+            sliceable: False if the first m items are not the ranking for m < n_recommendations
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if _answers(entry, n_recommendations):
+                return
+            self.bytes -= entry[2]
+
+        ranking = tuple(ranking)
+        size = _size_of(key) + _size_of(ranking) + _ENTRY_OVERHEAD_BYTES
+        self._entries[key] = (n_recommendations, ranking, size, sliceable)
+        self._entries.move_to_end(key)
+        self.bytes += size
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self) -> None:
+        """Drop every entry, e.g. after the catalog changed"""
+        self._entries.clear()
+        self.bytes = 0
+        self.invalidations += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def _answers(entry, n_recommendations) -> bool:
+    n_cached, _, _, sliceable = entry
+    return n_cached >= n_recommendations if sliceable else n_cached == n_recommendations
+
+
+def _size_of(value) -> int:
+    """Approximate deep size of a tuple of strings / frozensets of strings"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, frozenset)):
+        size += sum(_size_of(item) for item in value)
+    return size
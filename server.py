@@ -0,0 +1,495 @@
+"""
+Asyncio recommendation server with request micro-batching
+
+Concurrent requests are gathered over a short window and dispatched as one
+batch to the recommender on a worker thread, so the event loop keeps
+accepting connections while a batch is scored.
+
+    python server.py --port 8000 --batch-window-ms 5
+
+Several server processes can share one memory-mapped catalog (see
+shared_catalog); publishing again swaps every server to the new version:
+
+    python server.py --shared-catalog /srv/catalog --dataset dataset.csv --publish
+    python server.py --shared-catalog /srv/catalog --port 8001
+
+Endpoints (HTTP/1.1, JSON, keep-alive):
+    POST /recommend  {"track_ids": [...], "n_recommendations": 5, "target_artists": [...]}
+                     -> {"track_ids": [...]}
+    GET  /metrics    -> latency/throughput/batching statistics
+    GET  /health     -> {"status": "ok"}
+
+Malformed request -> 400, body over MAX_BODY_BYTES -> 413 (not read), request or
+header line over the stream limit -> 431; the connection is closed after these.
+Full queue -> 503, request not answered within the timeout -> 504.
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from instrumentation import LATENCY_BOUNDS_MS, SIZE_BOUNDS, Histogram
+from result_cache import ResultCache
+
+MAX_BODY_BYTES = 1 << 20
+
+# After an error that closes the connection, input still arriving is read and
+# dropped for up to this long / this many bytes so the response is not lost to a reset
+LINGER_S = 1.0
+LINGER_BYTES = MAX_BODY_BYTES
+
+_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class QueueFullError(Exception):
+    """Raised when the request queue is at capacity (backpressure)"""
+
+
+class BadRequestError(ValueError):
+    """Raised for a request that cannot be parsed (answered with status)"""
+
+    status = 400
+
+
+class PayloadTooLargeError(BadRequestError):
+    """Raised for a body over MAX_BODY_BYTES; the body is not read"""
+
+    status = 413
+
+
+class HeaderTooLargeError(BadRequestError):
+    """Raised for a request or header line over the stream's line limit"""
+
+    status = 431
+
+
+class _Request:
+    __slots__ = ("input_track_ids", "n_recommendations", "target_artist", "future", "received")
+
+    def __init__(self, input_track_ids, n_recommendations, target_artist, future):
+        self.input_track_ids = list(input_track_ids)
+        self.n_recommendations = int(n_recommendations)
+        self.target_artist = set(target_artist)
+        self.future = future
+        self.received = perf_counter()
+
+
+class RecommendationServer:
+    def __init__(
+        self,
+        recommender,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        batch_window_ms: float = 5.0,
+        max_batch_size: int = 64,
+        max_queue_size: int = 1024,
+        request_timeout_s: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            recommender: Object with get_recommendations, and optionally
+                         get_recommendations_batch (used when present)
+            host, port: Listen address
+            batch_window_ms: How long the first request of a batch waits for others
+            max_batch_size: Requests per batch at most
+            max_queue_size: Pending requests before new ones are rejected with 503
+            request_timeout_s: Time a request may wait for its result before a 504
+        """
+        self.recommender = recommender
+        self.host = host
+        self.port = port
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.request_timeout_s = request_timeout_s
+
+        self._queue_size = max_queue_size
+        self._queue: asyncio.Queue | None = None
+        # One worker thread: the recommenders are not thread-safe
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recommender")
+        self._server: asyncio.base_events.Server | None = None
+        self._batcher: asyncio.Task | None = None
+
+        self.started = perf_counter()
+        self.counters = {
+            "requests": 0, "completed": 0, "rejected": 0,
+            "timeouts": 0, "errors": 0, "batches": 0,
+        }
+        self.latency_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.queue_wait_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.batch_ms = Histogram(LATENCY_BOUNDS_MS)
+        self.batch_size = Histogram(SIZE_BOUNDS)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._batcher = asyncio.create_task(self._run_batcher())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        # Report the real port when bound to port 0
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started = perf_counter()
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def recommend(self, input_track_ids, n_recommendations, target_artist) -> list[str]:
+        """
+        Queue one request for the next batch and wait for its result
+
+        Raises:
+            QueueFullError: The queue is at capacity
+            asyncio.TimeoutError: No result within request_timeout_s
+        """
+        self.counters["requests"] += 1
+        request = _Request(
+            input_track_ids, n_recommendations, target_artist,
+            asyncio.get_running_loop().create_future(),
+        )
+        try:
+            self._queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            raise QueueFullError from None
+
+        try:
+            result = await asyncio.wait_for(request.future, self.request_timeout_s)
+        except asyncio.TimeoutError:
+            # The batcher skips cancelled futures still in the queue
+            self.counters["timeouts"] += 1
+            raise
+
+        self.counters["completed"] += 1
+        self.latency_ms.add((perf_counter() - request.received) * 1e3)
+        return result
+
+    def metrics(self) -> dict:
+        uptime = perf_counter() - self.started
+        metrics = {
+            "uptime_s": uptime,
+            "throughput_rps": self.counters["completed"] / uptime if uptime > 0 else 0.0,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "counters": dict(self.counters),
+            "latency_ms": self.latency_ms.to_dict(),
+            "queue_wait_ms": self.queue_wait_ms.to_dict(),
+            "batch_ms": self.batch_ms.to_dict(),
+            "batch_size": self.batch_size.to_dict(),
+        }
+        cache = getattr(self.recommender, "result_cache", None)
+        if cache is not None:
+            metrics["result_cache"] = cache.stats()
+        return metrics
+
+    async def _run_batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window_s
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Drop requests that timed out while queued
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+
+            dispatched = perf_counter()
+            for request in batch:
+                self.queue_wait_ms.add((dispatched - request.received) * 1e3)
+
+            results = await loop.run_in_executor(self._executor, self._score_batch, batch)
+
+            self.counters["batches"] += 1
+            self.batch_size.add(len(batch))
+            self.batch_ms.add((perf_counter() - dispatched) * 1e3)
+            for request, result in zip(batch, results):
+                if request.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.counters["errors"] += 1
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+    def _score_batch(self, batch) -> list:
+        """Score a batch on the worker thread; failed requests get their exception"""
+        get_batch = getattr(self.recommender, "get_recommendations_batch", None)
+        if get_batch is None:
+            return [self._score_one(request) for request in batch]
+
+        # The batch API takes a single n; group requests by it
+        results = [None] * len(batch)
+        by_n: dict[int, list[int]] = {}
+        for i, request in enumerate(batch):
+            by_n.setdefault(request.n_recommendations, []).append(i)
+
+        for n, members in by_n.items():
+            try:
+                scored = get_batch(
+                    [batch[i].input_track_ids for i in members],
+                    n,
+                    [batch[i].target_artist for i in members],
+                )
+            except Exception:
+                # Retry one by one so a bad request does not fail its batch mates
+                scored = [self._score_one(batch[i]) for i in members]
+            for i, result in zip(members, scored):
+                results[i] = result
+        return results
+
+    def _score_one(self, request):
+        try:
+            return self.recommender.get_recommendations(
+                request.input_track_ids, request.n_recommendations, request.target_artist
+            )
+        except Exception as error:
+            return error
+
+    async def _handle_connection(self, reader, writer) -> None:
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, path, body, keep_alive = request
+                status, payload = await self._route(method, path, body)
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except BadRequestError as error:
+            # The rest of the stream cannot be parsed (or is not read): answer and close
+            _write_response(writer, error.status, {"error": f"invalid request: {error}"}, False)
+            await writer.drain()
+            await _linger(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body) -> tuple[int, dict]:
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/metrics":
+            return 200, self.metrics()
+        if path != "/recommend":
+            return 404, {"error": f"unknown path {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+
+        try:
+            track_ids, n_recommendations, target_artists = _parse_query(body)
+        except BadRequestError as error:
+            return 400, {"error": f"invalid request: {error}"}
+
+        try:
+            result = await self.recommend(track_ids, n_recommendations, target_artists)
+        except QueueFullError:
+            return 503, {"error": "server busy"}
+        except asyncio.TimeoutError:
+            return 504, {"error": "timed out"}
+        except Exception as error:
+            return 500, {"error": str(error)}
+        return 200, {"track_ids": result}
+
+
+async def _read_request(reader):
+    """
+    Parse one HTTP/1.1 request; returns None on a closed connection
+
+    Raises:
+        BadRequestError: The request cannot be parsed; the connection must be closed
+    """
+    request_line = await _read_line(reader)
+    if not request_line:
+        return None
+    try:
+        method, path, version = request_line.decode("latin-1").split()
+    except ValueError:
+        return None
+
+    headers = {}
+    while True:
+        line = await _read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequestError("Content-Length is not an integer") from None
+    if length < 0:
+        raise BadRequestError("negative Content-Length")
+    if length > MAX_BODY_BYTES:
+        # Not read: the connection is closed after the 413
+        raise PayloadTooLargeError(f"body of {length} bytes, the limit is {MAX_BODY_BYTES}")
+    body = await reader.readexactly(length) if length else b""
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    return method, path.split("?", 1)[0], body, keep_alive
+
+
+async def _linger(reader, writer):
+    # Closing a socket with unread input resets the connection, which can drop
+    # the response before the client reads it: send EOF, then discard (never buffer)
+    # what the client still sends, within LINGER_S and LINGER_BYTES
+    async def discard():
+        remaining = LINGER_BYTES
+        while remaining > 0:
+            chunk = await reader.read(min(remaining, 1 << 16))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+
+    writer.write_eof()
+    try:
+        await asyncio.wait_for(discard(), LINGER_S)
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+
+
+async def _read_line(reader):
+    try:
+        return await reader.readline()
+    except ValueError:
+        # StreamReader.readline: the line is longer than the reader's limit
+        raise HeaderTooLargeError("request or header line too long") from None
+
+
+def _parse_query(body):
+    """
+    Validate a /recommend body
+
+    Returns:
+        (track_ids, n_recommendations, target_artists)
+
+    Raises:
+        BadRequestError: Not JSON, or a field is missing or has the wrong type
+    """
+    try:
+        query = json.loads(body)
+    except ValueError as error:
+        raise BadRequestError(f"body is not JSON ({error})") from None
+    if not isinstance(query, dict):
+        raise BadRequestError("body must be a JSON object")
+    if "track_ids" not in query:
+        raise BadRequestError("missing track_ids")
+
+    track_ids = query["track_ids"]
+    n_recommendations = query.get("n_recommendations", 5)
+    target_artists = query.get("target_artists", [])
+    if not _is_string_list(track_ids):
+        raise BadRequestError("track_ids must be a list of strings")
+    if not _is_string_list(target_artists):
+        raise BadRequestError("target_artists must be a list of strings")
+    # bool is an int subclass: reject true/false too
+    if type(n_recommendations) is not int or n_recommendations <= 0:
+        raise BadRequestError("n_recommendations must be a positive integer")
+    return track_ids, n_recommendations, target_artists
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _write_response(writer, status, payload, keep_alive) -> None:
+    body = json.dumps(payload).encode()
+    headers = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recommendations over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--recommender", choices=["recommender", "recommender_claude"],
+                        default="recommender")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--shared-catalog", metavar="DIR",
+                        help="attach to the catalog published in DIR (recommender only)")
+    parser.add_argument("--publish", action="store_true",
+                        help="publish --dataset to --shared-catalog for the workers and exit")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--max-queue-size", type=int, default=1024)
+    parser.add_argument("--request-timeout", type=float, default=5.0, help="seconds")
+    parser.add_argument("--result-cache-mb", type=float, default=0,
+                        help="LRU result cache budget, 0 disables it")
+    args = parser.parse_args()
+    if args.shared_catalog and args.recommender != "recommender":
+        parser.error("--shared-catalog needs --recommender recommender")
+    if args.publish and not args.shared_catalog:
+        parser.error("--publish needs --shared-catalog")
+
+    if args.recommender == "recommender":
+        from recommender import Recommender
+    else:
+        from recommender_claude import Recommender
+
+    if args.publish:
+        version = Recommender.publish_catalog(args.shared_catalog, args.dataset)
+        print(f"Published {version} to {args.shared_catalog}")
+        return
+
+    if args.shared_catalog:
+        recommender = Recommender(shared_catalog_dir=args.shared_catalog)
+    else:
+        recommender = Recommender(args.dataset)
+    if args.result_cache_mb > 0:
+        recommender.result_cache = ResultCache(
+            max_entries=1 << 30, max_bytes=int(args.result_cache_mb * (1 << 20))
+        )
+
+    server = RecommendationServer(
+        recommender,
+        host=args.host,
+        port=args.port,
+        batch_window_ms=args.batch_window_ms,
+        max_batch_size=args.max_batch_size,
+        max_queue_size=args.max_queue_size,
+        request_timeout_s=args.request_timeout,
+    )
+
+    async def run():
+        await server.start()
+        print(f"Serving on http://{server.host}:{server.port}")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
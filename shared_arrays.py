@@ -0,0 +1,106 @@
+"""
+Share NumPy arrays between processes through shared memory
+Objects are pickled with their large arrays replaced by shared memory handles,
+so worker processes attach to the catalog instead of receiving a copy of it
+"""
+
+import io
+import pickle
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Arrays smaller than this are pickled inline
+MIN_SHARED_BYTES = 1 << 16
+
+
+class SharedArrayPool:
+    """
+    Owner of the shared memory segments created while pickling objects
+
+    Use as a context manager; segments are unlinked on exit, after the
+    worker processes that attached to them are done.
+    """
+
+    def __init__(self, min_bytes: int = MIN_SHARED_BYTES) -> None:
+        self.min_bytes = min_bytes
+        self._segments: list[shared_memory.SharedMemory] = []
+        # id(array) -> handle, so an array reachable twice is shared once
+        self._handles: dict[int, tuple] = {}
+        # Keep shared arrays alive so their ids are not reused while pickling
+        self._arrays: list[np.ndarray] = []
+
+    def dumps(self, obj) -> bytes:
+        """Pickle obj, moving every large numeric array into shared memory"""
+        buffer = io.BytesIO()
+        _SharingPickler(buffer, self).dump(obj)
+        return buffer.getvalue()
+
+    def share(self, array: np.ndarray) -> tuple:
+        """Copy an array into a new segment and return its handle"""
+        handle = self._handles.get(id(array))
+        if handle is not None:
+            return handle
+
+        segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+        shared[...] = array
+
+        handle = (segment.name, array.shape, array.dtype.str)
+        self._segments.append(segment)
+        self._handles[id(array)] = handle
+        self._arrays.append(array)
+        return handle
+
+    def close(self) -> None:
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+        self._segments.clear()
+        self._handles.clear()
+        self._arrays.clear()
+
+    def __enter__(self) -> "SharedArrayPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# Segments attached by this process; they must outlive the arrays viewing them
+_attached: list[shared_memory.SharedMemory] = []
+
+
+def loads(data: bytes):
+    """Unpickle data produced by SharedArrayPool.dumps, attaching read-only views"""
+    return _AttachingUnpickler(io.BytesIO(data)).load()
+
+
+class _SharingPickler(pickle.Pickler):
+    def __init__(self, file, pool: SharedArrayPool) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.pool = pool
+
+    def persistent_id(self, obj):
+        if (
+            isinstance(obj, np.ndarray)
+            and obj.dtype.kind in "biuf"
+            and obj.nbytes >= self.pool.min_bytes
+        ):
+            return ("shared_array",) + self.pool.share(obj)
+        return None
+
+
+class _AttachingUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        tag, name, shape, dtype = pid
+        if tag != "shared_array":
+            raise pickle.UnpicklingError(f"Unknown persistent id {tag!r}")
+
+        # The creating process owns the segment; do not let this one unlink it
+        segment = shared_memory.SharedMemory(name=name, track=False)
+        _attached.append(segment)
+
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+        array.flags.writeable = False
+        return array
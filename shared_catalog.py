@@ -0,0 +1,109 @@
+"""
+Catalog shared by recommender worker processes through memory-mapped files
+
+One builder process publishes a catalog version: a catalog_cache snapshot
+(read-only .npy arrays: feature matrix, track ID table, artist postings, ...).
+Workers attach to the current version without reading the CSV; its arrays are
+memory-mapped, so every worker on the host shares one copy in the page cache.
+A version is only made current once it is completely written, by atomically
+replacing a small pointer file; attached workers switch on their next check.
+
+    catalog/
+        recommender.current                 "recommender-3f9c1e0a7b2d4c65"
+        recommender-3f9c1e0a7b2d4c65/       current version
+        recommender-91d0b7c2e4a65f38/       previous version, kept for late readers
+
+    publish("catalog", "recommender", "dataset.csv", config, build)   # builder
+    version, path = attach("catalog", "recommender")                   # workers
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Callable
+
+from catalog_cache import ensure_snapshot
+from lazy_import import lazy_import
+
+shutil = lazy_import("shutil")
+
+# Versions of a family kept on disk, including the current one
+KEEP_VERSIONS = 2
+
+
+def publish(
+    catalog_dir: str,
+    name: str,
+    csv_path: str,
+    config: dict,
+    build: Callable,
+    keep_versions: int = KEEP_VERSIONS,
+) -> str:
+    """
+    Write a catalog version (unless already present) and make it current
+
+    Args:
+        catalog_dir: Directory shared by the builder and the workers
+        name: Catalog family, e.g. "recommender"
+        csv_path, config, build: As for catalog_cache.ensure_snapshot
+        keep_versions: Versions of the family left on disk; older ones are
+                       deleted (mappings held by workers stay valid)
+
+    Returns:
+        Name of the published version
+    """
+    path = ensure_snapshot(name, csv_path, config, build, catalog_dir, remove_stale=False)
+    version = os.path.basename(path)
+
+    # Readers see either the old or the new pointer, never a partial one
+    pointer = _pointer_path(catalog_dir, name)
+    tmp_pointer = f"{pointer}.tmp-{os.getpid()}"
+    with open(tmp_pointer, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer)
+
+    _remove_old_versions(catalog_dir, name, version, keep_versions)
+    return version
+
+
+def current_version(catalog_dir: str, name: str) -> str | None:
+    """Name of the current version of a family, None if nothing was published"""
+    try:
+        with open(_pointer_path(catalog_dir, name)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def attach(catalog_dir: str, name: str) -> tuple[str, str]:
+    """
+    Locate the current version of a family
+
+    Returns:
+        (version, snapshot path); load it with catalog_cache.load_arrays/load_frame
+
+    Raises:
+        FileNotFoundError: Nothing was published for this family
+    """
+    version = current_version(catalog_dir, name)
+    if version is None:
+        raise FileNotFoundError(f"No {name!r} catalog published in {catalog_dir!r}")
+    return version, os.path.join(catalog_dir, version)
+
+
+def _pointer_path(catalog_dir, name):
+    return os.path.join(catalog_dir, f"{name}.current")
+
+
+def _remove_old_versions(catalog_dir, name, current, keep_versions):
+    """Delete all but the newest keep_versions versions; never the current one"""
+    versions = [
+        entry for entry in os.listdir(catalog_dir)
+        if entry.startswith(f"{name}-") and ".tmp-" not in entry and entry != current
+        and os.path.isdir(os.path.join(catalog_dir, entry))
+    ]
+    versions.sort(key=lambda entry: os.path.getmtime(os.path.join(catalog_dir, entry)), reverse=True)
+    for entry in versions[max(keep_versions - 1, 0):]:
+        shutil.rmtree(os.path.join(catalog_dir, entry), ignore_errors=True)
@@ -0,0 +1,118 @@
+"""
+Array-backed string <-> row id table
+Replaces a dict of Python strings (plus its inverse) with two flat arrays
+
+Layout:
+    data:  (n,) fixed-width UTF-8 bytes array, data[row] is the string of row
+    order: (n,) rows sorted by their string, for binary search
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+class StringTable:
+    def __init__(self, values: Iterable[str] = ()) -> None:
+        """
+        Args:
+            values: Distinct strings; row i holds the i-th one
+        """
+        self.data = _encode(values)
+        self.order = np.argsort(self.data, kind="stable")
+
+    @classmethod
+    def from_arrays(cls, data: np.ndarray, order: np.ndarray) -> "StringTable":
+        """Rebuild a table from its data/order arrays (e.g. a snapshot)"""
+        table = cls.__new__(cls)
+        table.data = data
+        table.order = order
+        return table
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.lookup(np.arange(len(self.data))))
+
+    def __contains__(self, value: str) -> bool:
+        return self.get(value) is not None
+
+    def __getitem__(self, value: str) -> int:
+        row = self.get(value)
+        if row is None:
+            raise KeyError(value)
+        return row
+
+    def get(self, value: str, default=None):
+        """Row of value, or default if absent"""
+        key = value.encode()
+        # Longer keys would be truncated to the column width and could match wrongly
+        if not self.data.size or len(key) > self.data.itemsize:
+            return default
+        position = np.searchsorted(self.data, key, sorter=self.order)
+        if position < len(self.order) and self.data[self.order[position]] == key:
+            return int(self.order[position])
+        return default
+
+    def find(self, values: Iterable[str]) -> np.ndarray:
+        """Rows of many values at once, -1 for absent ones, in input order"""
+        keys = [value.encode() for value in values]
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if not keys or not self.data.size:
+            return rows
+
+        fits = np.fromiter((len(key) <= self.data.itemsize for key in keys), dtype=bool, count=len(keys))
+        keys = np.array([key for key, ok in zip(keys, fits) if ok], dtype=self.data.dtype)
+        positions = np.minimum(
+            np.searchsorted(self.data, keys, sorter=self.order), len(self.order) - 1
+        )
+        candidates = self.order[positions]
+        found = self.data[candidates] == keys
+
+        fitting_rows = np.full(len(keys), -1, dtype=np.int64)
+        fitting_rows[found] = candidates[found]
+        rows[fits] = fitting_rows
+        return rows
+
+    def lookup(self, rows) -> list[str]:
+        """Strings of the given rows"""
+        return [value.decode() for value in self.data[rows].tolist()]
+
+    def append(self, values: Iterable[str]) -> None:
+        """Add strings as rows len(self), len(self) + 1, ... (must not be present yet)"""
+        new_data = _encode(values)
+        if not new_data.size:
+            return
+
+        data = np.concatenate([self.data, new_data]) if self.data.size else new_data
+        # Merge the new sorted rows into the existing order
+        new_order = np.argsort(new_data, kind="stable")
+        positions = np.searchsorted(self.data, new_data[new_order], sorter=self.order)
+        self.order = np.insert(self.order, positions, new_order + len(self.data))
+        self.data = data
+
+    def remove_rows(self, rows) -> None:
+        """Drop rows and renumber the remaining ones to stay contiguous"""
+        keep = np.ones(len(self.data), dtype=bool)
+        keep[np.asarray(rows, dtype=np.int64)] = False
+        new_row = np.cumsum(keep) - 1
+
+        self.order = new_row[self.order[keep[self.order]]]
+        self.data = self.data[keep]
+
+
+def _encode(values):
+    values = values.to_numpy(dtype=object) if hasattr(values, "to_numpy") else np.fromiter(values, dtype=object)
+    if not len(values):
+        return np.empty(0, dtype="S1")
+    # Width of the longest string; numpy strips trailing NUL bytes, which ids never have
+    try:
+        # One cast for ASCII strings (track ids, most names)
+        return values.astype(bytes)
+    except UnicodeEncodeError:
+        return np.array([value.encode() for value in values.tolist()], dtype=bytes)
@@ -0,0 +1,66 @@
+"""
+Catalog snapshots sharing one cache directory
+
+    python -m unittest test_catalog_cache
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from benchmarks.synthetic import make_catalog
+from recommender import Recommender
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+class SharedCacheDirTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmp.name, "cache")
+        self.dataset_path = os.path.join(self.tmp.name, "dataset.csv")
+        make_catalog(500, self.dataset_path, seed=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def snapshots(self):
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_other_config_keeps_live_snapshot(self):
+        first = quiet(Recommender, self.dataset_path, cache_dir=self.cache_dir, lazy=True).warm_up()
+        quiet(Recommender, self.dataset_path, cache_dir=self.cache_dir, feature_dtype="float64")
+        self.assertEqual(len(self.snapshots()), 2)
+
+        # Catalog updates of the first instance load its DataFrame from its snapshot
+        track_id = first.track_ids.lookup([0])[0]
+        self.assertEqual(first.remove_tracks([track_id]), 1)
+        self.assertNotIn(track_id, set(first.df["track_id"]))
+
+    def test_other_dataset_keeps_live_snapshot(self):
+        other_path = os.path.join(self.tmp.name, "other.csv")
+        make_catalog(300, other_path, seed=1)
+        first = quiet(Recommender, self.dataset_path, cache_dir=self.cache_dir, lazy=True).warm_up()
+        quiet(Recommender, other_path, cache_dir=self.cache_dir)
+        self.assertEqual(len(self.snapshots()), 2)
+        self.assertEqual(len(first.df), 500)
+
+    def test_changed_csv_replaces_snapshot(self):
+        quiet(Recommender, self.dataset_path, cache_dir=self.cache_dir)
+        before = self.snapshots()
+        make_catalog(400, self.dataset_path, seed=2)
+        recommender = quiet(Recommender, self.dataset_path, cache_dir=self.cache_dir)
+        after = self.snapshots()
+
+        self.assertEqual(len(after), 1)
+        self.assertNotEqual(before, after)
+        self.assertEqual(len(recommender.track_ids), 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
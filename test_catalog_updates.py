@@ -0,0 +1,131 @@
+"""
+Catalog updates of recommender_claude against a rebuild from the updated CSV
+
+    python -m unittest test_catalog_updates
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+import recommender_claude
+from artist_index import ArtistIndex
+from benchmarks.synthetic import make_catalog
+from fallback_tiers import FallbackTiers
+
+
+def quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+class FallbackTiersUpdateTest(unittest.TestCase):
+    def test_updates_match_rebuild(self):
+        rng = np.random.default_rng(0)
+
+        def artist_lists(n_rows):
+            return [[f"A{a}" for a in rng.choice(30, rng.integers(1, 3), replace=False)] for _ in range(n_rows)]
+
+        popularity = rng.integers(0, 5, 50).astype(float)
+        genre_codes = rng.integers(-1, 6, 50)
+        artist_index = ArtistIndex(artist_lists(50))
+        tiers = FallbackTiers(popularity, genre_codes, artist_index)
+
+        for step in range(30):
+            if step % 3 == 0:
+                new_codes = rng.integers(-1, 8, 6)
+                popularity = np.concatenate([popularity, rng.integers(0, 5, 6)])
+                genre_codes = np.concatenate([genre_codes, new_codes])
+                artist_index.add_rows(artist_lists(6))
+                tiers.add_rows(popularity, new_codes)
+            elif step % 3 == 1:
+                rows = rng.choice(len(popularity), 8, replace=False)
+                new_codes = rng.integers(-1, 8, 8)
+                popularity[rows] = rng.integers(0, 5, 8)
+                genre_codes[rows] = new_codes
+                artist_index.set_rows(rows, artist_lists(8))
+                tiers.set_rows(rows, popularity, new_codes)
+            else:
+                rows = rng.choice(len(popularity), 4, replace=False)
+                keep = np.ones(len(popularity), dtype=bool)
+                keep[rows] = False
+                popularity, genre_codes = popularity[keep], genre_codes[keep]
+                artist_index.remove_rows(rows)
+                tiers.remove_rows(rows)
+
+            rebuilt = FallbackTiers(popularity, genre_codes, artist_index).to_arrays()
+            for name, array in tiers.to_arrays().items():
+                np.testing.assert_array_equal(array, rebuilt[name], err_msg=f"{name} after step {step}")
+
+
+class RecommenderUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "dataset.csv")
+        make_catalog(1500, path, seed=0)
+        self.tracks = recommender_claude.Recommender._clean_tracks(pd.read_csv(path))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, tracks):
+        path = os.path.join(self.tmp.name, "updated.csv")
+        tracks.to_csv(path, index=False)
+        return path
+
+    def check_updates(self, **kwargs):
+        tracks = self.tracks
+        added = tracks.iloc[1200:].copy()
+        added.loc[added.index[:5], "track_genre"] = "new-genre"
+        recommender = quiet(recommender_claude.Recommender, self.write(tracks.iloc[:1200]), cache_dir=None, **kwargs)
+
+        recommender.add_tracks(added)
+        tracks = pd.concat([tracks.iloc[:1200], added], ignore_index=True)
+        # Every track of a genre, then one of them again
+        removed = list(tracks.loc[tracks["track_genre"] == tracks["track_genre"][0], "track_id"]) + ["missing"]
+        returning = tracks[tracks["track_id"] == removed[0]]
+        recommender.remove_tracks(removed)
+        tracks = tracks[~tracks["track_id"].isin(removed)]
+        recommender.add_tracks(returning)
+        tracks = pd.concat([tracks, returning], ignore_index=True)
+        updated = tracks.iloc[100:130].copy()
+        updated["popularity"] = 50
+        updated["track_genre"] = "new-genre"
+        updated["artists"] = "Artist 1;Someone New"
+        recommender.update_tracks(updated)
+        tracks.iloc[100:130] = updated
+
+        rebuilt = quiet(recommender_claude.Recommender, self.write(tracks), cache_dir=None, **kwargs)
+        recommender.fallback_seed = rebuilt.fallback_seed = 3
+        if recommender.ivf_index is not None:
+            recommender._refresh_features()
+            # Same lists for the same centroids
+            rebuilt.ivf_index = recommender_claude.IVFIndex.from_centroids(
+                recommender.ivf_index.centroids, rebuilt.feature_matrix
+            )
+
+        rng = np.random.default_rng(1)
+        for i in range(30):
+            playlist = list(rng.choice(tracks["track_id"], 5)) if i % 5 else ["missing"]
+            artists = {f"Artist {rng.integers(50)}", "Someone New"} if i % 2 else set()
+            self.assertEqual(
+                recommender.get_recommendations(playlist, 10, artists),
+                rebuilt.get_recommendations(playlist, 10, artists),
+            )
+        return recommender
+
+    def test_brute(self):
+        self.check_updates()
+
+    def test_ivf_skips_knn_refit(self):
+        recommender = self.check_updates(candidate_index="ivf", n_lists=8)
+        self.assertIsNone(recommender.knn_model)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Batch recommendations on a small synthetic catalog
+
+    python -m unittest test_recommender
+"""
+
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import warnings
+
+from benchmarks.synthetic import make_catalog
+from playlist_session import PlaylistSession
+from recommender import Recommender
+from result_cache import ResultCache
+
+
+class BatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset_path = os.path.join(tmp, "dataset.csv")
+            make_catalog(2000, dataset_path, seed=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                cls.recommender = Recommender(dataset_path, cache_dir=None)
+        cls.track_ids = cls.recommender.track_ids.lookup(range(0, 2000, 97))
+
+    def test_batch_with_empty_playlist_does_not_warn(self):
+        playlists = [self.track_ids[:5], [], self.track_ids[5:8], ["unknown-track"], []]
+        artists = [set(), {"Artist 1"}, set(), set(), set()]
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            batch = self.recommender.get_recommendations_batch(playlists, 5, artists)
+
+        expected = [
+            self.recommender.get_recommendations(playlist, 5, target_artist)
+            for playlist, target_artist in zip(playlists, artists)
+        ]
+        self.assertEqual(batch, expected)
+        self.assertTrue(all(len(result) == 5 for result in batch))
+
+
+class SeededFallbackCacheTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as tmp:
+            dataset_path = os.path.join(tmp, "dataset.csv")
+            make_catalog(500, dataset_path, seed=0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                cls.recommender = Recommender(dataset_path, cache_dir=None)
+
+    def setUp(self):
+        self.recommender.fallback_seed = 7
+        self.recommender.result_cache = None
+        self.playlist = ["unknown-track"]
+        self.artists = {"Artist 1"}
+        self.expected = {
+            n: self.recommender.get_recommendations(self.playlist, n, self.artists) for n in (5, 10)
+        }
+        # A seeded sample of 5 tracks is not the first 5 of a sample of 10
+        self.assertNotEqual(self.expected[5], self.expected[10][:5])
+        self.recommender.result_cache = ResultCache()
+
+    def tearDown(self):
+        self.recommender.fallback_seed = None
+        self.recommender.result_cache = None
+
+    def test_single(self):
+        for n in (10, 5, 10):
+            self.assertEqual(self.recommender.get_recommendations(self.playlist, n, self.artists), self.expected[n])
+
+    def test_batch(self):
+        for n in (10, 5):
+            batch = self.recommender.get_recommendations_batch([self.playlist], n, [self.artists])
+            self.assertEqual(batch, [self.expected[n]])
+
+    def test_session(self):
+        session = PlaylistSession(self.recommender, self.playlist)
+        for n in (10, 5):
+            self.assertEqual(session.get_recommendations(n, self.artists), self.expected[n])
+
+    def test_seed_change(self):
+        self.recommender.get_recommendations(self.playlist, 5, self.artists)
+        self.recommender.fallback_seed = 8
+        self.assertEqual(
+            self.recommender.get_recommendations(self.playlist, 5, self.artists),
+            self._uncached(5),
+        )
+
+    def _uncached(self, n):
+        cache, self.recommender.result_cache = self.recommender.result_cache, None
+        try:
+            return self.recommender.get_recommendations(self.playlist, n, self.artists)
+        finally:
+            self.recommender.result_cache = cache
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Request validation of the recommendation server
+
+    python -m unittest test_server
+"""
+
+import asyncio
+import json
+import unittest
+
+from server import RecommendationServer
+
+
+class EchoRecommender:
+    """Returns the first n input tracks"""
+
+    def get_recommendations(self, input_track_ids, n_recommendations, target_artist):
+        return input_track_ids[:n_recommendations]
+
+
+class BadInputTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = RecommendationServer(EchoRecommender(), port=0, batch_window_ms=0)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def send(self, body, content_length=None, headers="Connection: close\r\n"):
+        """One POST /recommend on a fresh connection; returns (status, payload, response headers)"""
+        if isinstance(body, str):
+            body = body.encode()
+        if content_length is None:
+            content_length = len(body)
+        reader, writer = await asyncio.open_connection(self.server.host, self.server.port)
+        writer.write(
+            f"POST /recommend HTTP/1.1\r\nContent-Length: {content_length}\r\n{headers}\r\n".encode() + body
+        )
+        await writer.drain()
+        # Read until the server closes the connection
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(payload), head.decode().lower()
+
+    async def test_valid_request(self):
+        status, payload, _ = await self.send(json.dumps({"track_ids": ["a", "b", "c"], "n_recommendations": 2}))
+        self.assertEqual((status, payload), (200, {"track_ids": ["a", "b"]}))
+
+    async def test_bad_bodies_get_400(self):
+        bodies = [
+            "not json",
+            "[1, 2]",
+            "5",
+            "null",
+            "{}",
+            '{"track_ids": 5}',
+            '{"track_ids": "abc"}',
+            '{"track_ids": [1, 2]}',
+            '{"track_ids": ["a"], "target_artists": 5}',
+            '{"track_ids": ["a"], "target_artists": [null]}',
+            '{"track_ids": ["a"], "n_recommendations": "x"}',
+            '{"track_ids": ["a"], "n_recommendations": 0}',
+            '{"track_ids": ["a"], "n_recommendations": -3}',
+            '{"track_ids": ["a"], "n_recommendations": 2.5}',
+            '{"track_ids": ["a"], "n_recommendations": true}',
+            b"\xff\xfe",
+        ]
+        for body in bodies:
+            with self.subTest(body=body):
+                status, payload, _ = await self.send(body)
+                self.assertEqual(status, 400)
+                self.assertIn("invalid request", payload["error"])
+        self.assertEqual(self.server.counters["requests"], 0)
+
+    async def test_bad_content_length_gets_400(self):
+        for content_length in ["abc", "-1"]:
+            with self.subTest(content_length=content_length):
+                status, _, _ = await self.send("", content_length=content_length)
+                self.assertEqual(status, 400)
+
+    async def test_large_body_gets_413_without_being_read(self):
+        # Keep-alive is requested, yet the connection is closed: the body is never read
+        status, _, headers = await self.send("", content_length=10_000_000_000, headers="")
+        self.assertEqual(status, 413)
+        self.assertIn("connection: close", headers)
+
+    async def test_long_lines_get_431(self):
+        long_value = "x" * (1 << 17)
+        for headers in [f"X-Long: {long_value}\r\n", f"X-Long: {long_value}\r\nConnection: close\r\n"]:
+            with self.subTest(length=len(headers)):
+                status, _, headers = await self.send("", headers=headers)
+                self.assertEqual(status, 431)
+                self.assertIn("connection: close", headers)
+
+    async def test_server_keeps_serving_after_bad_requests(self):
+        await self.send("[1, 2]")
+        await self.send("", content_length="abc")
+        await self.send("", content_length=10_000_000_000)
+        await self.send("", headers="X-Long: " + "x" * (1 << 17) + "\r\n")
+        status, payload, _ = await self.send(json.dumps({"track_ids": ["a"]}))
+        self.assertEqual((status, payload), (200, {"track_ids": ["a"]}))
+
+
+if __name__ == "__main__":
+    unittest.main()
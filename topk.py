@@ -0,0 +1,131 @@
+"""
+Exact top-k selection shared by the recommenders, the baseline and weighted_knn
+
+All functions select with argpartition instead of sorting every score, and
+order the result stably: best score first, ties broken by the lowest index.
+
+    top_k(scores, k, exclude=input_rows, allow=artist_mask)
+
+StreamingTopK gives the same result over score blocks, so the full score
+vector of a large catalog never has to exist:
+
+    selection = StreamingTopK(k, exclude=input_rows)
+    for start in range(0, n_rows, block_rows):
+        selection.push(score_block(start), start, allow=artist_mask[start:start + block_rows])
+    indices, scores = selection.result()
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from lazy_import import lazy_import
+
+np = lazy_import("numpy")
+
+
+def smallest_k(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest values, ascending, ties broken by index"""
+    k = min(k, len(values))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    if k < len(values):
+        # Everything below the k-th value, then the lowest-index ties at it
+        kth_value = values[np.argpartition(values, k - 1)[k - 1]]
+        below = np.flatnonzero(values < kth_value)
+        ties = np.flatnonzero(values == kth_value)[:k - len(below)]
+        candidates = np.concatenate([below, ties])
+    else:
+        candidates = np.arange(len(values))
+
+    # lexsort sorts by the last key first
+    order = np.lexsort((candidates, values[candidates]))
+    return candidates[order]
+
+
+def top_k(
+    scores: np.ndarray,
+    k: int,
+    exclude: Iterable[int] = (),
+    allow: np.ndarray | None = None,
+    largest: bool = True,
+) -> np.ndarray:
+    """
+    Indices of the k best scores, best first, ties broken by the lowest index
+
+    Args:
+        scores: (n,) scores
+        k: Number of indices; fewer are returned if fewer are eligible
+        exclude: Indices that must not be returned (e.g. the input tracks)
+        allow: Optional (n,) boolean mask; only True positions are eligible
+        largest: True if higher scores are better, False for distances
+
+    Returns:
+        (min(k, n_eligible),) int array of indices into scores
+    """
+    values = -np.asarray(scores) if largest else np.asarray(scores)
+    eligible = _eligible(len(values), 0, exclude, allow)
+    if eligible is None:
+        return smallest_k(values, k)
+
+    positions = np.flatnonzero(eligible)
+    return positions[smallest_k(values[positions], k)]
+
+
+class StreamingTopK:
+    def __init__(self, k: int, exclude: Iterable[int] = (), largest: bool = True) -> None:
+        """
+        Running top-k over consecutive score blocks; same result as top_k on
+        the concatenated scores
+
+        Args:
+            k: Number of indices to keep
+            exclude: Global indices that must not be returned
+            largest: True if higher scores are better, False for distances
+        """
+        self.k = k
+        self.largest = largest
+        self.exclude = np.unique(np.fromiter(exclude, dtype=np.int64))
+        self._indices = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0, dtype=np.float64)
+
+    def push(self, scores: np.ndarray, start: int, allow: np.ndarray | None = None) -> None:
+        """
+        Add the scores of indices start, start + 1, ..., start + len(scores) - 1
+
+        Args:
+            scores: Score block
+            start: Global index of scores[0]
+            allow: Optional boolean mask of the block; only True positions are eligible
+        """
+        values = -np.asarray(scores) if self.largest else np.asarray(scores)
+        eligible = _eligible(len(values), start, self.exclude, allow)
+        if eligible is None:
+            positions = smallest_k(values, self.k)
+        else:
+            positions = np.flatnonzero(eligible)
+            positions = positions[smallest_k(values[positions], self.k)]
+
+        indices = np.concatenate([self._indices, positions + start])
+        values = np.concatenate([self._values, values[positions]])
+        keep = np.lexsort((indices, values))[:self.k]
+        self._indices = indices[keep]
+        self._values = values[keep]
+
+    def result(self) -> tuple[np.ndarray, np.ndarray]:
+        """(indices, scores) of the best scores pushed so far, best first"""
+        return self._indices, -self._values if self.largest else self._values
+
+
+def _eligible(n, start, exclude, allow):
+    # Boolean mask of the block [start, start + n), or None if every index is eligible
+    if not isinstance(exclude, np.ndarray):
+        exclude = np.fromiter(exclude, dtype=np.int64)
+    exclude = exclude[(exclude >= start) & (exclude < start + n)]
+
+    if allow is None and not len(exclude):
+        return None
+    eligible = np.ones(n, dtype=bool) if allow is None else np.array(allow, dtype=bool)
+    eligible[exclude - start] = False
+    return eligible
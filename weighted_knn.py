@@ -3,8 +3,13 @@ Weighted K-Nearest Neighbors implementation
 Allows different features to have different importance weights
 """
 
-import pandas as pd
-import numpy as np
+from __future__ import annotations
+
+from lazy_import import lazy_import
+from topk import smallest_k, top_k
+
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
 
 
 def weighted_knn(
@@ -55,11 +60,11 @@ def weighted_knn(
     distances = weighted_euclidean_distance(
         feature_matrix,
         target_features,
-        weight_matrix
+        _shared_weights(weight_matrix)
     )
 
     # Get indices of top N closest songs (smallest distances)
-    top_indices = np.argsort(distances)[:n_recommendations]
+    top_indices = top_k(distances, n_recommendations, largest=False)
 
     return top_indices.tolist()
 
@@ -67,7 +72,9 @@ def weighted_knn(
 def weighted_euclidean_distance(
     feature_matrix: np.ndarray,
     target_features: np.ndarray,
-    weight_matrix: np.ndarray
+    weight_matrix: np.ndarray,
+    out: np.ndarray | None = None,
+    chunk_rows: int | None = None
 ) -> np.ndarray:
     """
     Calculate weighted Euclidean distance between target and all candidates
@@ -75,10 +82,14 @@ def weighted_euclidean_distance(
     Args:
         feature_matrix: (N_candidates, N_features) array of candidate features
         target_features: (N_features,) array of target features
-        weight_matrix: (N_candidates, N_features) array of feature weights
+        weight_matrix: (N_candidates, N_features) array of feature weights, or
+                       (N_features,) / (1, N_features) weights shared by all candidates
+        out: Optional (N_candidates,) array the distances are written to
+        chunk_rows: Candidates per chunk, default CHUNK_BYTES worth of rows
 
     Returns:
-        (N_candidates,) array of weighted distances
+        (N_candidates,) array of weighted distances, in the result dtype of the
+        inputs (float32 inputs give float32 distances)
 
     Formula:
         d_i = sqrt(Σ_j w_ij * (f_ij - t_j)^2)
@@ -88,30 +99,60 @@ def weighted_euclidean_distance(
         - w_ij = weight for feature j of candidate i
         - f_ij = feature j value of candidate i
         - t_j = target feature j value
+
+    Candidates are processed in cache-sized chunks through reused buffers, so
+    no (N_candidates, N_features) temporary is allocated. Every element goes
+    through the same operations as in the whole-matrix expression, so the
+    distances are equal to it up to rounding (row sums may be added in a
+    different order than numpy's reduction).
     """
+    feature_matrix = np.asarray(feature_matrix)
+    return _euclidean_distance(
+        feature_matrix, target_features, weight_matrix, out, chunk_rows, _sums_sequentially(feature_matrix)
+    )
 
-    # Compute differences: (N_candidates, N_features)
-    differences = feature_matrix - target_features
 
-    # Square differences: (N_candidates, N_features)
-    squared_differences = differences ** 2
+def weighted_euclidean_topk(
+    feature_matrix: np.ndarray,
+    target_features: np.ndarray,
+    feature_weights: np.ndarray,
+    k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Find the k candidates closest to the target under a weighted Euclidean distance
 
-    # Apply weights: (N_candidates, N_features)
-    weighted_squared_differences = weight_matrix * squared_differences
+    Fit-free replacement for building a NearestNeighbors model per query:
+    distances are computed once over the candidate block and the top k are
+    selected with argpartition.
+
+    Args:
+        feature_matrix: (N_candidates, N_features) array of candidate features
+        target_features: (N_features,) array of target features
+        feature_weights: (N_features,) weights shared by all candidates
+        k: Number of neighbours; capped at N_candidates
+
+    Returns:
+        (distances, indices) of the min(k, N_candidates) nearest candidates,
+        closest first, ties broken by candidate index
+    """
 
-    # Sum across features: (N_candidates,)
-    sum_weighted_squared = np.sum(weighted_squared_differences, axis=1)
+    distances = weighted_euclidean_distance(
+        feature_matrix,
+        np.asarray(target_features, dtype=np.float64),
+        np.asarray(feature_weights, dtype=np.float64)
+    )
 
-    # Take square root: (N_candidates,)
-    distances = np.sqrt(sum_weighted_squared)
+    indices = smallest_k(distances, k)
 
-    return distances
+    return distances[indices], indices
 
 
 def weighted_cosine_similarity(
     feature_matrix: np.ndarray,
     target_features: np.ndarray,
-    weight_matrix: np.ndarray
+    weight_matrix: np.ndarray,
+    out: np.ndarray | None = None,
+    chunk_rows: int | None = None
 ) -> np.ndarray:
     """
     Calculate weighted cosine similarity between target and all candidates
@@ -119,34 +160,25 @@ def weighted_cosine_similarity(
     Args:
         feature_matrix: (N_candidates, N_features) array of candidate features
         target_features: (N_features,) array of target features
-        weight_matrix: (N_candidates, N_features) array of feature weights
+        weight_matrix: (N_candidates, N_features) array of feature weights, or
+                       (N_features,) / (1, N_features) weights shared by all candidates
+        out: Optional (N_candidates,) array the similarities are written to
+        chunk_rows: Candidates per chunk, default CHUNK_BYTES worth of rows
 
     Returns:
         (N_candidates,) array of weighted cosine similarities (higher = more similar)
 
     Formula:
         sim_i = (Σ_j w_ij * f_ij * t_j) / (||w*f|| * ||w*t||)
-    """
-
-    # Apply weights to features
-    weighted_features = weight_matrix * feature_matrix  # (N_candidates, N_features)
-    weighted_target = weight_matrix * target_features   # (N_candidates, N_features)
-
-    # Compute dot products: (N_candidates,)
-    dot_products = np.sum(weighted_features * weighted_target, axis=1)
 
-    # Compute norms
-    feature_norms = np.linalg.norm(weighted_features, axis=1)  # (N_candidates,)
-    target_norms = np.linalg.norm(weighted_target, axis=1)     # (N_candidates,)
-
-    # Avoid division by zero
-    norms_product = feature_norms * target_norms
-    norms_product = np.where(norms_product == 0, 1e-10, norms_product)
-
-    # Compute similarities
-    similarities = dot_products / norms_product
-
-    return similarities
+    Works in chunks like weighted_euclidean_distance and gives the results of
+    the whole-matrix expression up to rounding. With shared weights the weighted
+    target and its norm are computed once instead of once per candidate.
+    """
+    feature_matrix = np.asarray(feature_matrix)
+    return _cosine_similarity(
+        feature_matrix, target_features, weight_matrix, out, chunk_rows, _sums_sequentially(feature_matrix)
+    )
 
 
 def weighted_knn_cosine(
@@ -185,15 +217,331 @@ def weighted_knn_cosine(
     similarities = weighted_cosine_similarity(
         feature_matrix,
         target_features,
-        weight_matrix
+        _shared_weights(weight_matrix)
     )
 
     # Get indices of top N most similar songs (highest similarities)
-    top_indices = np.argsort(similarities)[::-1][:n_recommendations]
+    top_indices = top_k(similarities, n_recommendations)
 
     return top_indices.tolist()
 
 
+def weighted_knn_batch(
+    feature_matrix: np.ndarray,
+    target_matrix: np.ndarray,
+    weight_matrix: np.ndarray,
+    n_recommendations: int,
+    metric: str = "euclidean",
+    memory_budget_bytes: int | None = None
+) -> list[list[int]]:
+    """
+    Weighted K-Nearest Neighbors for many targets at once
+
+    Args:
+        feature_matrix: (N_candidates, N_features) array of candidate features
+        target_matrix: (N_queries, N_features) array, one target per query
+        weight_matrix: (N_queries, N_features) array, one weight vector per query,
+                       or (N_features,) weights shared by all queries
+        n_recommendations: Number of candidates per query
+        metric: 'euclidean' (weighted_euclidean_distance, smallest first) or
+                'cosine' (weighted_cosine_similarity, largest first)
+        memory_budget_bytes: Bound on the score tiles and their scratch
+                             buffers, default BATCH_MEMORY_BYTES
+
+    Returns:
+        One list of candidate indices per query, best first. Query q gets
+        the same list as top_k over weighted_euclidean_distance(feature_matrix,
+        target_matrix[q], weight_matrix[q]) (or the cosine similarity), i.e. the
+        same as weighted_knn / weighted_knn_cosine on a DataFrame whose feature
+        columns' .values is feature_matrix, with weight columns equal to
+        weight_matrix[q].
+
+    Scores of a (queries x candidates) tile come from matrix products
+    (BLAS): the weighted squared distance is expanded to
+        Σ_j w_j f_ij^2 - 2 Σ_j w_j t_j f_ij + Σ_j w_j t_j^2
+    and the weighted cosine to
+        Σ_j w_j^2 t_j f_ij / (sqrt(Σ_j w_j^2 f_ij^2) * ||w*t||)
+    The expanded forms round differently from the per-query kernels, so they
+    only shortlist: every candidate within a rounding error bound of the k-th
+    best tile score is rescored with the per-query kernel, and the final
+    ranking is taken from those exact scores. Queries whose shortlist would not
+    fit (e.g. many duplicate candidates at the cut) are scored in full.
+    """
+    if metric not in ("euclidean", "cosine"):
+        raise ValueError(f"metric must be 'euclidean' or 'cosine', got {metric!r}")
+    feature_matrix = np.asarray(feature_matrix)
+    target_matrix = np.atleast_2d(np.asarray(target_matrix))
+    weight_matrix = np.broadcast_to(np.asarray(weight_matrix), target_matrix.shape)
+    n_candidates, n_features = feature_matrix.shape
+    n_queries = len(target_matrix)
+    k = min(n_recommendations, n_candidates)
+    if k <= 0:
+        return [[] for _ in range(n_queries)]
+    if memory_budget_bytes is None:
+        memory_budget_bytes = BATCH_MEMORY_BYTES
+
+    cosine = metric == "cosine"
+    dtype = np.result_type(feature_matrix, target_matrix, weight_matrix)
+    weights = weight_matrix.astype(dtype)
+    targets = target_matrix.astype(dtype)
+    if cosine:
+        squared_weights = weights * weights
+        # Σ_j w_j^2 t_j f_ij and Σ_j w_j^2 f_ij^2 come from [f, f^2] @ query_terms.T
+        query_terms = np.concatenate([squared_weights * targets, squared_weights], axis=1)
+        target_norms = np.sqrt(np.sum((weights * targets) ** 2, axis=1))
+    else:
+        # Σ_j w_j f_ij^2 - 2 Σ_j w_j t_j f_ij; Σ_j w_j t_j^2 is the same for all candidates
+        query_terms = np.concatenate([weights, -2 * weights * targets], axis=1)
+
+    # Per query, the n_shortlist smallest tile values (negated similarities for cosine)
+    n_shortlist = min(n_candidates, 2 * k + SHORTLIST_SLACK)
+    best_values = np.full((n_queries, n_shortlist), np.inf, dtype=dtype)
+    best_indices = np.zeros((n_queries, n_shortlist), dtype=np.intp)
+    max_abs_features = np.zeros(n_features, dtype=dtype)
+
+    query_rows = min(n_queries, BATCH_QUERY_ROWS)
+    itemsize = np.dtype(dtype).itemsize
+    # Per candidate row: its [f, f^2] terms; per query: tile values (dots and norms
+    # for cosine), argpartition indices and two masks
+    tile_bytes_per_candidate = 2 * n_features * itemsize + query_rows * (
+        (2 if cosine else 1) * itemsize + np.dtype(np.intp).itemsize + 2
+    )
+    candidate_rows = max(memory_budget_bytes // tile_bytes_per_candidate, n_shortlist, 1)
+    candidate_rows = min(candidate_rows, n_candidates)
+    candidate_terms = np.empty((candidate_rows, 2 * n_features), dtype=dtype)
+    tile = np.empty((query_rows, candidate_rows), dtype=dtype)
+    if cosine:
+        tile_norms = np.empty_like(tile)
+
+    for start, stop in _chunks(n_candidates, candidate_rows):
+        m = stop - start
+        block = feature_matrix[start:stop]
+        terms = candidate_terms[:m]
+        # [f, f^2] for cosine, [f^2, f] for euclidean
+        features, squares = (terms[:, :n_features], terms[:, n_features:]) if cosine else \
+            (terms[:, n_features:], terms[:, :n_features])
+        features[:] = block
+        np.square(features, out=squares)
+        np.maximum(max_abs_features, np.abs(features).max(axis=0), out=max_abs_features)
+
+        for q_start, q_stop in _chunks(n_queries, query_rows):
+            values = tile[:q_stop - q_start, :m]
+            if cosine:
+                norms = tile_norms[:q_stop - q_start, :m]
+                np.matmul(query_terms[q_start:q_stop, :n_features], features.T, out=values)
+                np.matmul(query_terms[q_start:q_stop, n_features:], squares.T, out=norms)
+                np.sqrt(norms, out=norms)
+                norms *= target_norms[q_start:q_stop, None]
+                norms[norms == 0] = 1e-10
+                np.divide(values, norms, out=values)
+                np.negative(values, out=values)
+            else:
+                np.matmul(query_terms[q_start:q_stop], terms.T, out=values)
+            _merge_shortlists(best_values[q_start:q_stop], best_indices[q_start:q_stop], values, start)
+
+    # Bound on |tile value - exact score| (both rounding errors plus the final sqrt)
+    relative_error = 4 * (2 * n_features + 8) * np.finfo(dtype).eps
+    if cosine:
+        error_bounds = np.full(n_queries, relative_error)
+    else:
+        error_bounds = relative_error * np.sum(np.abs(weights) * (max_abs_features + np.abs(targets)) ** 2, axis=1)
+
+    kernel = _cosine_similarity if cosine else _euclidean_distance
+    sequential = _sums_sequentially(feature_matrix)
+    recommendations = []
+    for q in range(n_queries):
+        values = best_values[q]
+        threshold = np.partition(values, k - 1)[k - 1] + 2 * error_bounds[q]
+        if n_shortlist < n_candidates and values.max() <= threshold:
+            # Candidates within the bound may have been left out; score them all
+            scores = kernel(feature_matrix, target_matrix[q], weight_matrix[q], None, None, sequential)
+            recommendations.append(top_k(scores, k, largest=cosine).tolist())
+            continue
+
+        shortlist = np.sort(best_indices[q][values <= threshold])
+        scores = kernel(feature_matrix[shortlist], target_matrix[q], weight_matrix[q], None, None, sequential)
+        recommendations.append(shortlist[top_k(scores, k, largest=cosine)].tolist())
+
+    return recommendations
+
+
+# Bytes of candidate rows per chunk: small enough to stay in the L2 cache
+CHUNK_BYTES = 1 << 18
+
+# weighted_knn_batch: default bound on the score tiles, queries per tile and
+# shortlist entries kept per query beyond 2 * n_recommendations
+BATCH_MEMORY_BYTES = 64 << 20
+BATCH_QUERY_ROWS = 256
+SHORTLIST_SLACK = 16
+
+
+def _euclidean_distance(feature_matrix, target_features, weight_matrix, out, chunk_rows, sequential):
+    """weighted_euclidean_distance with the row summation order given by sequential"""
+    target_features = np.asarray(target_features)
+    weights, shared = _weights(weight_matrix)
+    # Same intermediate dtypes as the whole-matrix expression
+    difference_dtype = np.result_type(feature_matrix, target_features)
+    dtype = np.result_type(weights, difference_dtype)
+    if dtype == difference_dtype:
+        (differences,) = _chunk_buffers(feature_matrix, [dtype], chunk_rows, sequential)
+        weighted = differences
+    else:
+        differences, weighted = _chunk_buffers(feature_matrix, [difference_dtype, dtype], chunk_rows, sequential)
+    if out is None:
+        out = np.empty(len(feature_matrix), dtype=dtype)
+
+    for start, stop in _chunks(len(feature_matrix), len(differences)):
+        m = stop - start
+        np.subtract(feature_matrix[start:stop], target_features, out=differences[:m])
+        np.square(differences[:m], out=differences[:m])
+        np.multiply(weights if shared else weights[start:stop], differences[:m], out=weighted[:m])
+        _row_sums(weighted[:m], out[start:stop], sequential)
+
+    return np.sqrt(out, out=out)
+
+
+def _cosine_similarity(feature_matrix, target_features, weight_matrix, out, chunk_rows, sequential):
+    """weighted_cosine_similarity with the row summation order given by sequential"""
+    target_features = np.asarray(target_features)
+    weights, shared = _weights(weight_matrix)
+    # Same intermediate dtypes as the whole-matrix expression
+    feature_dtype = np.result_type(weights, feature_matrix)
+    target_dtype = np.result_type(weights, target_features)
+    dtype = np.result_type(feature_dtype, target_dtype)
+    weighted, products = _chunk_buffers(feature_matrix, [feature_dtype, dtype], chunk_rows, sequential)
+    if out is None:
+        out = np.empty(len(feature_matrix), dtype=dtype)
+    # ||w*f||, ||w*t|| and their product per candidate of a chunk
+    feature_norms = np.empty(len(weighted), dtype=feature_dtype)
+    target_norms = np.empty(len(weighted), dtype=target_dtype)
+    norms = np.empty(len(weighted), dtype=dtype)
+
+    if shared:
+        weighted_target = weights * target_features
+        _row_norms_in_place(weighted_target.reshape(1, -1).copy(), target_norms[:1], sequential)
+        target_norms[1:] = target_norms[0]
+    else:
+        (targets,) = _chunk_buffers(feature_matrix, [target_dtype], len(weighted), sequential)
+
+    for start, stop in _chunks(len(feature_matrix), len(weighted)):
+        m = stop - start
+        if not shared:
+            weighted_target = np.multiply(weights[start:stop], target_features, out=targets[:m])
+        np.multiply(weights if shared else weights[start:stop], feature_matrix[start:stop], out=weighted[:m])
+
+        # Dot products: (N_candidates,)
+        np.multiply(weighted[:m], weighted_target, out=products[:m])
+        dots = _row_sums(products[:m], out[start:stop], sequential)
+
+        # Norms; squares overwrite the weighted rows, which are not needed anymore
+        _row_norms_in_place(weighted[:m], feature_norms[:m], sequential)
+        if not shared:
+            _row_norms_in_place(targets[:m], target_norms[:m], sequential)
+        np.multiply(feature_norms[:m], target_norms[:m], out=norms[:m])
+
+        # Avoid division by zero
+        norms[:m][norms[:m] == 0] = 1e-10
+
+        np.divide(dots, norms[:m], out=dots)
+
+    return out
+
+
+def _merge_shortlists(best_values, best_indices, values, start):
+    """
+    Merge a (queries, candidates) tile of values into each query's shortlist
+    of smallest values; candidate i of the tile has index start + i
+    """
+    n_queries, n_shortlist = best_values.shape
+    n_rows = values.shape[1]
+    # Only values below a query's current worst entry can enter its shortlist
+    bounds = best_values.max(axis=1)
+    entering = values < bounds[:, None]
+    n_entering = np.count_nonzero(entering)
+    if not n_entering:
+        return
+    if n_entering > 4 * best_values.size and n_rows > n_shortlist:
+        # First tiles: the n_shortlist smallest of every query row
+        columns = np.argpartition(values, n_shortlist - 1, axis=1)[:, :n_shortlist]
+        rows = np.repeat(np.arange(n_queries), n_shortlist)
+        columns = columns.ravel()
+    else:
+        rows, columns = np.divmod(np.flatnonzero(entering), n_rows)
+
+    rows = np.concatenate([np.repeat(np.arange(n_queries), n_shortlist), rows])
+    merged_values = np.concatenate([best_values.ravel(), values[rows[best_values.size:], columns]])
+    merged_indices = np.concatenate([best_indices.ravel(), columns + start])
+
+    # Group by query, smallest values first, and keep the first n_shortlist of each group
+    order = np.lexsort((merged_values, rows))
+    group_starts = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_queries))[:-1]])
+    keep = order[(group_starts[:, None] + np.arange(n_shortlist)).ravel()]
+    best_values[:] = merged_values[keep].reshape(n_queries, n_shortlist)
+    best_indices[:] = merged_indices[keep].reshape(n_queries, n_shortlist)
+
+
+def _weights(weight_matrix):
+    """(weights, shared): shared weights are returned as one (N_features,) vector"""
+    weights = np.asarray(weight_matrix)
+    if weights.ndim == 2 and len(weights) == 1:
+        weights = weights[0]
+    return weights, weights.ndim == 1
+
+
+def _shared_weights(weight_matrix):
+    """First row of weight_matrix if every candidate has the same weights (fast path), else weight_matrix"""
+    if len(weight_matrix) and all(np.all(column == column[0]) for column in weight_matrix.T):
+        return weight_matrix[:1]
+    return weight_matrix
+
+
+def _sums_sequentially(feature_matrix):
+    """
+    True if the row sums should be added column after column
+
+    Temporaries take the memory order of feature_matrix. numpy sums the rows
+    of a row-major matrix pairwise and usually those of a column-major one
+    (e.g. .values of a DataFrame) column after column; the chunked kernels
+    follow that to stay close to the whole-matrix expressions. numpy does not
+    guarantee its reduction order, so results are only equal up to rounding.
+    """
+    n_candidates, n_features = feature_matrix.shape
+    return n_candidates > 1 and n_features > 1 and feature_matrix.strides[0] < feature_matrix.strides[1]
+
+
+def _chunk_buffers(feature_matrix, dtypes, chunk_rows, sequential):
+    """One (chunk_rows, N_features) scratch buffer per dtype"""
+    n_candidates, n_features = feature_matrix.shape
+    if chunk_rows is None:
+        itemsize = max(np.dtype(dtype).itemsize for dtype in dtypes)
+        chunk_rows = CHUNK_BYTES // max(n_features * itemsize, 1)
+    chunk_rows = max(min(chunk_rows, n_candidates), 1)
+
+    # Column-major when summing column after column, so each column is contiguous
+    order = "F" if sequential else "C"
+    return [np.empty((chunk_rows, n_features), dtype=dtype, order=order) for dtype in dtypes]
+
+
+def _chunks(n_rows, chunk_rows):
+    for start in range(0, n_rows, chunk_rows):
+        yield start, min(start + chunk_rows, n_rows)
+
+
+def _row_sums(rows, out, sequential):
+    if not sequential:
+        return np.sum(rows, axis=1, out=out)
+    np.copyto(out, rows[:, 0])
+    for j in range(1, rows.shape[1]):
+        np.add(out, rows[:, j], out=out)
+    return out
+
+
+def _row_norms_in_place(rows, out, sequential):
+    """np.linalg.norm(rows, axis=1) with the same arithmetic; rows are overwritten by their squares"""
+    np.multiply(rows, rows, out=rows)
+    return np.sqrt(_row_sums(rows, out, sequential), out=out)
+
+
 # Example usage and testing
 if __name__ == "__main__":
     # Create sample data